@@ -0,0 +1,310 @@
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from string import Formatter
+
+
+# Разбор значений из сообщений админки: строка -> значение столбца, ValueError при ошибке
+def parse_text(text):
+    return text
+
+
+def parse_int(text):
+    return int(text)
+
+
+def parse_money(text):
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"не число: {text}") from None
+    if not value.is_finite() or value < 0:
+        raise ValueError(f"недопустимая сумма: {text}")
+    return value
+
+
+def parse_date(text):
+    return date.fromisoformat(text)
+
+
+def parse_datetime(text):
+    return datetime.fromisoformat(text)
+
+
+def parse_flag(text):
+    if text not in ("0", "1"):
+        raise ValueError("ожидается 0 или 1")
+    return int(text)
+
+
+def choice(*values):
+    def parse(text):
+        if text not in values:
+            raise ValueError(f"допустимые значения: {', '.join(values)}")
+        return text
+    return parse
+
+
+class Column:
+    __slots__ = ("name", "title", "parse", "nullable", "hint", "placeholder")
+
+    def __init__(self, name, title, parse=parse_text, nullable=False, hint=""):
+        self.name = name
+        self.title = title
+        self.parse = parse
+        self.nullable = nullable
+        self.hint = hint
+        # DATETIME в условиях: параметр округляется до шага 1/300 с, как хранимое
+        # значение из GETDATE(), иначе ключ из списка не найдёт строку (SQL Server)
+        self.placeholder = "CAST(? AS DATETIME)" if parse is parse_datetime else "?"
+
+    def convert(self, text):
+        text = text.strip()
+        if not text:
+            if self.nullable:
+                return None
+            raise ValueError(f"{self.name}: значение обязательно")
+        try:
+            return self.parse(text)
+        except (ValueError, ArithmeticError) as e:
+            raise ValueError(f"{self.name}: {e}") from None
+
+
+# Описание таблицы для админки: столбцы с парсерами, ключ строки, белый список
+# изменяемых столбцов и порядок полей во вводе «через запятую» (add_row — добавление,
+# edit_row — редактирование после ключа). В SQL попадают только имена из описания,
+# значения — всегда параметрами. Текст запроса строится один раз на вид и набор
+# столбцов и дальше берётся из словаря, поэтому любое сочетание полей меняется
+# одним UPDATE. label — подпись строки в списках выбора (поля — столбцы таблицы).
+class Table:
+    def __init__(self, name, slug, title, columns, key, editable, add_row, edit_row, label):
+        self.name = name
+        self.slug = slug
+        self.title = title
+        self.columns = {column.name: column for column in columns}
+        self.key = tuple(key)
+        self.editable = tuple(editable)
+        self.add_row = tuple(add_row)
+        self.edit_row = tuple(edit_row)
+        self.label = label
+        self.label_columns = tuple(dict.fromkeys(
+            field for _, field, _, _ in Formatter().parse(label) if field
+        ))
+        self._statements = {}
+
+    def column(self, name, editable=False):
+        if name not in self.columns or (editable and name not in self.editable):
+            raise ValueError(f"недопустимое поле: {name}")
+        return self.columns[name]
+
+    def describe(self, names):
+        return ", ".join(f"{name}{self.columns[name].hint}" for name in names)
+
+    # Ключ строки
+
+    def parse_key(self, parts):
+        if len(parts) != len(self.key):
+            raise ValueError(f"ожидается ключ: {', '.join(self.key)}")
+        return tuple(self.columns[name].convert(part) for name, part in zip(self.key, parts))
+
+    def encode_key(self, key):
+        # Для callback_data: последний столбец ключа может содержать «_» (URL изображения)
+        return "_".join(value.isoformat() if isinstance(value, (date, datetime)) else str(value) for value in key)
+
+    def decode_key(self, text):
+        return self.parse_key(text.split("_", len(self.key) - 1))
+
+    # Значения из ввода админа
+
+    def parse_row(self, parts, names):
+        # Позиционный ввод; в конце можно опустить необязательные (NULL) поля
+        if len(parts) > len(names) or any(not self.columns[name].nullable for name in names[len(parts):]):
+            raise ValueError(f"ожидается: {self.describe(names)}")
+        return {name: self.columns[name].convert(part) for name, part in zip(names, parts)}
+
+    def parse_assignments(self, parts):
+        values = {}
+        for part in parts:
+            if "=" not in part:
+                raise ValueError(f"неверный формат для обновления: {part}")
+            name, text = part.split("=", 1)
+            name = name.strip()
+            values[name] = self.column(name, editable=True).convert(text)
+        return values
+
+    def parse_edit(self, text):
+        # «ключ, поле=значение, ...» или «ключ, значения edit_row по порядку»
+        parts = [part.strip() for part in text.split(",")]
+        key = self.parse_key(parts[:len(self.key)])
+        rest = parts[len(self.key):]
+        if not rest:
+            raise ValueError("нет полей для обновления")
+        if all("=" in part for part in rest):
+            return key, self.parse_assignments(rest)
+        return key, self.parse_row(rest, self.edit_row)
+
+    def parse_add(self, text):
+        return self.parse_row([part.strip() for part in text.split(",")], self.add_row)
+
+    # Запросы
+
+    def _where(self, names=None):
+        return " AND ".join(f"{name} = {self.columns[name].placeholder}" for name in names or self.key)
+
+    def _ordered(self, names):
+        # Один и тот же набор столбцов — один ключ кэша независимо от порядка ввода
+        return tuple(name for name in self.columns if name in names)
+
+    def statement(self, kind, names=(), returning=None):
+        cache_key = (kind, names, returning)
+        sql = self._statements.get(cache_key)
+        if sql is not None:
+            return sql
+        if kind == "update":
+            sql = f"UPDATE {self.name} SET {', '.join(f'{name} = ?' for name in names)} WHERE {self._where()}"
+        elif kind == "insert":
+            output = f" OUTPUT INSERTED.{returning}" if returning else ""
+            sql = f"INSERT INTO {self.name} ({', '.join(names)}){output} VALUES ({', '.join('?' for _ in names)})"
+        elif kind == "delete":
+            sql = f"DELETE FROM {self.name} WHERE {self._where()}"
+        elif kind == "list":
+            columns = ", ".join(dict.fromkeys(self.key + self.label_columns))
+            where = f" WHERE {self._where(names)}" if names else ""
+            sql = f"SELECT {columns} FROM {self.name}{where} ORDER BY {', '.join(self.key)}"
+        else:
+            raise ValueError(f"неизвестный вид запроса: {kind}")
+        self._statements[cache_key] = sql
+        return sql
+
+    def update(self, cursor, key, values):
+        for name in values:
+            self.column(name, editable=True)
+        names = self._ordered(values)
+        cursor.execute(self.statement("update", names), [values[name] for name in names] + list(key))
+        return cursor.rowcount
+
+    def insert(self, cursor, values, returning=None):
+        names = self._ordered(values)
+        cursor.execute(self.statement("insert", names, returning), [values[name] for name in names])
+        return cursor.fetchone()[0] if returning else cursor.rowcount
+
+    def delete(self, cursor, key):
+        cursor.execute(self.statement("delete"), key)
+        return cursor.rowcount
+
+    def rows(self, cursor, **filters):
+        names = self._ordered(filters)
+        if len(names) != len(filters):
+            raise ValueError(f"недопустимый фильтр: {', '.join(filters)}")
+        cursor.execute(self.statement("list", names), [filters[name] for name in names])
+        return cursor.fetchall()
+
+    def row_label(self, row):
+        return self.label.format(**{name: getattr(row, name) for name in self.label_columns})
+
+    def row_key(self, row):
+        return tuple(getattr(row, name) for name in self.key)
+
+
+USERS = Table(
+    "Users", "user", "Пользователи",
+    columns=[
+        Column("telegram_id", "Telegram ID", parse_int),
+        Column("first_name", "Имя", nullable=True),
+        Column("last_name", "Фамилия", nullable=True),
+        Column("username", "Username", nullable=True),
+        Column("admin", "Администратор", parse_flag, hint="(0 или 1)"),
+    ],
+    key=("telegram_id",),
+    editable=("first_name", "last_name", "username", "admin"),
+    add_row=("telegram_id", "first_name", "last_name", "username", "admin"),
+    edit_row=("admin",),
+    label="{first_name} (ID: {telegram_id})",
+)
+
+ROOMS = Table(
+    "Rooms", "room", "Номера",
+    columns=[
+        Column("room_id", "ID", parse_int),
+        Column("category", "Категория"),
+        Column("description", "Описание", nullable=True),
+        Column("price", "Цена", parse_money),
+        Column("quantity", "Количество", parse_int),
+        Column("status", "Статус"),
+        Column("capacity", "Вместимость", parse_int, nullable=True),
+    ],
+    key=("room_id",),
+    editable=("category", "description", "price", "quantity", "status", "capacity"),
+    add_row=("category", "description", "price", "quantity", "status", "capacity"),
+    edit_row=("category", "description", "price", "quantity", "status", "capacity"),
+    label="ID: {room_id} - {category}",
+)
+
+ROOM_IMAGES = Table(
+    "RoomImages", "image", "Изображения",
+    columns=[
+        Column("room_id", "Room ID", parse_int),
+        Column("image_url", "URL"),
+    ],
+    key=("room_id", "image_url"),
+    editable=("image_url",),
+    add_row=("room_id", "image_url"),
+    edit_row=("image_url",),
+    label="Room ID: {room_id}, URL: {image_url}",
+)
+
+GUESTS = Table(
+    "Guests", "guest", "Гости",
+    columns=[
+        Column("guest_id", "ID", parse_int),
+        Column("room_id", "Room ID", parse_int),
+        Column("telegram_id", "Telegram ID", parse_int),
+        Column("first_name", "Имя"),
+        Column("last_name", "Фамилия"),
+        Column("email", "Email", nullable=True),
+        Column("phone", "Телефон", nullable=True),
+        Column("check_in_date", "Дата заезда", parse_date, hint="(ГГГГ-ММ-ДД)"),
+        Column("check_out_date", "Дата выезда", parse_date, hint="(ГГГГ-ММ-ДД)"),
+        Column("comment", "Комментарий", nullable=True),
+    ],
+    key=("guest_id",),
+    editable=("room_id", "telegram_id", "first_name", "last_name", "email", "phone", "check_in_date", "check_out_date", "comment"),
+    add_row=("room_id", "telegram_id", "first_name", "last_name", "email", "phone", "check_in_date", "check_out_date", "comment"),
+    edit_row=("room_id", "telegram_id", "first_name", "last_name", "email", "phone", "check_in_date", "check_out_date", "comment"),
+    label="ID: {guest_id} - {first_name} {last_name}",
+)
+
+SERVICES = Table(
+    "Services", "service", "Услуги",
+    columns=[
+        Column("service_id", "ID", parse_int),
+        Column("name", "Название"),
+        Column("price", "Цена", parse_money),
+        Column("short_description", "Краткое описание", nullable=True),
+        Column("detailed_description", "Подробное описание", nullable=True),
+        Column("position", "Должность исполнителя", nullable=True),
+    ],
+    key=("service_id",),
+    editable=("name", "price", "short_description", "detailed_description", "position"),
+    add_row=("name", "price", "short_description", "detailed_description", "position"),
+    edit_row=("name", "price", "short_description", "detailed_description", "position"),
+    label="ID: {service_id} - {name}",
+)
+
+GUEST_SERVICES = Table(
+    "GuestServices", "gs", "Заказы услуг",
+    columns=[
+        Column("guest_id", "ID гостя", parse_int),
+        Column("service_id", "ID услуги", parse_int),
+        Column("quantity", "Количество", parse_int),
+        Column("order_date", "Дата заказа", parse_datetime),
+        Column("status", "Статус", choice("pending", "completed", "canceled"), hint="(pending, completed, canceled)"),
+        Column("employee_id", "Исполнитель", parse_int, nullable=True),
+    ],
+    key=("guest_id", "service_id", "order_date"),
+    editable=("quantity", "status"),
+    add_row=("guest_id", "service_id", "quantity", "status"),
+    edit_row=("quantity", "status"),
+    label="Гость: {guest_id}, Услуга: {service_id}, Дата: {order_date}",
+)
+
+TABLES = {table.slug: table for table in (USERS, ROOMS, ROOM_IMAGES, GUESTS, SERVICES, GUEST_SERVICES)}
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import db
+from singleflight import SingleFlight
+
+ZERO = Decimal(0)
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def as_money(value):
+    if value is None:
+        return ZERO
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class CategoryStats:
+    __slots__ = ("category", "free", "outstanding", "bookings", "nights", "revenue", "occupied", "nightly_revenue", "checkouts")
+
+    def __init__(self, category):
+        self.category = category
+        # Свободный остаток Rooms.quantity: бронирование уменьшает его на 1
+        self.free = 0
+        # Брони, которые ещё держат номер (выезд позже сегодняшнего дня)
+        self.outstanding = 0
+        self.bookings = 0
+        self.nights = 0
+        self.revenue = ZERO
+        # Только ночи начиная с сегодняшней: дата -> занятые номера / выручка за ночь
+        self.occupied = {}
+        self.nightly_revenue = {}
+        # Дата выезда -> число броней, которые в этот день освобождают номер
+        self.checkouts = {}
+
+    @property
+    def capacity(self):
+        return self.free + self.outstanding
+
+
+class ServiceStats:
+    __slots__ = ("service_id", "name", "price", "orders", "quantity", "revenue")
+
+    def __init__(self, service_id, name, price):
+        self.service_id = service_id
+        self.name = name
+        self.price = as_money(price)
+        self.orders = 0
+        self.quantity = 0
+        self.revenue = ZERO
+
+
+def category_stats(categories, category):
+    stats = categories.get(category)
+    if stats is None:
+        stats = categories[category] = CategoryStats(category)
+    return stats
+
+
+def add_booking(stats, price, check_in, check_out, today):
+    nights = (check_out - check_in).days
+    stats.bookings += 1
+    stats.nights += nights
+    stats.revenue += price * nights
+    if check_out > today:
+        stats.outstanding += 1
+        stats.checkouts[check_out] = stats.checkouts.get(check_out, 0) + 1
+    day = max(check_in, today)
+    while day < check_out:
+        stats.occupied[day] = stats.occupied.get(day, 0) + 1
+        stats.nightly_revenue[day] = stats.nightly_revenue.get(day, ZERO) + price
+        day += timedelta(days=1)
+
+
+# Живые агрегаты для раздела «Аналитика». Один раз строятся из БД, дальше обновляются
+# на каждом бронировании, заказе и отмене услуги и возврате номеров после выезда,
+# поэтому отчёт не зависит от объёма истории. Правки администратора, эффект которых
+# заранее неизвестен (удаление гостя, смена цены и т.п.), помечают агрегаты
+# устаревшими — они пересоберутся при следующем просмотре. Пересборка из обработчика
+# (refresh) читает историю в потоке через SingleFlight и подменяет агрегаты целиком;
+# до этого остаются прежние. Изменения во время пересборки в неё могли не попасть —
+# тогда агрегаты сразу снова помечаются устаревшими.
+class LiveAnalytics:
+    def __init__(self):
+        self.categories = {}
+        self.services = {}
+        self.today = None
+        self.loaded_at = None
+        self.load_started = None
+        self.stale = True
+        # Последняя ошибка пересборки: отчёт построен по прежним агрегатам
+        self.error = None
+        self._changes = 0
+        self._flight = SingleFlight("analytics")
+
+    def invalidate(self):
+        self._changes += 1
+        self.stale = True
+
+    def _category(self, category):
+        return category_stats(self.categories, category)
+
+    def _roll(self, today):
+        # Смена суток: освобождаем номера выехавших и забываем прошедшие ночи
+        if self.today == today:
+            return
+        for stats in self.categories.values():
+            for day in [day for day in stats.checkouts if day <= today]:
+                stats.outstanding -= stats.checkouts.pop(day)
+            for day in [day for day in stats.occupied if day < today]:
+                del stats.occupied[day]
+                stats.nightly_revenue.pop(day, None)
+        self.today = today
+
+    @staticmethod
+    def build(conn):
+        # Только чтение и новые объекты: выполняется в потоке, пока loop работает с прежними
+        started = time.perf_counter()
+        today = date.today()
+        categories = {}
+        services = {}
+        cursor = conn.cursor()
+        cursor.execute("SELECT category, SUM(quantity) AS free FROM Rooms GROUP BY category")
+        for row in cursor.fetchall():
+            category_stats(categories, row.category).free = row.free or 0
+        cursor.execute("""
+            SELECT r.category, r.price, g.check_in_date, g.check_out_date
+            FROM Guests g
+            JOIN Rooms r ON r.room_id = g.room_id
+        """)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                add_booking(
+                    category_stats(categories, row.category), as_money(row.price),
+                    as_date(row.check_in_date), as_date(row.check_out_date), today
+                )
+        cursor.execute("SELECT service_id, name, price FROM Services")
+        for row in cursor.fetchall():
+            services[row.service_id] = ServiceStats(row.service_id, row.name, row.price)
+        cursor.execute("""
+            SELECT service_id, COUNT(*) AS orders, SUM(quantity) AS quantity, SUM(total_price) AS revenue
+            FROM GuestServicesWithPrice
+            WHERE status <> 'canceled'
+            GROUP BY service_id
+        """)
+        for row in cursor.fetchall():
+            stats = services.get(row.service_id)
+            if stats is not None:
+                stats.orders = row.orders
+                stats.quantity = row.quantity or 0
+                stats.revenue = as_money(row.revenue)
+        logging.info(f"Агрегаты аналитики построены за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return categories, services, today, started
+
+    @classmethod
+    def _read(cls):
+        conn = db.connect()
+        try:
+            return cls.build(conn)
+        finally:
+            conn.close()
+
+    def _install(self, built, changes):
+        self.categories, self.services, self.today, self.load_started = built
+        self.loaded_at = datetime.now()
+        self.error = None
+        self.stale = self._changes != changes
+
+    def load(self, conn):
+        self._install(self.build(conn), self._changes)
+
+    def ensure_loaded(self):
+        # Синхронная загрузка при запуске бота
+        if not self.stale:
+            return
+        try:
+            self._install(self._read(), self._changes)
+        except db.DBError as e:
+            if self.loaded_at is None:
+                raise
+            self.error = e
+            logging.warning(f"Агрегаты аналитики не перестроены, используются прежние: {e}")
+
+    async def _rebuild(self):
+        changes = self._changes
+        try:
+            built = await asyncio.to_thread(self._read)
+        except db.DBError as e:
+            if self.loaded_at is None:
+                raise
+            self.error = e
+            logging.warning(f"Агрегаты аналитики не перестроены, используются прежние: {e}")
+            return
+        self._install(built, changes)
+
+    async def refresh(self):
+        # Без БД отдаются прежние агрегаты (error заполнен, следующий вызов пробует снова)
+        if self.stale:
+            await self._flight.do(None, self._rebuild)
+
+    def record_booking(self, category, price, check_in, check_out):
+        self._changes += 1
+        if self.stale:
+            return
+        today = date.today()
+        self._roll(today)
+        stats = self._category(category)
+        stats.free -= 1
+        add_booking(stats, as_money(price), as_date(check_in), as_date(check_out), today)
+
+    def record_service_order(self, service_id, quantity, status="pending"):
+        self._changes += 1
+        if self.stale or status == "canceled":
+            return
+        stats = self.services.get(service_id)
+        if stats is None:
+            # Услуга появилась после построения агрегатов
+            self.stale = True
+            return
+        stats.orders += 1
+        stats.quantity += quantity
+        stats.revenue += stats.price * quantity
+
+    def record_service_cancel(self, service_id, quantity):
+        # Отмена заказа, учтённого в агрегатах (был pending)
+        self._changes += 1
+        if self.stale:
+            return
+        stats = self.services.get(service_id)
+        if stats is None:
+            self.stale = True
+            return
+        stats.orders -= 1
+        stats.quantity -= quantity
+        stats.revenue -= stats.price * quantity
+
+    def record_release(self, released, since):
+        # released — категория -> возвращённые номера; since — perf_counter начала прогона.
+        # Если агрегаты строились во время прогона, часть возврата уже в них — пересобираем
+        self._changes += 1
+        if self.stale:
+            return
+        if self.load_started is not None and self.load_started >= since:
+            self.stale = True
+            return
+        for category, count in released.items():
+            self._category(category).free += count
+
+    def occupancy(self):
+        self._roll(date.today())
+        report = []
+        for stats in sorted(self.categories.values(), key=lambda s: s.category):
+            occupied = stats.occupied.get(self.today, 0)
+            capacity = stats.capacity
+            report.append((
+                stats.category, occupied, capacity,
+                occupied * 100 / capacity if capacity > 0 else 0.0,
+                stats.nightly_revenue.get(self.today, ZERO),
+            ))
+        return report
+
+    def totals(self):
+        return (
+            sum((s.revenue for s in self.categories.values()), ZERO),
+            sum(s.nights for s in self.categories.values()),
+            sum(s.bookings for s in self.categories.values()),
+            sum((s.revenue for s in self.services.values()), ZERO),
+            sum(s.orders for s in self.services.values()),
+        )
+
+    def top_services(self, limit=5):
+        return sorted(
+            (s for s in self.services.values() if s.orders),
+            key=lambda s: s.revenue, reverse=True
+        )[:limit]
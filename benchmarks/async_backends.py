@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+
+import db
+from benchmarks.fake_odbc import FakeDriver
+from benchmarks.seed import CATEGORIES, seed
+
+# Чтения, которые делает «Доступные номера»: категории, номера категории вместе с фото
+CATEGORIES_SQL = "SELECT DISTINCT category FROM Rooms WHERE status = 'available' AND quantity > 0"
+ROOMS_SQL = """
+    SELECT r.room_id, r.description, r.price, i.image_url
+    FROM Rooms r
+    LEFT JOIN RoomImages i ON i.room_id = r.room_id
+    WHERE r.category = ? AND r.status = 'available' AND r.quantity > 0
+    ORDER BY r.room_id, i.image_id
+"""
+
+
+# Синхронный драйвер с сетевой задержкой: поток, выполняющий запрос, спит latency секунд
+class LatencyCursor(db.InstrumentedCursor):
+    __slots__ = ()
+    latency = 0.0
+
+    def execute(self, sql, *params):
+        time.sleep(self.latency)
+        return super().execute(sql, *params)
+
+
+class LatencyConnection(db.InstrumentedConnection):
+    __slots__ = ()
+    cursor_class = LatencyCursor
+
+
+async def browse(rnd):
+    conn = await db.aconnect()
+    try:
+        cursor = await conn.cursor()
+        await cursor.execute(CATEGORIES_SQL)
+        await cursor.fetchall()
+        await cursor.execute(ROOMS_SQL, (rnd.choice(CATEGORIES),))
+        await cursor.fetchall()
+    finally:
+        await conn.close()
+
+
+async def user(uid, iterations, random_seed, latencies):
+    rnd = random.Random(random_seed + uid)
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await browse(rnd)
+        latencies.append(time.perf_counter() - started)
+
+
+async def watch_threads(peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        await asyncio.sleep(0.005)
+
+
+def percentile(sorted_values, q):
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+async def measure(async_backend, args):
+    db.set_async_backend(async_backend)
+    latencies = []
+    peak = [threading.active_count()]
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_threads(peak, stop))
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(user(uid, args.iterations, args.random_seed, latencies) for uid in range(args.users)))
+    finally:
+        wall = time.perf_counter() - started
+        stop.set()
+        await watcher
+        await async_backend.close()
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        "wall_time_s": round(wall, 2),
+        "throughput_ops": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "peak_threads": peak[0],
+    }
+
+
+async def run_async(args):
+    backend = db.set_backend(db.SQLiteBackend(":memory:"))
+    backend.connection_class = LatencyConnection
+    LatencyCursor.latency = args.latency / 1000
+    conn = db.connect()
+    try:
+        seed(conn, users=10, rooms_per_category=args.rooms_per_category, images_per_room=2, guests=0)
+    finally:
+        conn.close()
+    report = {"users": args.users, "iterations": args.iterations, "latency_ms": args.latency}
+    try:
+        report["threads"] = await measure(db.ThreadedAsyncBackend(backend), args)
+        driver = FakeDriver(backend._open, latency=args.latency / 1000)
+        report["aioodbc"] = await measure(
+            db.AioODBCBackend("stand-in", maxsize=args.pool_size, driver=driver, dialect=backend.dialect), args
+        )
+    finally:
+        db.set_async_backend(None)
+        backend.close()
+    report["pool_size"] = args.pool_size
+    report["speedup"] = round(report["threads"]["wall_time_s"] / max(report["aioodbc"]["wall_time_s"], 0.001), 1)
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"Пользователей: {report['users']} x {report['iterations']} просмотров, "
+        f"задержка сервера: {report['latency_ms']} мс на запрос, пул заглушки aioodbc: {report['pool_size']}",
+    ]
+    for name in ("threads", "aioodbc"):
+        result = report[name]
+        lines.append(
+            f"{name:8} {result['wall_time_s']} с, {result['throughput_ops']} просмотров/с, "
+            f"p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, p99 {result['p99_ms']} мс, "
+            f"потоков: {result['peak_threads']}"
+        )
+    lines.append(f"Ускорение на неблокирующей заглушке (не оценка настоящего aioodbc): x{report['speedup']}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Асинхронный доступ к БД: пул потоков (DB_ASYNC=threads) против пула соединений "
+            "на заглушке с интерфейсом aioodbc поверх SQLite. Заглушка ждёт ответа через "
+            "asyncio.sleep, без потока; настоящий aioodbc выполняет вызовы pyodbc в executor "
+            "event loop, поэтому ускорение — оценка для неблокирующего драйвера, а не для aioodbc"
+        )
+    )
+    parser.add_argument("--users", type=int, default=500, help="одновременных пользователей")
+    parser.add_argument("--iterations", type=int, default=4, help="просмотров номеров на пользователя")
+    parser.add_argument("--latency", type=float, default=5.0, help="задержка ответа сервера на запрос, мс")
+    parser.add_argument("--pool-size", type=int, default=100, help="размер пула соединений aioodbc")
+    parser.add_argument("--rooms-per-category", type=int, default=20)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_async(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
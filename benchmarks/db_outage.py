@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import time
+
+# Отказ SQL Server под нагрузкой без сети: SQLite в памяти за обёрткой, которая
+# в режиме «сервер лежит» ждёт таймаут входа и падает, как pyodbc.connect
+os.environ.setdefault("TOKEN", "123456:BENCHMARK-benchmark-BENCHMARK-benchmark")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["DB_PATH"] = ":memory:"
+
+import db  # noqa: E402
+from breaker import CircuitBreaker  # noqa: E402
+import main  # noqa: E402
+from benchmarks.fake_telegram import FakeSession  # noqa: E402
+from benchmarks.replay import SCENARIOS, percentile  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+
+DEGRADED_PREFIX = "⚠️ Сервис временно недоступен"
+
+
+class OutageBackend:
+    name = "sqlite"
+
+    def __init__(self, backend, login_timeout):
+        self.backend = backend
+        self.login_timeout = login_timeout
+        self.down = False
+        self.attempts = 0
+
+    def connect(self):
+        if self.down:
+            self.attempts += 1
+            time.sleep(self.login_timeout)
+            raise sqlite3.OperationalError("08001: Login timeout expired")
+        return self.backend.connect()
+
+    def close(self):
+        self.backend.close()
+
+
+# Ответы бота: сколько сообщений ушло и сколько из них — о недоступности сервиса
+class Replies:
+    def __init__(self):
+        self.sent = 0
+        self.degraded = 0
+
+    def __call__(self, method):
+        text = getattr(method, "text", None)
+        if text is None:
+            return
+        self.sent += 1
+        if text.startswith(DEGRADED_PREFIX):
+            self.degraded += 1
+
+
+async def user(uid, args, ctx, latencies):
+    for iteration in range(args.iterations):
+        for name in args.scenarios:
+            for _, update in SCENARIOS[name](uid, iteration, ctx):
+                started = time.perf_counter()
+                await main.dp.feed_update(main.bot, update)
+                latencies.append(time.perf_counter() - started)
+
+
+async def run_mode(title, breaker, args, backend, ctx):
+    db.set_breaker(breaker)
+    replies = Replies()
+    main.bot.session = session = FakeSession(listener=replies)
+    main.dp.storage.storage.clear()
+    backend.down = True
+    backend.attempts = 0
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(user(uid, args, ctx, latencies) for uid in range(1, args.users + 1)))
+    wall = time.perf_counter() - started
+    backend.down = False
+    latencies.sort()
+    return {
+        "mode": title,
+        "updates": len(latencies),
+        "wall_s": round(wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "login_attempts": backend.attempts,
+        "replies": replies.sent,
+        "degraded_replies": replies.degraded,
+        "albums": session.calls["SendMediaGroup"],
+    }
+
+
+async def recover(backend, breaker):
+    # После подъёма сервера первая проба замыкает автомат
+    await asyncio.sleep(breaker.retry_in)
+    conn = db.connect()
+    conn.close()
+    return breaker.state
+
+
+async def run_async(args):
+    backend = db.set_backend(OutageBackend(db.SQLiteBackend(":memory:"), args.login_timeout / 1000))
+    conn = db.connect()
+    try:
+        room_ids = seed(conn, users=args.users, guests=0)
+        conn.cursor().execute("UPDATE Users SET admin = 1 WHERE telegram_id <= ?", (args.users,))
+        conn.commit()
+    finally:
+        conn.close()
+    # Каталоги в памяти строятся до отказа, как при запуске бота
+    main.room_index.ensure_loaded()
+    main.service_catalog.services()
+    main.analytics.ensure_loaded()
+    ctx = {"room_ids": room_ids, "rnd": random.Random(args.random_seed)}
+    report = {"users": args.users, "iterations": args.iterations, "login_timeout_ms": args.login_timeout}
+    report["no_breaker"] = await run_mode("без автомата", CircuitBreaker(threshold=10 ** 9), args, backend, ctx)
+    breaker = CircuitBreaker(threshold=args.threshold, base_delay=args.delay, max_delay=args.delay * 8)
+    report["breaker"] = await run_mode("с автоматом", breaker, args, backend, ctx)
+    report["breaker"]["state_after_outage"] = breaker.state
+    report["breaker"]["state_after_recovery"] = await recover(backend, breaker)
+    return report
+
+
+def format_report(report):
+    lines = [f"Пользователей: {report['users']} x {report['iterations']}, таймаут входа {report['login_timeout_ms']} мс"]
+    for key in ("no_breaker", "breaker"):
+        result = report[key]
+        lines.append(
+            f"{result['mode']}: апдейтов {result['updates']} за {result['wall_s']} с, "
+            f"p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, max {result['max_ms']} мс, "
+            f"попыток входа {result['login_attempts']}, ответов {result['replies']} "
+            f"(о недоступности {result['degraded_replies']}), альбомов номеров {result['albums']}"
+        )
+    breaker = report["breaker"]
+    lines.append(f"Автомат: после отказа {breaker['state_after_outage']}, после восстановления {breaker['state_after_recovery']}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Обработка апдейтов при недоступной БД: с автоматом отключения и без")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", default=["start", "rooms", "services", "admin"], choices=list(SCENARIOS))
+    parser.add_argument("--login-timeout", type=float, default=200.0, help="таймаут входа ODBC, мс")
+    parser.add_argument("--threshold", type=int, default=3)
+    parser.add_argument("--delay", type=float, default=1.0, help="первая пауза перед пробой, с")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    parser.add_argument("--log-level", default="CRITICAL")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(run_async(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,100 @@
+import asyncio
+
+
+# Заглушка асинхронного ODBC-драйвера с интерфейсом aioodbc поверх SQLite: каждый
+# запрос сначала ждёт latency секунд через asyncio.sleep, без потока на время
+# ожидания. Настоящий aioodbc так не умеет — он выполняет вызовы pyodbc в executor
+# event loop, поэтому заглушка показывает предел для неблокирующего драйвера, а не
+# поведение aioodbc
+class FakeCursor:
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self.latency = latency
+
+    async def execute(self, sql, params=()):
+        await asyncio.sleep(self.latency)
+        self._cursor.execute(sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        await asyncio.sleep(self.latency)
+        self._cursor.executemany(sql, seq_of_params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    async def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+    def __init__(self, conn, latency):
+        self._conn = conn
+        self.latency = latency
+
+    async def cursor(self):
+        return FakeCursor(self._conn.cursor(), self.latency)
+
+    async def commit(self):
+        self._conn.commit()
+
+    async def rollback(self):
+        self._conn.rollback()
+
+    async def close(self):
+        self._conn.close()
+
+
+class FakePool:
+    def __init__(self, open_connection, latency, minsize, maxsize):
+        self._open = open_connection
+        self.latency = latency
+        self._free = [FakeConnection(open_connection(), latency) for _ in range(minsize)]
+        self._slots = asyncio.Semaphore(maxsize)
+        self.size = minsize
+
+    async def acquire(self):
+        await self._slots.acquire()
+        if self._free:
+            return self._free.pop()
+        self.size += 1
+        return FakeConnection(self._open(), self.latency)
+
+    async def release(self, conn):
+        self._free.append(conn)
+        self._slots.release()
+
+    def close(self):
+        for conn in self._free:
+            conn._conn.close()
+        self._free = []
+
+    async def wait_closed(self):
+        pass
+
+
+# Модуль-«драйвер» для db.AioODBCBackend(driver=...): open_connection открывает
+# соединение SQLite (например, SQLiteBackend._open), dsn и параметры подключения игнорируются
+class FakeDriver:
+    def __init__(self, open_connection, latency=0.0):
+        self.open_connection = open_connection
+        self.latency = latency
+        self.pools = []
+
+    async def create_pool(self, dsn=None, minsize=1, maxsize=10, autocommit=False, **connect_kwargs):
+        pool = FakePool(self.open_connection, self.latency, minsize, maxsize)
+        self.pools.append(pool)
+        return pool
@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import json
+import time
+import typing
+from collections import Counter
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, InlineQuery, Message, Update, User
+
+
+# Сессия Bot API без сети: запоминает вызовы и отвечает правдоподобными объектами
+class FakeSession(BaseSession):
+    def __init__(self, latency=0.0, listener=None, feed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.listener = listener
+        # Источник апдейтов для getUpdates (UpdateFeed), нужен для start_polling
+        self.feed = feed
+        self.calls = Counter()
+        self.total_calls = 0
+        self._message_ids = itertools.count(1)
+
+    def _message(self, method):
+        chat_id = getattr(method, "chat_id", None) or 0
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": getattr(method, "text", None) or "",
+        }
+
+    def _photo_message(self, method):
+        # Сообщение альбома с фото, как его возвращает Telegram после загрузки по URL
+        message = self._message(method)
+        file_id = f"fake-photo-{message['message_id']}"
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]
+        return message
+
+    def _result(self, method):
+        returning = method.__returning__
+        if returning is Message:
+            return self._message(method)
+        if returning is User:
+            return {"id": 1, "is_bot": True, "first_name": "UrbanStay", "username": "UrbanStayBot"}
+        if typing.get_origin(returning) is list:
+            media = getattr(method, "media", None) or [None]
+            return [self._photo_message(method) if item is not None else self._message(method) for item in media]
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        self.total_calls += 1
+        if self.listener is not None:
+            self.listener(method)
+        if type(method).__name__ == "GetUpdates" and self.feed is not None:
+            updates = await self.feed.get_updates(method.offset, method.limit, method.timeout)
+            result = [update.model_dump(mode="json", exclude_none=True, by_alias=True) for update in updates]
+            content = json.dumps({"ok": True, "result": result})
+            return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = json.dumps({"ok": True, "result": self._result(method)})
+        return self.check_response(bot=bot, method=method, status_code=200, content=content).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# Очередь апдейтов на стороне Telegram для getUpdates: апдейт считается доставленным
+# (и удаляется), когда бот запрашивает следующую пачку с offset больше его update_id.
+# Неподтверждённые апдейты отдаются повторно — в том числе следующему экземпляру бота.
+class UpdateFeed:
+    def __init__(self, long_poll=0.5):
+        self.long_poll = long_poll
+        self.pending = []
+        self.confirmed_offset = 0
+        self._ids = itertools.count(1)
+        self._arrived = asyncio.Event()
+
+    def push(self, update):
+        # Номера выдаются в порядке поступления, как у Telegram
+        update = update.model_copy(update={"update_id": next(self._ids)})
+        self.pending.append(update)
+        self._arrived.set()
+        return update.update_id
+
+    async def get_updates(self, offset=None, limit=None, timeout=None):
+        if offset:
+            self.confirmed_offset = max(self.confirmed_offset, offset)
+            self.pending = [update for update in self.pending if update.update_id >= offset]
+        if not self.pending:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), min(timeout or 0, self.long_poll))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:limit or 100]
+
+
+# Построение синтетических апдейтов
+_update_ids = itertools.count(1)
+
+
+def make_user(telegram_id):
+    return User(id=telegram_id, is_bot=False, first_name=f"User{telegram_id}", username=f"user{telegram_id}")
+
+
+def message_update(telegram_id, text):
+    user = make_user(telegram_id)
+    message = Message(
+        message_id=next(_update_ids),
+        date=datetime.now(),
+        chat=Chat(id=telegram_id, type="private"),
+        from_user=user,
+        text=text,
+    )
+    return Update(update_id=next(_update_ids), message=message)
+
+
+def callback_update(telegram_id, data):
+    user = make_user(telegram_id)
+    message = Message(
+        message_id=next(_update_ids),
+        date=datetime.now(),
+        chat=Chat(id=telegram_id, type="private"),
+        from_user=user,
+        text="Выберите действие👇",
+    )
+    callback = CallbackQuery(
+        id=str(next(_update_ids)),
+        from_user=user,
+        chat_instance=str(telegram_id),
+        message=message,
+        data=data,
+    )
+    return Update(update_id=next(_update_ids), callback_query=callback)
+
+
+def inline_query_update(telegram_id, query, offset=""):
+    inline_query = InlineQuery(
+        id=str(next(_update_ids)),
+        from_user=make_user(telegram_id),
+        query=query,
+        offset=offset,
+    )
+    return Update(update_id=next(_update_ids), inline_query=inline_query)
+
+
+def load_updates(path):
+    # Записанные апдейты: по одному JSON-объекту Update в строке
+    with open(path, encoding="utf-8") as f:
+        return [Update.model_validate(json.loads(line)) for line in f if line.strip()]
@@ -0,0 +1,137 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+import db
+from benchmarks.seed import CATEGORIES, seed
+
+# Горячие запросы обработчиков (тексты как в main.py) и генераторы их параметров
+QUERIES = [
+    (
+        "активное бронирование",
+        "SELECT guest_id FROM Guests WHERE telegram_id = ? AND check_out_date >= GETDATE()",
+        lambda rnd, ctx: (rnd.randint(1, ctx["users"]),),
+    ),
+    (
+        "мои бронирования",
+        "SELECT guest_id, room_id, check_in_date, check_out_date FROM Guests WHERE telegram_id = ?",
+        lambda rnd, ctx: (rnd.randint(1, ctx["users"]),),
+    ),
+    (
+        "услуги гостя",
+        "SELECT s.name, gs.quantity, gs.order_date, gs.status FROM GuestServices gs "
+        "JOIN Services s ON gs.service_id = s.service_id WHERE gs.guest_id = ?",
+        lambda rnd, ctx: (rnd.randint(1, ctx["guests"]),),
+    ),
+    (
+        "фото номера",
+        "SELECT image_url FROM RoomImages WHERE room_id = ?",
+        lambda rnd, ctx: (rnd.choice(ctx["room_ids"]),),
+    ),
+    (
+        "категории",
+        "SELECT DISTINCT category FROM Rooms WHERE status = 'available' AND quantity > 0",
+        lambda rnd, ctx: (),
+    ),
+    (
+        "номера категории",
+        "SELECT room_id, description, price FROM Rooms WHERE category = ? AND status = 'available' AND quantity > 0",
+        lambda rnd, ctx: (rnd.choice(CATEGORIES),),
+    ),
+]
+
+
+def query_plan(conn, sql, params):
+    rows = conn.cursor().execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row[3] for row in rows]
+
+
+def measure(conn, ctx, repeats, random_seed):
+    results = {}
+    for title, sql, make_params in QUERIES:
+        rnd = random.Random(random_seed)
+        params_list = [make_params(rnd, ctx) for _ in range(repeats)]
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        for params in params_list:
+            cursor.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - started
+        results[title] = {
+            "plan": query_plan(conn, sql, params_list[0]),
+            "avg_us": round(elapsed / repeats * 1_000_000, 1),
+        }
+    return results
+
+
+def run(args):
+    backend = db.set_backend(db.SQLiteBackend(":memory:", auto_migrate=False))
+    conn = db.connect()
+    try:
+        room_ids = seed(
+            conn, users=args.users, rooms_per_category=args.rooms_per_category,
+            guests=args.guests, orders_per_guest=args.orders_per_guest, migrated=False
+        )
+        conn.cursor().execute("ANALYZE")
+        ctx = {"users": args.users, "guests": args.guests, "room_ids": room_ids}
+        before = measure(conn, ctx, args.repeats, args.random_seed)
+        applied = db.migrate(conn)
+        conn.cursor().execute("ANALYZE")
+        after = measure(conn, ctx, args.repeats, args.random_seed)
+    finally:
+        conn.close()
+        backend.close()
+    return {
+        "dataset": {
+            "users": args.users, "rooms": len(room_ids), "guests": args.guests,
+            "orders": args.guests * args.orders_per_guest,
+        },
+        "migrations": [f"{m.version:04d}_{m.name}" for m in applied],
+        "queries": {
+            title: {
+                "before": before[title],
+                "after": after[title],
+                "speedup": round(before[title]["avg_us"] / max(after[title]["avg_us"], 0.1), 1),
+            }
+            for title, _, _ in QUERIES
+        },
+    }
+
+
+def format_report(report):
+    dataset = report["dataset"]
+    lines = [
+        f"Данные: {dataset['users']} пользователей, {dataset['rooms']} номеров, "
+        f"{dataset['guests']} бронирований, {dataset['orders']} заказов услуг",
+        f"Миграции: {', '.join(report['migrations']) or 'нет новых'}",
+    ]
+    for title, result in report["queries"].items():
+        lines.append("")
+        lines.append(f"{title}: {result['before']['avg_us']} мкс -> {result['after']['avg_us']} мкс (x{result['speedup']})")
+        lines.append("  до:    " + " | ".join(result["before"]["plan"]))
+        lines.append("  после: " + " | ".join(result["after"]["plan"]))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Планы и время горячих запросов до и после миграций с индексами (SQLite)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--guests", type=int, default=50000)
+    parser.add_argument("--orders-per-guest", type=int, default=2)
+    parser.add_argument("--rooms-per-category", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=500, help="выполнений каждого запроса")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+# Бенчмарк работает без сети и без SQL Server
+os.environ.setdefault("TOKEN", "123456:BENCHMARK-benchmark-BENCHMARK-benchmark")
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("DB_PATH", ":memory:")
+
+import db  # noqa: E402
+import main  # noqa: E402
+from benchmarks.fake_telegram import FakeSession, callback_update, inline_query_update, load_updates, message_update  # noqa: E402
+from benchmarks.seed import SERVICES, seed  # noqa: E402
+
+_current_sample = contextvars.ContextVar("current_sample", default=None)
+
+
+class Sample:
+    __slots__ = ("label", "latency", "sql", "tg_calls", "error")
+
+    def __init__(self, label):
+        self.label = label
+        self.latency = 0.0
+        self.sql = 0
+        self.tg_calls = 0
+        self.error = None
+
+
+# Курсор, который считает SQL-запросы текущего апдейта
+class CountingCursor(db.InstrumentedCursor):
+    __slots__ = ()
+
+    def execute(self, sql, *params):
+        sample = _current_sample.get()
+        if sample is not None:
+            sample.sql += 1
+        return super().execute(sql, *params)
+
+    def executemany(self, sql, seq_of_params):
+        sample = _current_sample.get()
+        if sample is not None:
+            sample.sql += 1
+        return super().executemany(sql, seq_of_params)
+
+
+class CountingConnection(db.InstrumentedConnection):
+    __slots__ = ()
+    cursor_class = CountingCursor
+
+
+def _count_tg_call(method):
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.tg_calls += 1
+
+
+# Сценарии: последовательность (метка, апдейт) для одного виртуального пользователя
+def scenario_start(uid, iteration, ctx):
+    return [("/start", message_update(uid, "/start"))]
+
+
+def scenario_rooms(uid, iteration, ctx):
+    return [
+        ("/rooms", message_update(uid, "/rooms")),
+        ("next_category", callback_update(uid, "next_category")),
+        ("next_category", callback_update(uid, "next_category")),
+        ("prev_category", callback_update(uid, "prev_category")),
+    ]
+
+
+# Поиск номеров: фильтры /rooms и inline-режим (повторные запросы — из LRU индекса)
+INLINE_QUERIES = ["люкс", "делюкс вид", "номер город", "апарт", "семейный номер"]
+
+
+def scenario_search(uid, iteration, ctx):
+    query = ctx["rnd"].choice(INLINE_QUERIES)
+    return [
+        ("/rooms", message_update(uid, "/rooms price=100-300 guests=2")),
+        ("room_search_page_", callback_update(uid, "room_search_page_1")),
+        ("inline_query", inline_query_update(uid, query)),
+        ("inline_query", inline_query_update(uid, query, offset="20")),
+    ]
+
+
+def scenario_booking(uid, iteration, ctx):
+    check_in = date.today() + timedelta(days=ctx["rnd"].randint(1, 30))
+    check_out = check_in + timedelta(days=ctx["rnd"].randint(1, 7))
+    return [
+        ("book_", callback_update(uid, f"book_{ctx['rnd'].choice(ctx['room_ids'])}")),
+        ("booking:first_name", message_update(uid, "Иван")),
+        ("booking:last_name", message_update(uid, "Петров")),
+        ("skip_email", callback_update(uid, "skip_email")),
+        ("skip_phone", callback_update(uid, "skip_phone")),
+        ("booking:check_in_date", message_update(uid, check_in.isoformat())),
+        ("booking:check_out_date", message_update(uid, check_out.isoformat())),
+        ("skip_comment", callback_update(uid, "skip_comment")),
+    ]
+
+
+def scenario_services(uid, iteration, ctx):
+    first, second = ctx["rnd"].sample(range(1, len(SERVICES) + 1), 2)
+    return [
+        ("my_bookings", callback_update(uid, "my_bookings")),
+        ("my_services", callback_update(uid, "my_services")),
+        ("additional_services", callback_update(uid, "additional_services")),
+        ("cart_add_", callback_update(uid, f"cart_add_{first}")),
+        ("cart_add_", callback_update(uid, f"cart_add_{first}")),
+        ("cart_add_", callback_update(uid, f"cart_add_{second}")),
+        ("cart_checkout", callback_update(uid, "cart_checkout")),
+    ]
+
+
+def scenario_admin(uid, iteration, ctx):
+    room_id = ctx["rnd"].choice(ctx["room_ids"])
+    return [
+        ("/apanel", message_update(uid, "/apanel")),
+        ("DB", callback_update(uid, "DB")),
+        ("view_room", callback_update(uid, "view_room")),
+        ("editrow_room", callback_update(uid, f"editrow_room_{room_id}")),
+        ("edit_field_price", callback_update(uid, "edit_field_price")),
+        ("room_edit:value", message_update(uid, str(ctx["rnd"].randint(50, 500)))),
+        ("add_service", callback_update(uid, "add_service")),
+        ("service_add:value", message_update(uid, f"Услуга {uid}-{iteration}, 10, Кратко, Подробно")),
+        ("view_service", callback_update(uid, "view_service")),
+        ("view_guest", callback_update(uid, "view_guest")),
+        ("view_gs", callback_update(uid, "view_gs")),
+    ]
+
+
+SCENARIOS = {
+    "start": scenario_start,
+    "rooms": scenario_rooms,
+    "search": scenario_search,
+    "booking": scenario_booking,
+    "services": scenario_services,
+    "admin": scenario_admin,
+}
+
+
+def update_label(update):
+    if update.message is not None:
+        text = update.message.text or ""
+        return text.split()[0] if text.startswith("/") else "message"
+    if update.callback_query is not None:
+        return (update.callback_query.data or "").rstrip("0123456789")
+    return update.event_type
+
+
+async def feed(update, label, samples):
+    sample = Sample(label)
+    token = _current_sample.set(sample)
+    started = time.perf_counter()
+    try:
+        await main.dp.feed_update(main.bot, update)
+    except Exception as e:
+        sample.error = repr(e)
+    finally:
+        sample.latency = time.perf_counter() - started
+        _current_sample.reset(token)
+    samples.append(sample)
+
+
+async def run_user(uid, scenarios, iterations, ctx, samples):
+    for iteration in range(iterations):
+        for name in scenarios:
+            for label, update in SCENARIOS[name](uid, iteration, ctx):
+                await feed(update, label, samples)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    latencies = sorted(s.latency * 1000 for s in samples)
+    count = len(samples)
+    return {
+        "count": count,
+        "errors": sum(1 for s in samples if s.error),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / count, 3) if count else 0.0,
+        "sql_per_update": round(sum(s.sql for s in samples) / count, 3) if count else 0.0,
+        "tg_calls_per_update": round(sum(s.tg_calls for s in samples) / count, 3) if count else 0.0,
+    }
+
+
+def build_report(samples, wall_time, args):
+    by_label = defaultdict(list)
+    for sample in samples:
+        by_label[sample.label].append(sample)
+    errors = [s for s in samples if s.error]
+    return {
+        "backend": db.get_backend().name,
+        "users": args.users,
+        "iterations": args.iterations,
+        "scenarios": args.scenarios,
+        "updates": len(samples),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_ups": round(len(samples) / wall_time, 1) if wall_time else 0.0,
+        "overall": summarize(samples),
+        "handlers": {label: summarize(group) for label, group in sorted(by_label.items())},
+        "error_samples": sorted({s.error for s in errors})[:10],
+    }
+
+
+# Сравнение с эталонным отчётом для CI
+def compare(report, baseline, tolerance, min_delta_ms):
+    regressions = []
+    for label, current in report["handlers"].items():
+        base = baseline.get("handlers", {}).get(label)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_delta_ms:
+                regressions.append(f"{label}: {key} {base[key]} -> {current[key]}")
+        for key in ("sql_per_update", "tg_calls_per_update"):
+            if current[key] > base[key]:
+                regressions.append(f"{label}: {key} {base[key]} -> {current[key]}")
+    if report["overall"]["errors"] > baseline.get("overall", {}).get("errors", 0):
+        regressions.append(f"errors {baseline['overall']['errors']} -> {report['overall']['errors']}")
+    return regressions
+
+
+def prepare(args):
+    backend = db.get_backend()
+    backend.connection_class = CountingConnection
+    conn = db.connect()
+    try:
+        room_ids = seed(conn, users=max(args.users, 1), guests=args.seed_guests)
+        cursor = conn.cursor()
+        # Виртуальные пользователи сценария admin должны проходить is_admin
+        cursor.execute("UPDATE Users SET admin = 1 WHERE telegram_id <= ?", (args.users,))
+        conn.commit()
+    finally:
+        conn.close()
+    session = FakeSession(latency=args.tg_latency / 1000, listener=_count_tg_call)
+    # Middleware боевой сессии (метрики и т.п.) переносятся на фейковую
+    session.middleware = main.bot.session.middleware
+    main.bot.session = session
+    return room_ids
+
+
+async def run(args):
+    room_ids = prepare(args)
+    ctx = {"room_ids": room_ids, "rnd": random.Random(args.random_seed)}
+    samples = []
+    started = time.perf_counter()
+    if args.updates:
+        for update in load_updates(args.updates):
+            await feed(update, update_label(update), samples)
+    else:
+        await asyncio.gather(*(
+            run_user(uid, args.scenarios, args.iterations, ctx, samples)
+            for uid in range(1, args.users + 1)
+        ))
+    return build_report(samples, time.perf_counter() - started, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Прогон апдейтов через dp.feed_update с фейковой сессией Telegram")
+    parser.add_argument("--users", type=int, default=20, help="число одновременных виртуальных пользователей")
+    parser.add_argument("--iterations", type=int, default=3, help="повторов сценариев на пользователя")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--updates", help="файл с записанными апдейтами (JSON Lines) вместо синтетических")
+    parser.add_argument("--seed-guests", type=int, default=500, help="число исторических бронирований в базе")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="имитация задержки Bot API, мс")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", help="куда записать JSON-отчёт (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="эталонный отчёт; при регрессии код выхода 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95/p99 относительно эталона")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="игнорировать рост латентности меньше этого")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Перезапуск бота под нагрузкой без сети и без SQL Server: SQLite во временном файле,
+# чтобы база пережила «перезапуск» (второй вызов main.main() в том же процессе)
+WORK_DIR = tempfile.mkdtemp(prefix="urban_stay_restart_")
+os.environ.setdefault("TOKEN", "123456:BENCHMARK-benchmark-BENCHMARK-benchmark")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["DB_PATH"] = os.path.join(WORK_DIR, "urban_stay.sqlite3")
+os.environ["FSM_SNAPSHOT"] = os.path.join(WORK_DIR, "fsm_state.json")
+os.environ.setdefault("LOOP_MONITOR", "0")
+
+import db  # noqa: E402
+import main  # noqa: E402
+from benchmarks.fake_telegram import FakeSession, UpdateFeed  # noqa: E402
+from benchmarks.replay import SCENARIOS  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+
+
+# Учёт завершённых обработок по update_id (в обоих экземплярах бота)
+class CompletionTracker:
+    def __init__(self):
+        self.completed = Counter()
+        self.errors = 0
+        self._waiters = {}
+
+    async def __call__(self, handler, event, data):
+        try:
+            result = await handler(event, data)
+        except Exception:
+            self.errors += 1
+            raise
+        self.completed[event.update_id] += 1
+        waiter = self._waiters.pop(event.update_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        return result
+
+    async def wait(self, update_id):
+        if self.completed[update_id]:
+            return
+        waiter = self._waiters.setdefault(update_id, asyncio.get_running_loop().create_future())
+        await waiter
+
+
+# Пользователь ждёт ответа бота на каждое действие, как в жизни; пока бот
+# перезапускается, апдейты копятся в очереди Telegram. Не дождавшись ответа
+# (апдейт потерян), пользователь уходит.
+async def user(uid, feed, tracker, args, ctx, pushed):
+    for iteration in range(args.iterations):
+        for name in args.scenarios:
+            for _, update in SCENARIOS[name](uid, iteration, ctx):
+                update_id = feed.push(update)
+                pushed.append(update_id)
+                try:
+                    await asyncio.wait_for(tracker.wait(update_id), args.reply_timeout)
+                except asyncio.TimeoutError:
+                    return
+
+
+async def run_instance():
+    # Экземпляр бота целиком: main() от загрузки FSM до graceful_shutdown
+    main.dp.storage.storage.clear()
+    return asyncio.create_task(main.main())
+
+
+async def stop_instance(task):
+    started = time.perf_counter()
+    in_flight = main.in_flight.count
+    os.kill(os.getpid(), signal.SIGTERM)
+    await task
+    # Конец процесса: всё, что не успело завершиться, обрывается
+    leftovers = [t for t in list(main.dp._handle_update_tasks) if not t.done()]
+    for leftover in leftovers:
+        leftover.cancel()
+    await asyncio.gather(*leftovers, return_exceptions=True)
+    main.in_flight.stopping = False
+    return {"in_flight_at_signal": in_flight, "cut_off": len(leftovers), "shutdown_s": round(time.perf_counter() - started, 2)}
+
+
+async def run_mode(shutdown_timeout, args, room_ids):
+    main.SHUTDOWN_TIMEOUT = shutdown_timeout
+    feed = UpdateFeed()
+    tracker = CompletionTracker()
+    main.dp.update.outer_middleware(tracker)
+    main.bot.session = FakeSession(latency=args.tg_latency / 1000, feed=feed)
+    ctx = {"room_ids": room_ids, "rnd": random.Random(args.random_seed)}
+    pushed = []
+    try:
+        instance = await run_instance()
+        users = asyncio.gather(*(user(uid, feed, tracker, args, ctx, pushed) for uid in range(1, args.users + 1)))
+        await asyncio.sleep(args.restart_after)
+        restart = await stop_instance(instance)
+        instance = await run_instance()
+        await users
+        await stop_instance(instance)
+    finally:
+        main.dp.update.outer_middleware.unregister(tracker)
+    # Потерян: Telegram считает апдейт доставленным (offset ушёл дальше), а обработка не завершилась
+    dropped = [update_id for update_id in pushed if update_id < feed.confirmed_offset and not tracker.completed[update_id]]
+    return {
+        "shutdown_timeout_s": shutdown_timeout,
+        "updates": len(pushed),
+        "completed": sum(1 for update_id in pushed if tracker.completed[update_id]),
+        "dropped": len(dropped),
+        "redelivered": sum(count - 1 for count in tracker.completed.values() if count > 1),
+        "handler_errors": tracker.errors,
+        "restart": restart,
+    }
+
+
+async def run_async(args):
+    conn = db.connect()
+    try:
+        room_ids = seed(conn, users=args.users, guests=0)
+        conn.cursor().execute("UPDATE Users SET admin = 1 WHERE telegram_id <= ?", (args.users,))
+        conn.commit()
+    finally:
+        conn.close()
+    report = {"users": args.users, "iterations": args.iterations, "restart_after_s": args.restart_after}
+    report["graceful"] = await run_mode(main.SHUTDOWN_TIMEOUT, args, room_ids)
+    report["abrupt"] = await run_mode(0.0, args, room_ids)
+    return report
+
+
+def format_report(report):
+    lines = [f"Пользователей: {report['users']} x {report['iterations']}, перезапуск через {report['restart_after_s']} с"]
+    for mode, title in (("graceful", "Плавная остановка"), ("abrupt", "Без ожидания")):
+        result = report[mode]
+        restart = result["restart"]
+        lines.append(
+            f"{title} (таймаут {result['shutdown_timeout_s']} с): апдейтов {result['updates']}, "
+            f"завершено {result['completed']}, потеряно {result['dropped']}, "
+            f"повторно доставлено {result['redelivered']}, ошибок {result['handler_errors']}; "
+            f"в обработке при сигнале {restart['in_flight_at_signal']}, оборвано {restart['cut_off']}, "
+            f"остановка {restart['shutdown_s']} с"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Потерянные апдейты при перезапуске бота под нагрузкой")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2)
+    parser.add_argument("--scenarios", nargs="+", default=["start", "rooms", "booking", "services"], choices=list(SCENARIOS))
+    parser.add_argument("--tg-latency", type=float, default=30.0, help="задержка Bot API, мс")
+    parser.add_argument("--restart-after", type=float, default=1.0, help="когда послать SIGTERM, с")
+    parser.add_argument("--reply-timeout", type=float, default=10.0, help="сколько пользователь ждёт ответа, с")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_async(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    return 1 if report["graceful"]["dropped"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,125 @@
+import argparse
+import json
+import random
+import sys
+import time
+from decimal import Decimal
+
+import db
+from benchmarks.seed import CATEGORIES, seed
+from room_index import RoomIndex
+
+# Тот же отбор, что делает RoomIndex.search, одним запросом к БД
+SEARCH_SQL = """
+    SELECT room_id, category, description, price, capacity
+    FROM Rooms
+    WHERE status = 'available' AND quantity > 0
+      AND price >= ? AND price <= ? AND (? IS NULL OR category = ?) AND capacity >= ?
+    ORDER BY price, room_id
+"""
+
+
+def make_filters(rnd, repeats):
+    filters = []
+    for _ in range(repeats):
+        low = rnd.randint(50, 450)
+        filters.append((
+            Decimal(low), Decimal(low + rnd.randint(10, 100)),
+            rnd.choice(CATEGORIES + [None]), rnd.randint(1, 4),
+        ))
+    return filters
+
+
+def make_queries(rnd, repeats):
+    # Префиксы слов категории и описания, как их набирают в inline-режиме
+    words = [category.casefold() for category in CATEGORIES] + ["номер", "видом", "город"]
+    queries = set()
+    while len(queries) < min(repeats, 500):
+        picked = rnd.sample(words, rnd.randint(1, 2))
+        queries.add(tuple(word[:rnd.randint(2, len(word))] for word in picked))
+    return sorted(queries)
+
+
+def run(args):
+    backend = db.set_backend(db.SQLiteBackend(":memory:"))
+    conn = db.connect()
+    try:
+        room_ids = seed(conn, users=10, rooms_per_category=args.rooms_per_category, images_per_room=1, guests=0)
+        conn.cursor().execute("ANALYZE")
+        filters = make_filters(random.Random(args.random_seed), args.repeats)
+
+        index = RoomIndex(ttl=3600)
+        started = time.perf_counter()
+        index.load(conn)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        index_matches = 0
+        for low, high, category, guests in filters:
+            index_matches += len(index.search(low, high, category, guests))
+        index_us = (time.perf_counter() - started) / args.repeats * 1_000_000
+
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        sql_matches = 0
+        for low, high, category, guests in filters:
+            sql_matches += len(cursor.execute(SEARCH_SQL, (low, high, category, category, guests)).fetchall())
+        sql_us = (time.perf_counter() - started) / args.repeats * 1_000_000
+
+        # Inline-поиск: первый проход по уникальным запросам — пересечение префиксов,
+        # затем те же запросы повторно — из LRU
+        queries = [" ".join(words) for words in make_queries(random.Random(args.random_seed), args.repeats)]
+        index._matches.clear()
+        started = time.perf_counter()
+        for query in queries:
+            index.match(query)
+        match_us = (time.perf_counter() - started) / len(queries) * 1_000_000
+        started = time.perf_counter()
+        for query in queries:
+            index.match(query)
+        cached_us = (time.perf_counter() - started) / len(queries) * 1_000_000
+    finally:
+        conn.close()
+        backend.close()
+    return {
+        "rooms": len(room_ids),
+        "repeats": args.repeats,
+        "index_build_ms": round(build_ms, 1),
+        "index_avg_us": round(index_us, 1),
+        "sql_avg_us": round(sql_us, 1),
+        "speedup": round(sql_us / max(index_us, 0.1), 1),
+        "same_results": index_matches == sql_matches,
+        "inline_avg_us": round(match_us, 1),
+        "inline_cached_avg_us": round(cached_us, 1),
+    }
+
+
+def format_report(report):
+    return "\n".join([
+        f"Номеров: {report['rooms']}, поисков: {report['repeats']}",
+        f"Построение индекса: {report['index_build_ms']} мс",
+        f"Индекс: {report['index_avg_us']} мкс на поиск",
+        f"SQL (SQLite в памяти): {report['sql_avg_us']} мкс на поиск (x{report['speedup']})",
+        f"Совпадение результатов: {'да' if report['same_results'] else 'НЕТ'}",
+        f"Inline-поиск: {report['inline_avg_us']} мкс на запрос, из LRU: {report['inline_cached_avg_us']} мкс",
+    ])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск номеров по фильтрам /rooms: индекс в памяти против SQL")
+    parser.add_argument("--rooms-per-category", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=2000, help="число поисков")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
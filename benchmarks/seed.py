@@ -0,0 +1,94 @@
+import random
+from datetime import date, timedelta
+
+CATEGORIES = ["Стандарт", "Комфорт", "Делюкс", "Люкс", "Семейный", "Апартаменты"]
+CAPACITIES = {"Стандарт": 2, "Комфорт": 2, "Делюкс": 3, "Люкс": 4, "Семейный": 5, "Апартаменты": 6}
+SERVICES = [
+    ("Завтрак в номер", 15, "Официант"),
+    ("Трансфер из аэропорта", 40, "Водитель"),
+    ("Прачечная", 10, "Горничная"),
+    ("СПА", 60, "Массажист"),
+    ("Поздний выезд", 25, None),
+    ("Аренда велосипеда", 12, None),
+]
+EMPLOYEES_PER_POSITION = 3
+# Telegram ID сотрудников не пересекаются с ID виртуальных пользователей
+EMPLOYEE_TELEGRAM_BASE = 900_000
+
+ADMIN_ID = 1
+
+
+# Колонки, добавленные миграциями (benchmarks.indexes наполняет базу до миграций)
+def seed_migrated_columns(cursor):
+    cursor.executemany(
+        "UPDATE Services SET position = ? WHERE name = ?",
+        [(position, name) for name, _, position in SERVICES if position]
+    )
+    cursor.execute(f"UPDATE Employees SET telegram_id = employee_id + {EMPLOYEE_TELEGRAM_BASE}")
+    cursor.executemany("UPDATE Rooms SET capacity = ? WHERE category = ?", [(capacity, category) for category, capacity in CAPACITIES.items()])
+
+
+# Наполнение базы синтетическими данными для бенчмарков
+def seed(conn, users=200, rooms_per_category=3, images_per_room=3, guests=500, orders_per_guest=2, rnd=None, migrated=True):
+    rnd = rnd or random.Random(42)
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO Users (telegram_id, first_name, last_name, username, admin) VALUES (?, ?, ?, ?, ?)",
+        [(telegram_id, f"User{telegram_id}", "Test", f"user{telegram_id}", 1 if telegram_id == ADMIN_ID else 0)
+         for telegram_id in range(1, users + 1)]
+    )
+    room_ids = []
+    for category in CATEGORIES:
+        for i in range(rooms_per_category):
+            cursor.execute(
+                "INSERT INTO Rooms (category, description, price, quantity, status) VALUES (?, ?, ?, ?, ?)",
+                (category, f"{category} номер №{i + 1} с видом на город", rnd.randint(50, 500), 1_000_000, "available")
+            )
+            room_id = cursor.execute("SELECT MAX(room_id) FROM Rooms").fetchone()[0]
+            room_ids.append(room_id)
+            cursor.executemany(
+                "INSERT INTO RoomImages (room_id, image_url) VALUES (?, ?)",
+                [(room_id, f"https://example.com/rooms/{room_id}/{n}.jpg") for n in range(images_per_room)]
+            )
+    cursor.executemany(
+        "INSERT INTO Services (name, price, short_description, detailed_description) VALUES (?, ?, ?, ?)",
+        [(name, price, name, f"{name}: подробное описание") for name, price, _ in SERVICES]
+    )
+    employee_rows = []
+    for position in sorted({position for _, _, position in SERVICES if position}):
+        for n in range(EMPLOYEES_PER_POSITION):
+            employee_rows.append((f"{position} {n + 1}", position, "+70000000000", f"staff{len(employee_rows)}@example.com"))
+    cursor.executemany(
+        "INSERT INTO Employees (full_name, position, contact_phone, work_email) VALUES (?, ?, ?, ?)",
+        employee_rows
+    )
+    if migrated:
+        seed_migrated_columns(cursor)
+    today = date.today()
+    guest_rows = []
+    for n in range(guests):
+        check_in = today + timedelta(days=rnd.randint(-300, 60))
+        check_out = check_in + timedelta(days=rnd.randint(1, 14))
+        guest_rows.append((
+            rnd.choice(room_ids), rnd.randint(1, users), "Гость", f"Тестовый{n}",
+            None, None, check_in, check_out, None
+        ))
+    cursor.executemany(
+        "INSERT INTO Guests (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment, booking_date) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())",
+        guest_rows
+    )
+    guest_ids = [row[0] for row in cursor.execute("SELECT guest_id FROM Guests").fetchall()]
+    order_rows = []
+    for guest_id in guest_ids:
+        for n in range(orders_per_guest):
+            order_rows.append((
+                guest_id, rnd.randint(1, len(SERVICES)), rnd.randint(1, 3),
+                f"2025-01-01 00:00:{n:02d}.000", rnd.choice(["pending", "completed", "canceled"])
+            ))
+    cursor.executemany(
+        "INSERT INTO GuestServices (guest_id, service_id, quantity, order_date, status) VALUES (?, ?, ?, ?, ?)",
+        order_rows
+    )
+    conn.commit()
+    return room_ids
@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import metrics
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+# Ротация и по размеру, и по времени: файл переключается при превышении max_bytes
+# или по истечении interval секунд, старые копии нумеруются как у RotatingFileHandler
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, interval=24 * 3600, encoding="utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+# Одна JSON-строка на запись; форматирование идёт в потоке QueueListener
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "site": f"{record.module}:{record.lineno}",
+        }
+        handler = getattr(record, "handler", None)
+        if handler and handler != "-":
+            entry["handler"] = handler
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Добавляет в запись значение contextvar (например, имя текущего обработчика)
+class ContextFilter(logging.Filter):
+    def __init__(self, name, var):
+        super().__init__()
+        self.attr = name
+        self.var = var
+
+    def filter(self, record):
+        setattr(record, self.attr, self.var.get())
+        return True
+
+
+# Ограничение частоты по месту вызова: token bucket на (файл, строка) для INFO и ниже.
+# Предупреждения и ошибки проходят всегда; число отброшенных записей попадает
+# в поле suppressed следующей пропущенной записи с того же места.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=10.0, burst=20, max_level=logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        self._sites = {}
+        # filter вызывается из потоков-источников записей и из QueueListener
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                self._sites[key] = [self.burst - 1, now, 0]
+                return True
+            tokens = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if tokens < 1:
+                site[0] = tokens
+                site[2] += 1
+                suppressed = True
+            else:
+                site[0] = tokens - 1
+                suppressed = False
+                if site[2]:
+                    record.suppressed = site[2]
+                    site[2] = 0
+        if suppressed:
+            metrics.LOG_SUPPRESSED.inc()
+            return False
+        return True
+
+
+# QueueHandler, который не блокирует event loop: при переполнении очереди запись
+# отбрасывается, а сообщение не форматируется повторно (очередь внутрипроцессная)
+class NonBlockingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_DROPPED.inc()
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(context=()):
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    file_handler = SizeAndTimeRotatingFileHandler(
+        os.getenv("LOG_FILE", "bot.log"),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUPS", "5")),
+        interval=float(os.getenv("LOG_ROTATE_HOURS", "24")) * 3600,
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    for name, var in context:
+        queue_handler.addFilter(ContextFilter(name, var))
+    queue_handler.addFilter(RateLimitFilter(
+        rate=float(os.getenv("LOG_RATE", "10")),
+        burst=int(os.getenv("LOG_BURST", "20")),
+    ))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Дописать очередь на диск при завершении процесса
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+# Автомат отключения для БД. После threshold подряд неудачных подключений (или
+# обрывов связи во время запроса) он размыкается: вызовы сразу получают отказ, не
+# дожидаясь таймаута входа ODBC. Через delay секунд один вызов пропускается пробой
+# (полуоткрытое состояние): удача замыкает автомат, неудача размыкает его снова
+# на вдвое больший срок, но не дольше max_delay. Счётчик неудач обнуляет только
+# успешный запрос (success): удачное подключение лишь замыкает автомат после пробы
+# (connected), иначе обрывы во время запросов между подключениями никогда бы не
+# набрали порог. Вызывается и из потоков asyncio.to_thread, поэтому состояние
+# меняется под блокировкой.
+class CircuitBreaker:
+    def __init__(self, threshold=3, base_delay=1.0, max_delay=60.0):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = base_delay
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        metrics.DB_BREAKER_STATE.set_function(lambda: STATE_VALUES[self.state])
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold=int(os.getenv("DB_BREAKER_THRESHOLD", "3")),
+            base_delay=float(os.getenv("DB_BREAKER_DELAY", "1")),
+            max_delay=float(os.getenv("DB_BREAKER_MAX_DELAY", "60")),
+        )
+
+    @property
+    def retry_in(self):
+        return max(0.0, self._retry_at - time.monotonic()) if self.state != CLOSED else 0.0
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self._retry_at:
+                self.state = HALF_OPEN
+                logging.info("БД: пробное подключение")
+                return True
+        metrics.DB_BREAKER_REJECTED.inc()
+        return False
+
+    def success(self):
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            if self.state != CLOSED:
+                logging.warning("БД снова доступна, автомат отключения замкнут")
+            self.state = CLOSED
+            self.failures = 0
+            self.delay = self.base_delay
+
+    def connected(self):
+        if self.state != CLOSED:
+            self.success()
+
+    def failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.delay = min(self.delay * 2, self.max_delay)
+                self._open()
+            elif self.state == CLOSED:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.delay = self.base_delay
+                    self._open()
+
+    def cancel_probe(self):
+        # Проба отменена вместе с вызвавшим её обработчиком — следующий вызов пробует снова
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self._retry_at = time.monotonic()
+
+    def _open(self):
+        self.state = OPEN
+        self._retry_at = time.monotonic() + self.delay
+        metrics.DB_BREAKER_OPENED.inc()
+        logging.error(f"БД недоступна, запросы отклоняются {self.delay:.0f} с")
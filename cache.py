@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+
+import metrics
+
+MISSING = object()
+
+
+# Кэш «ключ -> значение» с TTL и вытеснением давно не читанных записей (LRU).
+# Используется только из потока event loop, поэтому блокировки не нужны.
+class TTLCache:
+    def __init__(self, name, ttl=300.0, max_entries=10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._hit, self._miss = metrics.cache_counters(name)
+        self._invalidations = metrics.CACHE_INVALIDATIONS.labels(name)
+        metrics.CACHE_ENTRIES.labels(name).set_function(self.__len__)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=MISSING):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hit.inc()
+                return entry[1]
+            del self._entries[key]
+        self._miss.inc()
+        return default
+
+    def set(self, key, value, ttl=None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self._invalidations.inc()
+
+    def clear(self):
+        if self._entries:
+            self._invalidations.inc(len(self._entries))
+            self._entries.clear()
@@ -0,0 +1,99 @@
+import logging
+import time
+
+import db
+import metrics
+from singleflight import SingleFlight
+
+
+class Service:
+    __slots__ = ("service_id", "name", "price", "short_description", "position")
+
+    def __init__(self, row):
+        self.service_id = row.service_id
+        self.name = row.name
+        self.price = row.price
+        self.short_description = row.short_description
+        # Должность сотрудников, выполняющих услугу (см. staff.py)
+        self.position = row.position
+
+
+# Справочник услуг в памяти: таблица маленькая и меняется только из админки,
+# поэтому читается целиком один раз, а правки Services сбрасывают его (invalidate).
+# TTL страхует от изменений в обход бота. Из обработчиков справочник читается через
+# services_async: перечитывание уходит в поток, а одновременные промахи ждут одно чтение.
+# Пока БД недоступна, отдаётся последний прочитанный справочник (повтор через stale_retry секунд).
+class ServiceCatalog:
+    def __init__(self, ttl=600.0, stale_retry=5.0):
+        self.ttl = ttl
+        self.stale_retry = stale_retry
+        self._services = None
+        self._last = None
+        self._by_id = {}
+        self._expires_at = 0.0
+        self._generation = 0
+        self._flight = SingleFlight("services")
+        self._hit, self._miss = metrics.cache_counters("services")
+
+    @staticmethod
+    def _fetch():
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT service_id, name, price, short_description, position FROM Services ORDER BY service_id")
+            return [Service(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def _load(self):
+        try:
+            self._apply(self._fetch())
+        except db.DBError as e:
+            self._serve_stale(e)
+
+    def _apply(self, services):
+        self._services = self._last = services
+        self._by_id = {service.service_id: service for service in services}
+        self._expires_at = time.monotonic() + self.ttl
+        logging.info(f"Справочник услуг загружен: {len(services)}")
+
+    def _serve_stale(self, error):
+        if self._last is None:
+            raise error
+        self._services = self._last
+        self._by_id = {service.service_id: service for service in self._last}
+        self._expires_at = time.monotonic() + self.stale_retry
+        logging.warning(f"Справочник услуг не перечитан, используется прежний: {error}")
+
+    def services(self):
+        if self._services is None or time.monotonic() >= self._expires_at:
+            self._miss.inc()
+            self._load()
+        else:
+            self._hit.inc()
+        return self._services
+
+    async def services_async(self):
+        if self._services is not None and time.monotonic() < self._expires_at:
+            self._hit.inc()
+            return self._services
+        self._miss.inc()
+        generation = self._generation
+        try:
+            services = await self._flight.do(generation, self._fetch)
+        except db.DBError as e:
+            self._serve_stale(e)
+            return self._services
+        # Ключ — поколение: чтение, начатое до правки, не достаётся тем, кто пришёл после неё,
+        # и не перезаписывает сброшенный справочник
+        if generation == self._generation:
+            self._apply(services)
+        return services
+
+    def cached(self, service_id):
+        # Поиск в текущем снимке без перечитывания: для синхронного кода в event loop
+        return self._by_id.get(service_id)
+
+    def invalidate(self):
+        self._services = None
+        self._generation += 1
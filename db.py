@@ -0,0 +1,921 @@
+import asyncio
+import contextvars
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import metrics
+from breaker import CircuitBreaker
+
+try:
+    import pyodbc
+except ImportError:  # pyodbc нужен только для SQL Server
+    pyodbc = None
+
+try:
+    import aioodbc
+except ImportError:  # aioodbc нужен только для DB_ASYNC=aioodbc
+    aioodbc = None
+
+
+# БД недоступна: автомат отключения разомкнут, подключение даже не пробовали
+class DBUnavailable(Exception):
+    def __init__(self, retry_in):
+        super().__init__(f"БД недоступна, повтор через {retry_in:.0f} с")
+        self.retry_in = retry_in
+
+
+# Ошибки драйверов, которые обработчики ловят вместо pyodbc.Error
+DBError = (sqlite3.Error, DBUnavailable) + ((pyodbc.Error,) if pyodbc else ())
+
+# SQLSTATE обрыва связи (08xxx) и таймаутов (HYT00, HYT01): такие ошибки запроса
+# считаются отказом БД и размыкают автомат так же, как неудачные подключения
+OUTAGE_SQLSTATES = ("08", "HYT00", "HYT01")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SQL.sql")
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Имя обработчика, от имени которого сейчас выполняются запросы (ставит middleware в main.py)
+current_handler = contextvars.ContextVar("current_handler", default="-")
+# Ошибки подключения за время обработки апдейта: middleware в main.py кладёт сюда
+# список и по нему отвечает пользователю; потоки asyncio.to_thread видят тот же список
+connect_failures = contextvars.ContextVar("connect_failures", default=None)
+
+
+# Диалекты: запросы в коде пишутся на T-SQL, диалект переводит их для конкретной СУБД
+class Dialect:
+    name = "base"
+    rules = ()
+    table_exists_sql = "SELECT 1 FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = ?"
+
+    def __init__(self):
+        compiled = [(re.compile(pattern, re.IGNORECASE | re.MULTILINE), repl) for pattern, repl in self.rules]
+
+        @lru_cache(maxsize=2048)
+        def translate(sql):
+            for pattern, repl in compiled:
+                sql = pattern.sub(repl, sql)
+            return sql
+
+        self.translate = translate if compiled else str
+
+    def schema_batches(self, script):
+        # Пакеты T-SQL разделяются строкой GO
+        return [batch.strip() for batch in re.split(r"^\s*GO\s*$", script, flags=re.IGNORECASE | re.MULTILINE) if batch.strip()]
+
+
+class MSSQLDialect(Dialect):
+    name = "mssql"
+
+
+class SQLiteDialect(Dialect):
+    name = "sqlite"
+    table_exists_sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    rules = (
+        # В SQLite нет INCLUDE: включённые колонки дописываются в ключ индекса, покрытие то же
+        (r"\(([^()]*)\)\s*INCLUDE\s*\(([^()]*)\)", r"(\1, \2)"),
+        (r"\bINT\s+PRIMARY\s+KEY\s+IDENTITY\s*\(\s*1\s*,\s*1\s*\)", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+        (r"\bNVARCHAR\s*\(\s*MAX\s*\)", "TEXT"),
+        (r"\bCAST\s*\(\s*GETDATE\s*\(\s*\)\s+AS\s+DATE\s*\)", "date('now', 'localtime')"),
+        (r"\bGETDATE\s*\(\s*\)", "(strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))"),
+        (r"\bDATEDIFF\s*\(\s*day\s*,\s*([\w.]+)\s*,\s*([\w.]+)\s*\)", r"CAST(julianday(\2) - julianday(\1) AS INTEGER)"),
+        (r"\bCAST\s*\(\s*([\w.]+)\s+AS\s+DATE\s*\)", r"date(\1)"),
+        # Округление параметра до шага DATETIME SQL Server; в SQLite время хранится строкой как есть
+        (r"\bCAST\s*\(\s*\?\s+AS\s+DATETIME\s*\)", "?"),
+        # OFFSET n ROWS FETCH NEXT m ROWS ONLY -> LIMIT n, m (порядок параметров тот же)
+        (r"\bOFFSET\s+(\?|\d+)\s+ROWS\s+FETCH\s+NEXT\s+(\?|\d+)\s+ROWS\s+ONLY\b", r"LIMIT \1, \2"),
+        # INSERT ... OUTPUT INSERTED.col VALUES (...) -> INSERT ... VALUES (...) RETURNING col
+        (r"\bOUTPUT\s+INSERTED\.(\w+)\s+(VALUES\s*\([^;]*?\))\s*$", r"\2 RETURNING \1"),
+    )
+
+
+# Строки SQLite с доступом к колонкам через атрибуты, как у pyodbc.Row
+class SQLiteRow(sqlite3.Row):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except IndexError:
+            raise AttributeError(name) from None
+
+
+def _adapt_datetime(value):
+    # Тот же формат с миллисекундами, что даёт GETDATE() в SQLite
+    return value.strftime("%Y-%m-%d %H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _convert_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+
+
+# Обёртки над соединением и курсором драйвера с единым API для обработчиков
+class Cursor:
+    __slots__ = ("_cursor", "_translate")
+
+    def __init__(self, cursor, dialect):
+        self._cursor = cursor
+        self._translate = dialect.translate
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = params[0]
+        try:
+            self._cursor.execute(self._translate(sql), params)
+        except DBError as e:
+            report_query_error(e)
+            raise
+        report_query_success()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        try:
+            self._cursor.executemany(self._translate(sql), seq_of_params)
+        except DBError as e:
+            report_query_error(e)
+            raise
+        report_query_success()
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    __slots__ = ("_conn", "dialect")
+    cursor_class = Cursor
+
+    def __init__(self, conn, dialect):
+        self._conn = conn
+        self.dialect = dialect
+        metrics.DB_CONNECTIONS_OPEN.inc()
+
+    def cursor(self):
+        return self.cursor_class(self._conn.cursor(), self.dialect)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            metrics.DB_CONNECTIONS_OPEN.dec()
+
+
+_stats_lock = threading.Lock()
+
+
+class StatementStats:
+    __slots__ = ("handler", "sql", "errors", "rows", "execute", "fetch")
+
+    def __init__(self, handler, sql):
+        self.handler = handler
+        self.sql = sql
+        self.errors = 0
+        self.rows = 0
+        self.execute = metrics.LatencyHistogram()
+        self.fetch = metrics.LatencyHistogram()
+
+    # Курсоры работают и в потоках asyncio.to_thread: счётчики меняются под _stats_lock
+    def failed(self):
+        with _stats_lock:
+            self.errors += 1
+
+    def fetched(self, seconds, rows):
+        self.fetch.record(seconds)
+        with _stats_lock:
+            self.rows += rows
+
+    @property
+    def calls(self):
+        return self.execute.count
+
+    @property
+    def total_time(self):
+        return self.execute.total + self.fetch.total
+
+
+# Статистика SQL по паре (обработчик, текст запроса)
+class SQLStats:
+    MAX_ENTRIES = 2000
+
+    def __init__(self):
+        self.entries = {}
+        self.started_at = time.time()
+
+    def entry(self, handler, sql):
+        key = (handler, sql)
+        entry = self.entries.get(key)
+        if entry is None:
+            with _stats_lock:
+                entry = self.entries.get(key)
+                if entry is None and len(self.entries) >= self.MAX_ENTRIES:
+                    key = (handler, "<прочие запросы>")
+                    entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = StatementStats(*key)
+        return entry
+
+    def top(self, limit=10):
+        with _stats_lock:
+            entries = list(self.entries.values())
+        return sorted(entries, key=lambda e: e.total_time, reverse=True)[:limit]
+
+    def reset(self):
+        with _stats_lock:
+            self.entries = {}
+            self.started_at = time.time()
+
+
+SQL_STATS = SQLStats()
+
+
+class InstrumentedCursor(Cursor):
+    __slots__ = ("_entry",)
+
+    def __init__(self, cursor, dialect):
+        super().__init__(cursor, dialect)
+        self._entry = None
+
+    def execute(self, sql, *params):
+        entry = self._entry = SQL_STATS.entry(current_handler.get(), sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *params)
+        except DBError:
+            entry.failed()
+            raise
+        finally:
+            entry.execute.record(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params):
+        entry = self._entry = SQL_STATS.entry(current_handler.get(), sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        except DBError:
+            entry.failed()
+            raise
+        finally:
+            entry.execute.record(time.perf_counter() - started)
+
+    def _record_fetch(self, started, rows):
+        if self._entry is not None:
+            self._entry.fetched(time.perf_counter() - started, rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._record_fetch(started, row is not None)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._record_fetch(started, len(rows))
+        return rows
+
+    def fetchmany(self, size):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        self._record_fetch(started, len(rows))
+        return rows
+
+
+class InstrumentedConnection(Connection):
+    __slots__ = ()
+    cursor_class = InstrumentedCursor
+
+
+# Инструментирование можно отключить через DB_INSTRUMENT=0
+def default_connection_class():
+    return Connection if os.getenv("DB_INSTRUMENT", "1") == "0" else InstrumentedConnection
+
+
+# Бэкенды
+class MSSQLBackend:
+    name = "mssql"
+    connection_class = Connection
+
+    def __init__(self, connection_string, login_timeout=5, query_timeout=30):
+        if pyodbc is None:
+            raise RuntimeError("Для DB_BACKEND=mssql требуется пакет pyodbc")
+        self.connection_string = connection_string
+        self.login_timeout = login_timeout
+        self.query_timeout = query_timeout
+        self.dialect = MSSQLDialect()
+        self.connection_class = default_connection_class()
+
+    @staticmethod
+    def connection_string_from_env():
+        return (
+            f"DRIVER={{{os.getenv('DB_DRIVER')}}};"
+            f"SERVER={os.getenv('DB_SERVER')};"
+            f"DATABASE={os.getenv('DB_NAME')};"
+            f"UID={os.getenv('DB_USER')};"
+            f"PWD={os.getenv('DB_PASSWORD')};"
+            f"TrustServerCertificate={os.getenv('DB_TRUST_CERT')}"
+        )
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            cls.connection_string_from_env(),
+            login_timeout=int(os.getenv("DB_LOGIN_TIMEOUT", "5")),
+            query_timeout=int(os.getenv("DB_QUERY_TIMEOUT", "30")),
+        )
+
+    def connect(self):
+        # timeout у connect — таймаут входа, у соединения — таймаут каждого запроса (0 — без ограничения)
+        conn = pyodbc.connect(self.connection_string, timeout=self.login_timeout)
+        conn.timeout = self.query_timeout
+        return self.connection_class(conn, self.dialect)
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    connection_class = Connection
+
+    def __init__(self, path="urban_stay.sqlite3", schema_path=SCHEMA_PATH, auto_migrate=True):
+        self.dialect = SQLiteDialect()
+        self.connection_class = default_connection_class()
+        self.schema_path = schema_path
+        self.auto_migrate = auto_migrate
+        self._keeper = None
+        if path == ":memory:":
+            # Общая in-memory база живёт, пока открыто хотя бы одно соединение
+            self.target = f"file:urban_stay_{id(self)}?mode=memory&cache=shared"
+            self.uri = True
+            self._keeper = self._open()
+        else:
+            self.target = path
+            self.uri = False
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("DB_PATH", "urban_stay.sqlite3"))
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.target,
+            uri=self.uri,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        conn.row_factory = SQLiteRow
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def ensure_schema(self, conn):
+        exists = conn.execute(self.dialect.table_exists_sql, ("Users",)).fetchone()
+        if not exists:
+            with open(self.schema_path, encoding="utf-8") as f:
+                script = f.read()
+            for batch in self.dialect.schema_batches(script):
+                conn.executescript(self.dialect.translate(batch))
+            conn.commit()
+            logging.info(f"Схема SQLite создана из {self.schema_path}")
+
+    def _prepare(self, conn):
+        if not self.uri:
+            # WAL: читатели из потоков не блокируют фиксацию записи (режим сохраняется в файле)
+            conn._conn.execute("PRAGMA journal_mode=WAL")
+        self.ensure_schema(conn._conn)
+        if self.auto_migrate:
+            migrate(conn)
+
+    def connect(self):
+        conn = self.connection_class(self._open(), self.dialect)
+        if not self._schema_ready:
+            # Первые подключения из разных потоков ждут готовую схему; после
+            # неудачи подготовка повторится при следующем подключении
+            try:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        self._prepare(conn)
+                        self._schema_ready = True
+            except BaseException:
+                conn.close()
+                raise
+        return conn
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+
+BACKENDS = {
+    "mssql": MSSQLBackend,
+    "sqlite": SQLiteBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = os.getenv("DB_BACKEND", "mssql").lower()
+        if name not in BACKENDS:
+            raise RuntimeError(f"Неизвестный DB_BACKEND: {name}")
+        _backend = BACKENDS[name].from_env()
+        logging.info(f"Используется бэкенд БД: {name}")
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    if _backend is not None and _backend is not backend:
+        _backend.close()
+    _backend = backend
+    return backend
+
+
+def close_backend():
+    # При остановке: если к БД ни разу не обращались, бэкенд не создаётся
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+
+
+_breaker = None
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker.from_env()
+    return _breaker
+
+
+def set_breaker(breaker):
+    global _breaker
+    _breaker = breaker
+    return breaker
+
+
+def is_outage(error):
+    if pyodbc is None or not isinstance(error, pyodbc.Error) or not error.args:
+        return False
+    return str(error.args[0]).startswith(OUTAGE_SQLSTATES)
+
+
+def report_query_error(error):
+    if is_outage(error):
+        get_breaker().failure()
+
+
+def report_query_success():
+    get_breaker().success()
+
+
+def _connect_failed(error):
+    failures = connect_failures.get()
+    if failures is not None:
+        failures.append(error)
+    if isinstance(error, DBUnavailable):
+        return
+    metrics.DB_CONNECT_ERRORS.inc()
+    get_breaker().failure()
+
+
+def _admit():
+    breaker = get_breaker()
+    if not breaker.allow():
+        error = DBUnavailable(breaker.retry_in)
+        _connect_failed(error)
+        raise error
+    return breaker
+
+
+def connect():
+    breaker = _admit()
+    started = time.perf_counter()
+    try:
+        conn = get_backend().connect()
+    except Exception as e:
+        _connect_failed(e)
+        raise
+    breaker.connected()
+    metrics.DB_CONNECT_LATENCY.observe(time.perf_counter() - started)
+    metrics.DB_CONNECTIONS.inc()
+    return conn
+
+
+# Асинхронный API: те же методы, что у Connection и Cursor, но с await.
+# Под ним — соединение драйвера с интерфейсом aioodbc (await cursor(), execute(),
+# fetchall(), commit() ...). SQL переводится диалектом и попадает в SQL_STATS,
+# как у синхронных соединений.
+class AsyncCursor:
+    __slots__ = ("_cursor", "_translate", "_entry")
+
+    def __init__(self, cursor, dialect):
+        self._cursor = cursor
+        self._translate = dialect.translate
+        self._entry = None
+
+    async def _execute(self, method, sql, params):
+        entry = self._entry = SQL_STATS.entry(current_handler.get(), sql)
+        started = time.perf_counter()
+        try:
+            await method(self._translate(sql), params)
+        except DBError as e:
+            entry.failed()
+            report_query_error(e)
+            raise
+        finally:
+            entry.execute.record(time.perf_counter() - started)
+        report_query_success()
+        return self
+
+    async def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = params[0]
+        return await self._execute(self._cursor.execute, sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self._execute(self._cursor.executemany, sql, seq_of_params)
+
+    async def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            result = await method(*args)
+        except DBError as e:
+            if self._entry is not None:
+                self._entry.failed()
+            report_query_error(e)
+            raise
+        if self._entry is not None:
+            self._entry.fetched(time.perf_counter() - started, len(result) if isinstance(result, list) else result is not None)
+        return result
+
+    async def fetchone(self):
+        return await self._fetch(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await self._fetch(self._cursor.fetchall)
+
+    async def fetchmany(self, size):
+        return await self._fetch(self._cursor.fetchmany, size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    async def close(self):
+        await self._cursor.close()
+
+
+class AsyncConnection:
+    __slots__ = ("_conn", "dialect", "_release")
+
+    def __init__(self, conn, dialect, release):
+        self._conn = conn
+        self.dialect = dialect
+        self._release = release
+
+    async def cursor(self):
+        return AsyncCursor(await self._conn.cursor(), self.dialect)
+
+    async def commit(self):
+        await self._conn.commit()
+
+    async def rollback(self):
+        await self._conn.rollback()
+
+    async def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await self._release(conn)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+# Синхронный драйвер за интерфейсом aioodbc: каждый вызов занимает поток пула
+# asyncio.to_thread на время обращения к БД
+class _ThreadedCursor:
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, sql, params):
+        await asyncio.to_thread(self._cursor.execute, sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        await asyncio.to_thread(self._cursor.executemany, sql, seq_of_params)
+
+    async def fetchone(self):
+        return await asyncio.to_thread(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await asyncio.to_thread(self._cursor.fetchall)
+
+    async def fetchmany(self, size):
+        return await asyncio.to_thread(self._cursor.fetchmany, size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    async def close(self):
+        self._cursor.close()
+
+
+class _ThreadedConnection:
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        # conn — Connection синхронного бэкенда; курсоры берутся у драйвера напрямую,
+        # перевод SQL и статистику делает AsyncCursor
+        self._conn = conn
+
+    async def cursor(self):
+        return _ThreadedCursor(self._conn._conn.cursor())
+
+    async def commit(self):
+        await asyncio.to_thread(self._conn.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self._conn.rollback)
+
+
+# DB_ASYNC=threads (по умолчанию): асинхронный API поверх синхронного бэкенда
+class ThreadedAsyncBackend:
+    name = "threads"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def connect(self):
+        conn = await asyncio.to_thread(self.backend.connect)
+        return AsyncConnection(_ThreadedConnection(conn), conn.dialect, self._release)
+
+    @staticmethod
+    async def _release(conn):
+        await asyncio.to_thread(conn._conn.close)
+
+    async def close(self):
+        pass
+
+
+# DB_ASYNC=aioodbc: пул соединений aioodbc (DB_POOL_MIN..DB_POOL_MAX), соединения
+# возвращаются в него при close(). aioodbc — обёртка над pyodbc: каждый вызов драйвера
+# он выполняет в executor event loop, то есть в том же пуле потоков по умолчанию, что и
+# asyncio.to_thread, и на время ожидания сервера поток так же занят. Выигрыш по сравнению
+# с DB_ASYNC=threads — пул готовых соединений вместо входа на каждый запрос, а не
+# освобождение потоков. driver — модуль с интерфейсом aioodbc (create_pool), в
+# бенчмарке — заглушка.
+class AioODBCBackend:
+    name = "aioodbc"
+
+    def __init__(self, connection_string, minsize=1, maxsize=20, login_timeout=5, driver=None, dialect=None):
+        driver = driver or aioodbc
+        if driver is None:
+            raise RuntimeError("Для DB_ASYNC=aioodbc требуется пакет aioodbc")
+        self.connection_string = connection_string
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.login_timeout = login_timeout
+        self.driver = driver
+        self.dialect = dialect or MSSQLDialect()
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            MSSQLBackend.connection_string_from_env(),
+            minsize=int(os.getenv("DB_POOL_MIN", "1")),
+            maxsize=int(os.getenv("DB_POOL_MAX", "20")),
+            login_timeout=int(os.getenv("DB_LOGIN_TIMEOUT", "5")),
+        )
+
+    async def _get_pool(self):
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await self.driver.create_pool(
+                    dsn=self.connection_string, minsize=self.minsize, maxsize=self.maxsize,
+                    autocommit=False, timeout=self.login_timeout
+                )
+        return self._pool
+
+    async def connect(self):
+        pool = await self._get_pool()
+        conn = await pool.acquire()
+        metrics.DB_CONNECTIONS_OPEN.inc()
+        return AsyncConnection(conn, self.dialect, self._release)
+
+    async def _release(self, conn):
+        metrics.DB_CONNECTIONS_OPEN.dec()
+        # Незафиксированная транзакция не должна достаться следующему владельцу соединения.
+        # Если откат не прошёл (или прерван отменой), соединение закрывается: пул не выдаст
+        # закрытое повторно. Ошибка отката только логируется — из close()/__aexit__ она
+        # подменила бы исключение обработчика
+        broken = True
+        try:
+            await conn.rollback()
+            broken = False
+        except Exception as e:
+            logging.warning(f"Откат при возврате соединения в пул не удался, соединение закрыто: {e}")
+        finally:
+            try:
+                if broken:
+                    await conn.close()
+            except Exception as e:
+                logging.warning(f"Ошибка закрытия соединения: {e}")
+            finally:
+                await self._pool.release(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.close()
+            await pool.wait_closed()
+
+
+# Асинхронный бэкенд используют только чтения через aconnect() (категории и номера
+# категории в «Доступных номерах»); остальные обработчики работают через
+# синхронный connect() и бэкенд DB_BACKEND независимо от DB_ASYNC
+_async_backend = None
+
+
+def get_async_backend():
+    global _async_backend
+    if _async_backend is None:
+        name = os.getenv("DB_ASYNC", "threads").lower()
+        if name == "aioodbc":
+            _async_backend = AioODBCBackend.from_env()
+        elif name == "threads":
+            _async_backend = ThreadedAsyncBackend(get_backend())
+        else:
+            raise RuntimeError(f"Неизвестный DB_ASYNC: {name}")
+        logging.info(f"Асинхронный доступ к БД: {name}")
+    return _async_backend
+
+
+def set_async_backend(backend):
+    global _async_backend
+    _async_backend = backend
+    return backend
+
+
+async def aconnect():
+    breaker = _admit()
+    started = time.perf_counter()
+    try:
+        conn = await get_async_backend().connect()
+    except asyncio.CancelledError:
+        breaker.cancel_probe()
+        raise
+    except Exception as e:
+        _connect_failed(e)
+        raise
+    breaker.connected()
+    metrics.DB_CONNECT_LATENCY.observe(time.perf_counter() - started)
+    metrics.DB_CONNECTIONS.inc()
+    return conn
+
+
+async def close_async_backend():
+    if _async_backend is not None:
+        await _async_backend.close()
+
+
+# Миграции: файлы migrations/NNNN_описание.sql, применяются по возрастанию номера.
+# Применённые версии записываются в schema_version, поэтому повторный запуск ничего не делает.
+# Каждый пакет (разделитель GO) должен содержать одну инструкцию — так их выполняют оба драйвера.
+class Migration:
+    __slots__ = ("version", "name", "path")
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def batches(self, dialect):
+        with open(self.path, encoding="utf-8") as f:
+            return dialect.schema_batches(f.read())
+
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE schema_version (
+    version INT PRIMARY KEY,
+    name NVARCHAR(255) NOT NULL,
+    applied_at DATETIME DEFAULT GETDATE()
+)
+"""
+
+
+def load_migrations(path=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(path):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(path, filename)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся номера миграций в {path}")
+    return migrations
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    if not cursor.execute(conn.dialect.table_exists_sql, ("schema_version",)).fetchone():
+        cursor.execute(SCHEMA_VERSION_DDL)
+        conn.commit()
+        return set()
+    return {row[0] for row in cursor.execute("SELECT version FROM schema_version").fetchall()}
+
+
+def migrate(conn=None, path=MIGRATIONS_DIR):
+    own = conn is None
+    if own:
+        conn = connect()
+    try:
+        done = applied_versions(conn)
+        applied = []
+        cursor = conn.cursor()
+        for migration in load_migrations(path):
+            if migration.version in done:
+                continue
+            try:
+                # Запись о версии идёт первой: она открывает транзакцию, и DDL миграции
+                # фиксируется вместе с ней или откатывается целиком
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (migration.version, migration.name)
+                )
+                for batch in migration.batches(conn.dialect):
+                    cursor.execute(batch)
+                conn.commit()
+            except DBError:
+                conn.rollback()
+                logging.error(f"Миграция {migration.version:04d}_{migration.name} не применена")
+                raise
+            logging.info(f"Применена миграция {migration.version:04d}_{migration.name}")
+            applied.append(migration)
+        return applied
+    finally:
+        if own:
+            conn.close()
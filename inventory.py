@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+import db
+from analytics import as_date
+
+WATERMARK = "room_release"
+
+# Один UPDATE на пачку: сколько броней по каждому номеру закончилось в окне дат выезда
+RELEASE_ROOMS_SQL = """
+    UPDATE Rooms
+    SET quantity = quantity + t.released
+    FROM (
+        SELECT room_id, COUNT(*) AS released
+        FROM Guests
+        WHERE holds_room = 1 AND check_out_date > ? AND check_out_date <= ?
+        GROUP BY room_id
+    ) AS t
+    WHERE t.room_id = Rooms.room_id
+"""
+
+# Те же брони по категориям — для живых агрегатов аналитики
+RELEASED_CATEGORIES_SQL = """
+    SELECT r.category, COUNT(*) AS released
+    FROM Guests g
+    JOIN Rooms r ON r.room_id = g.room_id
+    WHERE g.holds_room = 1 AND g.check_out_date > ? AND g.check_out_date <= ?
+    GROUP BY r.category
+"""
+
+RELEASE_GUESTS_SQL = """
+    UPDATE Guests
+    SET holds_room = 0
+    WHERE holds_room = 1 AND check_out_date > ? AND check_out_date <= ?
+"""
+
+
+def read_watermark(cursor):
+    cursor.execute("SELECT last_day FROM RollupWatermarks WHERE name = ?", (WATERMARK,))
+    row = cursor.fetchone()
+    return row.last_day if row else None
+
+
+# Возврат номеров после выезда: finalize_booking уменьшает Rooms.quantity и ставит
+# Guests.holds_room = 1, задача возвращает номера по броням, выезд которых уже наступил.
+# Окно дат выезда (водяной знак, сегодня] обрабатывается пачками по batch_days:
+# в каждой пачке один UPDATE Rooms по агрегату, снятие holds_room и сдвиг водяного
+# знака — одна короткая транзакция, так что блокировки Rooms держатся недолго, а
+# повторный прогон ничего не вернёт дважды (флаг уже снят, водяной знак сдвинут).
+# on_release(released, started) получает возвращённые номера по категориям и
+# perf_counter начала прогона.
+class InventoryReleaseJob:
+    title = "Возврат номеров"
+
+    def __init__(self, interval=900.0, batch_days=7, pause=0.2, on_release=None):
+        self.interval = interval
+        self.batch_days = batch_days
+        self.pause = pause
+        self.on_release = on_release
+        self.last_run = None
+        self.last_error = None
+        self._task = None
+        self._running = False
+        self._closing = threading.Event()
+
+    @classmethod
+    def from_env(cls, on_release=None):
+        return cls(
+            interval=float(os.getenv("ROOM_RELEASE_INTERVAL", "900")),
+            batch_days=int(os.getenv("ROOM_RELEASE_BATCH_DAYS", "7")),
+            on_release=on_release,
+        )
+
+    def _apply_batch(self, conn, start, end):
+        cursor = conn.cursor()
+        params = (start, end)
+        cursor.execute(RELEASED_CATEGORIES_SQL, params)
+        released = {row.category: row.released for row in cursor.fetchall()}
+        cursor.execute(RELEASE_ROOMS_SQL, params)
+        cursor.execute(RELEASE_GUESTS_SQL, params)
+        cursor.execute("UPDATE RollupWatermarks SET last_day = ? WHERE name = ?", (end, WATERMARK))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO RollupWatermarks (name, last_day) VALUES (?, ?)", (WATERMARK, end))
+        conn.commit()
+        return released
+
+    def run_once(self, today=None):
+        today = today or date.today()
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            watermark = read_watermark(cursor)
+            if watermark is None:
+                cursor.execute("SELECT MIN(check_out_date) FROM Guests WHERE holds_room = 1")
+                first = cursor.fetchone()[0]
+                if first is None:
+                    return {}
+                watermark = as_date(first) - timedelta(days=1)
+            released = {}
+            start = watermark
+            while start < today and not self._closing.is_set():
+                end = min(start + timedelta(days=self.batch_days), today)
+                try:
+                    for category, count in self._apply_batch(conn, start, end).items():
+                        released[category] = released.get(category, 0) + count
+                except db.DBError:
+                    conn.rollback()
+                    raise
+                start = end
+                if start < today and self.pause:
+                    time.sleep(self.pause)
+            if released:
+                logging.info(f"Возвращено номеров после выезда: {sum(released.values())} (по {today})")
+            return released
+        finally:
+            conn.close()
+
+    async def _loop(self):
+        while not self._closing.is_set():
+            started = time.perf_counter()
+            self._running = True
+            try:
+                released = await asyncio.to_thread(self.run_once)
+                self.last_error = None
+                if released and self.on_release:
+                    self.on_release(released, started)
+            except db.DBError as e:
+                self.last_error = str(e)
+                logging.error(f"Ошибка возврата номеров после выезда: {e}")
+            finally:
+                self._running = False
+            self.last_run = time.time()
+            if self._closing.is_set():
+                return
+            await asyncio.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def start(self):
+        self._closing.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self, timeout):
+        # Прогон, идущий в потоке, дописывает текущую пачку (у каждой своя транзакция)
+        # и останавливается; оставшиеся дни догонит следующий запуск бота
+        self._closing.set()
+        if self._task is not None and self._running:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"{self.title}: остановка по таймауту")
+        self.stop()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import metrics
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StallOffender:
+    __slots__ = ("site", "count", "total", "max", "stack")
+
+    def __init__(self, site):
+        self.site = site
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.stack = []
+
+
+# Сторожевой таймер event loop. Корутина-«сердцебиение» каждые interval секунд отмечает,
+# что loop жив, и меряет задержку пробуждения. Фоновый поток проверяет отметку; если
+# loop не отвечает дольше threshold, поток снимает стек потока loop — это и есть
+# блокирующий вызов (pyodbc, запись на диск и т.п.). Когда loop оживает, сердцебиение
+# записывает длительность зависания на место, где он был снят.
+class LoopMonitor:
+    def __init__(self, interval=0.1, threshold=0.25, max_offenders=100):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_offenders = max_offenders
+        self.stalls = metrics.LatencyHistogram()
+        self.offenders = {}
+        self.started_at = time.time()
+        self._last_beat = time.monotonic()
+        self._pending_stack = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            interval=float(os.getenv("LOOP_HEARTBEAT", "0.1")),
+            threshold=float(os.getenv("LOOP_STALL_THRESHOLD", "0.25")),
+        )
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._last_beat = time.monotonic()
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            metrics.LOOP_LAG.observe(lag)
+            metrics.LOOP_LAG_LAST.set(lag)
+            stack, self._pending_stack = self._pending_stack, None
+            if lag >= self.threshold:
+                self._record_stall(lag, stack)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled >= self.threshold and self._pending_stack is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._pending_stack = traceback.extract_stack(frame)
+                    del frame
+
+    @staticmethod
+    def _site(stack):
+        # Самый глубокий кадр из кода проекта (main.py, db.py, ...) — виновник зависания
+        for entry in reversed(stack):
+            if entry.filename.startswith(PROJECT_DIR) and not entry.filename.endswith("loop_monitor.py"):
+                return f"{os.path.basename(entry.filename)}:{entry.name}:{entry.lineno}"
+        return f"{os.path.basename(stack[-1].filename)}:{stack[-1].name}:{stack[-1].lineno}" if stack else "неизвестно"
+
+    def _record_stall(self, lag, stack):
+        self.stalls.record(lag)
+        metrics.LOOP_STALLS.inc()
+        site = self._site(stack) if stack else "не снят"
+        offender = self.offenders.get(site)
+        if offender is None:
+            if len(self.offenders) >= self.max_offenders:
+                return
+            offender = self.offenders[site] = StallOffender(site)
+        offender.count += 1
+        offender.total += lag
+        if lag >= offender.max:
+            offender.max = lag
+            offender.stack = traceback.format_list(stack[-8:]) if stack else []
+        logging.warning(f"Event loop заблокирован на {lag * 1000:.0f} мс: {site}")
+
+    def top(self, limit=5):
+        return sorted(self.offenders.values(), key=lambda o: o.total, reverse=True)[:limit]
+
+    def reset(self):
+        self.stalls = metrics.LatencyHistogram()
+        self.offenders = {}
+        self.started_at = time.time()
+
@@ -1,51 +1,209 @@
 import logging
 import asyncio
-import pyodbc
+import contextvars
 import os
+import re
+import time
+from functools import partial
+import cache
+import db
+import metrics
+from telegram_session import TelegramRequestMiddleware
+from bot_logging import setup_logging
+from loop_monitor import LoopMonitor
+from profiler import SamplingProfiler
+from rendering import send_parts
+from analytics import LiveAnalytics, as_date, as_money
+from rollups import DailyRollupJob, revenue_report, rewind_watermark
+from catalog import ServiceCatalog
+from staff import Order, StaffQueue, order_timestamp
+from reminders import CHECKIN, ReminderScheduler
+from inventory import InventoryReleaseJob
+from room_index import RoomIndex
+from singleflight import SingleFlight
+from admin_tables import TABLES, USERS, ROOMS, ROOM_IMAGES, GUESTS, SERVICES, GUEST_SERVICES
+from shutdown import InFlightUpdates, load_fsm, save_fsm
 from aiogram import Bot, Dispatcher, types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, CallbackQuery, BufferedInputFile
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InlineQueryResultCachedPhoto, InlineQueryResultPhoto, InputTextMessageContent
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram import Router
+from aiogram import Router, BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("bot.log"), logging.StreamHandler()]
-)
+# Загрузка переменных окружения
+load_dotenv()
+
+# Настройка логирования: запись на диск в фоновом потоке через очередь
+log_listener = setup_logging(context=(("handler", db.current_handler),))
 
 router = Router()
 
-# Загрузка переменных окружения и инициализация бота
-load_dotenv()
+# Инициализация бота
 API_TOKEN = os.getenv('TOKEN')
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 dp.include_router(router)
 
-# Функция подключения к базе данных
+# Действие из callback_data без идентификаторов: "editrow_room_5" -> "editrow_room"
+def callback_action(data):
+    parts = []
+    for part in data.split("_"):
+        if any(ch.isdigit() for ch in part):
+            break
+        parts.append(part)
+    return "_".join(parts) or data
+
+# Middleware: помечает SQL-запросы именем обработчика (для /dbstats) и собирает метрики.
+# Дочерние метрики привязываются один раз на имя обработчика и дальше берутся из словаря.
+class HandlerTagMiddleware(BaseMiddleware):
+    def __init__(self, update_type):
+        self.update_type = update_type
+        self._children = {}
+
+    def _bind(self, name):
+        children = self._children[name] = (
+            metrics.UPDATES.labels(self.update_type, name),
+            metrics.HANDLER_LATENCY.labels(name),
+            metrics.HANDLER_ERRORS.labels(name),
+        )
+        return children
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        if isinstance(event, CallbackQuery) and event.data:
+            name = f"{name}:{callback_action(event.data)}"
+        updates, latency, errors = self._children.get(name) or self._bind(name)
+        token = db.current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+            updates.inc()
+            db.current_handler.reset(token)
+
+# Сообщения, отправленные или изменённые ботом при обработке текущего апдейта
+sent_replies = contextvars.ContextVar("sent_replies", default=None)
+
+class ReplyCounter(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        replies = sent_replies.get()
+        if replies is not None and method.__api_method__.startswith(("send", "edit")):
+            replies.append(method.__api_method__)
+        return result
+
+def db_failure_text(failures=None):
+    failures = db.connect_failures.get() if failures is None else failures
+    unavailable = [e for e in failures or () if isinstance(e, db.DBUnavailable)]
+    if unavailable:
+        return (
+            "⚠️ Сервис временно недоступен: нет связи с базой данных. "
+            f"Попробуйте через {max(1, round(unavailable[-1].retry_in))} с."
+        )
+    return "Ошибка подключения к базе данных."
+
+# Middleware: если обработчик не смог подключиться к БД и ничего не ответил (данные
+# не нашлись и в кэше), пользователь получает ответ о недоступности сервиса.
+# При разомкнутом автомате отключения БД (db.get_breaker) отказ приходит сразу.
+class DBFailureMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        failures = []
+        replies = []
+        failures_token = db.connect_failures.set(failures)
+        replies_token = sent_replies.set(replies)
+        try:
+            return await handler(event, data)
+        finally:
+            db.connect_failures.reset(failures_token)
+            sent_replies.reset(replies_token)
+            message = event.message if isinstance(event, CallbackQuery) else event
+            if failures and not replies and message is not None:
+                try:
+                    await message.answer(db_failure_text(failures))
+                except TelegramAPIError as e:
+                    logging.error(f"Не удалось сообщить о недоступности БД: {e}")
+
+# Inner-middleware диспетчера действует и на обработчики вложенного router
+dp.message.middleware(HandlerTagMiddleware("message"))
+dp.callback_query.middleware(HandlerTagMiddleware("callback_query"))
+dp.inline_query.middleware(HandlerTagMiddleware("inline_query"))
+dp.message.middleware(DBFailureMiddleware())
+dp.callback_query.middleware(DBFailureMiddleware())
+
+# Апдейты в обработке: при остановке бот дожидается их не дольше SHUTDOWN_TIMEOUT секунд
+in_flight = InFlightUpdates()
+dp.update.outer_middleware(in_flight)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "25"))
+# Снимок состояний FSM между остановкой и следующим запуском
+FSM_SNAPSHOT_PATH = os.getenv("FSM_SNAPSHOT", "fsm_state.json")
+
+# Метрики, повторы и общая пауза после 429 для всех вызовов Bot API
+bot.session.middleware(TelegramRequestMiddleware.from_env())
+bot.session.middleware(ReplyCounter())
+
+# Сторожевой таймер event loop (отчёт — команда /loopstats)
+loop_monitor = LoopMonitor.from_env()
+
+# Профилировщик для команды /profile
+profiler = SamplingProfiler(interval=float(os.getenv("PROFILE_INTERVAL", "0.005")))
+PROFILE_MAX_SECONDS = 120
+
+# Живые агрегаты для раздела «Аналитика» админ-панели
+analytics = LiveAnalytics()
+
+# Справочник услуг в памяти (список услуг и корзина заказа)
+service_catalog = ServiceCatalog(ttl=float(os.getenv("SERVICES_CACHE_TTL", "600")))
+
+# Назначение заказов услуг наименее загруженным сотрудникам
+staff = StaffQueue(ttl=float(os.getenv("STAFF_RELOAD_INTERVAL", "300")))
+
+# Напоминания гостям о заезде и выезде
+reminders = ReminderScheduler.from_env()
+
+# Индекс каталога номеров для фильтров /rooms
+room_index = RoomIndex(ttl=float(os.getenv("ROOM_INDEX_TTL", "600")))
+ROOM_SEARCH_PAGE_SIZE = 5
+# Inline-поиск (@бот люкс): до 50 результатов на ответ, Telegram кэширует ответ cache_time секунд
+INLINE_PAGE_SIZE = 20
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+
+# Одновременные одинаковые чтения каталога номеров (наплыв после рассылки) — одним запросом к БД
+room_reads = SingleFlight("rooms")
+
+def invalidate_room_catalog():
+    analytics.invalidate()
+    room_index.invalidate()
+
+# Возвращённые номера добавляются к свободному остатку в аналитике без пересборки
+def rooms_released(released, since):
+    analytics.record_release(released, since)
+    room_index.invalidate()
+
+# Возврат номеров в продажу после выезда; остатки в аналитике и индексе номеров обновятся
+inventory_job = InventoryReleaseJob.from_env(on_release=rooms_released)
+
+# Фоновая задача дневных сводок для финансовых отчётов (команда /revenue)
+rollup_job = DailyRollupJob.from_env()
+ZERO = Decimal(0)
+
+# Функция подключения к базе данных (бэкенд выбирается переменной DB_BACKEND).
+# Отказ разомкнутого автомата не логируется: о размыкании уже написал db.get_breaker()
 def connect_to_db():
     try:
-        driver = os.getenv("DB_DRIVER")
-        server = os.getenv("DB_SERVER")
-        database = os.getenv("DB_NAME")
-        username = os.getenv("DB_USER")
-        password = os.getenv("DB_PASSWORD")
-        trust_cert = os.getenv("DB_TRUST_CERT")
-        conn = pyodbc.connect(
-            f"DRIVER={{{driver}}};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            f"UID={username};"
-            f"PWD={password};"
-            f"TrustServerCertificate={trust_cert}"
-        )
-        return conn
-    except pyodbc.Error as e:
+        return db.connect()
+    except db.DBUnavailable:
+        return None
+    except db.DBError as e:
         logging.error(f"Ошибка подключения к базе данных: {e}")
         return None
 
@@ -57,7 +215,7 @@ def check_user_exists(telegram_id):
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM Users WHERE telegram_id = ?", (telegram_id,))
             return cursor.fetchone() is not None
-        except pyodbc.Error as e:
+        except db.DBError as e:
             logging.error(f"Ошибка при проверке пользователя: {e}")
         finally:
             conn.close()
@@ -74,11 +232,15 @@ def add_user(telegram_id, first_name, last_name, username, admin=0):
             )
             conn.commit()
             logging.info(f"Пользователь {first_name} {last_name} (ID: {telegram_id}) добавлен.")
-        except pyodbc.Error as e:
+        except db.DBError as e:
             logging.error(f"Ошибка при добавлении пользователя: {e}")
         finally:
             conn.close()
 
+# Администраторы по последней успешной проверке: пока БД недоступна, админ-панель
+# с данными из памяти (аналитика) остаётся доступна
+known_admins = set()
+
 def is_admin(telegram_id):
     conn = connect_to_db()
     if conn:
@@ -88,14 +250,148 @@ def is_admin(telegram_id):
             result = cursor.fetchone()
             admin_status = result and result[0] == 1
             logging.info(f"Проверка админа для ID {telegram_id}: {'Админ' if admin_status else 'Не админ'}")
+            if admin_status:
+                known_admins.add(telegram_id)
+            else:
+                known_admins.discard(telegram_id)
             return admin_status
-        except pyodbc.Error as e:
+        except db.DBError as e:
             logging.error(f"Ошибка проверки админа для ID {telegram_id}: {e}")
-            return False
+            return telegram_id in known_admins
         finally:
             conn.close()
-    logging.error(f"Не удалось подключиться к БД для проверки админа ID {telegram_id}")
-    return False
+    return telegram_id in known_admins
+
+# Страницы бронирований и услуг гостя. Из БД читается только запрошенная страница
+# и одна строка сверх неё — признак следующей страницы. Страницы кэшируются под
+# telegram_id: кэш сбрасывается при изменении Guests/GuestServices этого пользователя,
+# TTL страхует от правок в обход бота.
+GUEST_PAGE_SIZE = 10
+guest_overview_cache = cache.TTLCache(
+    "guest_overview",
+    ttl=float(os.getenv("GUEST_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("GUEST_CACHE_SIZE", "10000")),
+)
+
+GUEST_PAGE_QUERIES = {
+    # Все бронирования, новые первыми
+    "bookings": """
+        SELECT guest_id, room_id, check_in_date, check_out_date
+        FROM Guests
+        WHERE telegram_id = ?
+        ORDER BY check_in_date DESC, guest_id DESC
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """,
+    # Услуги активных бронирований (день выезда уже не активен), новые первыми
+    "services": """
+        SELECT s.name, gs.quantity, gs.order_date, gs.status
+        FROM Guests g
+        JOIN GuestServices gs ON gs.guest_id = g.guest_id
+        JOIN Services s ON s.service_id = gs.service_id
+        WHERE g.telegram_id = ? AND g.check_out_date > CAST(GETDATE() AS DATE)
+        ORDER BY gs.order_date DESC, gs.guest_id, gs.service_id
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """,
+}
+
+# (строки страницы, есть ли следующая) или None — нет подключения к БД;
+# ошибки запроса пробрасываются вызывающему
+def load_guest_page(telegram_id, kind, page, page_size=GUEST_PAGE_SIZE):
+    pages = guest_overview_cache.get(telegram_id)
+    if pages is not cache.MISSING and (kind, page) in pages:
+        return pages[(kind, page)]
+    conn = connect_to_db()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(GUEST_PAGE_QUERIES[kind], (telegram_id, page * page_size, page_size + 1))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    result = (rows[:page_size], len(rows) > page_size)
+    # Словарь берётся заново: кэш могли сбросить, пока шёл запрос
+    pages = guest_overview_cache.get(telegram_id)
+    if pages is cache.MISSING:
+        pages = {}
+        guest_overview_cache.set(telegram_id, pages)
+    pages[(kind, page)] = result
+    return result
+
+# Активное бронирование пользователя: telegram_id -> guest_id. Ответ хранится до дня выезда
+# (не дольше ACTIVE_GUEST_MAX_TTL), отрицательный — недолго, чтобы новая бронь
+# из обхода бота была видна быстро.
+ACTIVE_GUEST_NEGATIVE_TTL = float(os.getenv("ACTIVE_GUEST_NEGATIVE_TTL", "30"))
+active_guest_cache = cache.TTLCache(
+    "active_guest",
+    ttl=float(os.getenv("ACTIVE_GUEST_MAX_TTL", str(24 * 3600))),
+    max_entries=int(os.getenv("GUEST_CACHE_SIZE", "10000")),
+)
+
+# guest_id активного бронирования или None. Можно передать курсор уже открытого соединения;
+# ошибки БД пробрасываются вызывающему.
+def resolve_active_guest(telegram_id, cursor=None):
+    guest_id = active_guest_cache.get(telegram_id)
+    if guest_id is not cache.MISSING:
+        return guest_id
+    conn = None
+    if cursor is None:
+        conn = db.connect()
+        cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT guest_id, check_out_date FROM Guests WHERE telegram_id = ? AND check_out_date >= GETDATE() ORDER BY check_out_date",
+            (telegram_id,)
+        )
+        row = cursor.fetchone()
+    finally:
+        if conn:
+            conn.close()
+    if row is None:
+        active_guest_cache.set(telegram_id, None, ttl=ACTIVE_GUEST_NEGATIVE_TTL)
+        return None
+    until_check_out = (datetime.combine(row.check_out_date, datetime.min.time()) - datetime.now()).total_seconds()
+    active_guest_cache.set(telegram_id, row.guest_id, ttl=min(until_check_out, active_guest_cache.ttl))
+    return row.guest_id
+
+def invalidate_guest_caches(*telegram_ids):
+    guest_overview_cache.invalidate(*telegram_ids)
+    active_guest_cache.invalidate(*telegram_ids)
+
+def clear_guest_caches():
+    guest_overview_cache.clear()
+    active_guest_cache.clear()
+
+# Владелец бронирования — чтобы сбросить кэш при правках по guest_id
+def guest_owner(cursor, guest_id):
+    cursor.execute("SELECT telegram_id FROM Guests WHERE guest_id = ?", (guest_id,))
+    row = cursor.fetchone()
+    return row.telegram_id if row else None
+
+def paginate(items, page, page_size=GUEST_PAGE_SIZE):
+    pages = max(1, (len(items) + page_size - 1) // page_size)
+    page = min(max(page, 0), pages - 1)
+    return items[page * page_size:(page + 1) * page_size], page, pages
+
+def page_markup(prefix, page, pages):
+    if pages <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"{prefix}_{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"{prefix}_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+# Первая страница отправляется новым сообщением, листание редактирует текущее
+async def answer_page(callback_query: CallbackQuery, text, markup, navigating):
+    if not navigating:
+        await callback_query.message.answer(text, reply_markup=markup)
+        return
+    try:
+        await callback_query.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        logging.debug(f"Страница не изменилась: {e}")
 
 # FSM состояния
 class RoomState(StatesGroup):
@@ -105,30 +401,10 @@ class AdminState(StatesGroup):
     waiting_for_broadcast = State()
 
 class DBAdminState(StatesGroup):
-    waiting_for_add_user = State()
-    waiting_for_edit_user = State()
-    waiting_for_delete_user = State()
-    waiting_for_add_room = State()
-    waiting_for_edit_room = State()
-    waiting_for_delete_room = State()
-    waiting_for_add_image = State()
-    waiting_for_edit_image = State()
-    waiting_for_delete_image = State()
-    waiting_for_room_edit_gui = State()
-    waiting_for_user_edit_gui = State()
-    waiting_for_image_edit_gui = State()
-    waiting_for_add_guest = State()
-    waiting_for_edit_guest = State()
-    waiting_for_delete_guest = State()
-    waiting_for_guest_edit_gui = State()
-    waiting_for_add_service = State()
-    waiting_for_edit_service = State()
-    waiting_for_delete_service = State()
-    waiting_for_add_guest_service = State()
-    waiting_for_edit_guest_service = State()
-    waiting_for_delete_guest_service = State()
-    waiting_for_service_edit_gui = State()
-    waiting_for_guest_service_edit_gui = State()
+    waiting_for_add_row = State()
+    waiting_for_edit_text = State()
+    waiting_for_field_edit = State()
+    waiting_for_delete_row = State()
 
 class GuestRegistrationState(StatesGroup):
     waiting_for_room_id = State()
@@ -150,49 +426,232 @@ class BookingState(StatesGroup):
     waiting_for_check_out_date = State()
     waiting_for_comment = State()
 
-class OrderServiceState(StatesGroup):
-    waiting_for_quantity = State()
+# Статические клавиатуры собираются один раз, а не на каждый вызов
+START_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Доступные номера", callback_data="show_rooms")],
+    [InlineKeyboardButton(text="Мои бронирования", callback_data="my_bookings")],
+    [InlineKeyboardButton(text="Мои услуги", callback_data="my_services")],
+    [InlineKeyboardButton(text="Отзывы", callback_data="reviews")],
+    [InlineKeyboardButton(text="Заказать дополнительные услуги", callback_data="additional_services")],
+    [InlineKeyboardButton(text="Техподдержка", callback_data="tech_support")]
+])
+
+ADMIN_PANEL_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Массовая рассылка", callback_data="broadcast")],
+    [InlineKeyboardButton(text="Управление БД", callback_data="DB")],
+    [InlineKeyboardButton(text="Аналитика", callback_data="analytics")]
+])
+
+ANALYTICS_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Обновить", callback_data="analytics")],
+    [InlineKeyboardButton(text="Назад", callback_data="back_to_apanel")]
+])
+
+BOOKING_DONE_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Назад", callback_data="back_to_main")],
+    [InlineKeyboardButton(text="Доп услуги", callback_data="additional_services")]
+])
 
 # Обработчик команды /start с добавленным пунктом "Мои услуги"
+# Ссылка из inline-результата (t.me/бот?start=book_<room_id>) сразу начинает бронирование.
+# Из кнопки «Назад» message — сообщение бота, поэтому пользователь передаётся явно
 @dp.message(Command("start"))
-async def start(message: types.Message):
-    telegram_id = message.from_user.id
-    first_name = message.from_user.first_name
-    last_name = message.from_user.last_name or ""
-    username = message.from_user.username or ""
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Доступные номера", callback_data="show_rooms")],
-        [InlineKeyboardButton(text="Мои бронирования", callback_data="my_bookings")],
-        [InlineKeyboardButton(text="Мои услуги", callback_data="my_services")],
-        [InlineKeyboardButton(text="Отзывы", callback_data="reviews")],
-        [InlineKeyboardButton(text="Заказать дополнительные услуги", callback_data="additional_services")],
-        [InlineKeyboardButton(text="Техподдержка", callback_data="tech_support")]
-    ])
+async def start(message: types.Message, state: FSMContext, command: CommandObject = None, event_from_user: types.User = None):
+    user = event_from_user or message.from_user
+    telegram_id = user.id
+    first_name = user.first_name
+    last_name = user.last_name or ""
+    username = user.username or ""
+    markup = START_MARKUP
     if not check_user_exists(telegram_id):
         add_user(telegram_id, first_name, last_name, username)
         await message.answer(f"👋 Привет, {first_name}! Вы успешно зарегистрированы.", reply_markup=markup)
     else:
         await message.answer(f"👋 Привет, {first_name}! Рады снова видеть вас.", reply_markup=markup)
+    args = command.args if command else None
+    if args and args.startswith("book_") and args[5:].isdigit():
+        await start_booking(message, state, int(args[5:]), telegram_id)
+
+# Команда /rooms; с фильтрами (/rooms price=100-300 category=Люкс guests=2) — поиск по индексу номеров
+ROOM_FILTER_PATTERN = re.compile(r"(\w+)=(.*?)(?=\s+\w+=|$)")
+ROOM_FILTER_HELP = (
+    "Фильтры: /rooms price=от-до category=Категория guests=N\n"
+    "Например: /rooms price=100-300 guests=2"
+)
 
-# Команда /rooms
-@dp.message(Command("rooms"))
-async def rooms(message: types.Message, state: FSMContext):
+def parse_room_filter(text):
+    room_filter = {}
+    for key, value in ROOM_FILTER_PATTERN.findall(text.strip()):
+        value = value.strip()
+        if key == "price":
+            low, _, high = value.partition("-") if "-" in value else ("", "", value)
+            room_filter["min_price"] = str(Decimal(low)) if low.strip() else None
+            room_filter["max_price"] = str(Decimal(high)) if high.strip() else None
+        elif key == "category" and value:
+            room_filter["category"] = value
+        elif key == "guests":
+            room_filter["min_capacity"] = int(value)
+        else:
+            raise ValueError(key)
+    if not room_filter:
+        raise ValueError(text)
+    return room_filter
+
+def search_rooms(room_filter):
+    return room_index.search(
+        min_price=Decimal(room_filter["min_price"]) if room_filter.get("min_price") else None,
+        max_price=Decimal(room_filter["max_price"]) if room_filter.get("max_price") else None,
+        category=room_filter.get("category"),
+        min_capacity=room_filter.get("min_capacity"),
+    )
+
+def room_search_page(room_filter, page):
+    matches = search_rooms(room_filter)
+    if not matches:
+        return "По заданным фильтрам свободных номеров нет.\n\n" + ROOM_FILTER_HELP, None
+    items, page, pages = paginate(matches, page, ROOM_SEARCH_PAGE_SIZE)
+    parts = [f"Найдено номеров: {len(matches)} (стр. {page + 1}/{pages})"]
+    buttons = []
+    for number, room in enumerate(items, page * ROOM_SEARCH_PAGE_SIZE + 1):
+        capacity = f", гостей: до {room.capacity}" if room.capacity else ""
+        parts.append(f"\n{number}. {room.category} — $ {room.price}{capacity}\n{room.description[:200]}")
+        buttons.append([InlineKeyboardButton(text=f"Забронировать №{number}", callback_data=f"book_{room.room_id}")])
+    navigation = page_markup("room_search_page", page, pages)
+    if navigation:
+        buttons.extend(navigation.inline_keyboard)
+    return "\n".join(parts), InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def show_room_search(callback_query: CallbackQuery, state: FSMContext):
+    room_filter = (await state.get_data()).get("room_filter")
+    if not room_filter:
+        await callback_query.message.answer(ROOM_FILTER_HELP)
+        return
+    try:
+        text, markup = room_search_page(room_filter, requested_page(callback_query.data, "room_search_page_"))
+    except db.DBError as e:
+        logging.error(f"Ошибка при построении индекса номеров: {e}")
+        await callback_query.message.answer("Произошла ошибка при поиске номеров.")
+        return
+    await answer_page(callback_query, text, markup, navigating=True)
+
+# Начало бронирования номера: кнопка «Забронировать» и ссылка из inline-поиска
+async def start_booking(message: types.Message, state: FSMContext, room_id, telegram_id):
     conn = connect_to_db()
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT category FROM Rooms WHERE status = 'available' AND quantity > 0")
-            categories = [row.category for row in cursor.fetchall()]
-            if categories:
-                await state.update_data(categories=categories, current_category_index=0)
-                await show_category(message.chat.id, state)
+            cursor.execute("SELECT quantity FROM Rooms WHERE room_id = ? AND status = 'available'", (room_id,))
+            result = cursor.fetchone()
+            if result and result.quantity > 0:
+                await state.update_data(room_id=room_id, telegram_id=telegram_id)
+                await message.answer("Введите ваше имя:")
+                await state.set_state(BookingState.waiting_for_first_name)
             else:
-                await message.answer("К сожалению, свободных номеров нет.")
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при получении категорий номеров: {e}")
+                await message.answer("Этот номер уже забронирован или отсутствует.")
+        except db.DBError as e:
+            logging.error(f"Ошибка при проверке комнаты: {e}")
+            await message.answer("Произошла ошибка при бронировании.")
         finally:
             conn.close()
 
+def inline_room_result(room, book_url):
+    caption = f"<b>Категория:</b> {room.category}\n<b>Цена: $</b> {room.price}\n{room.description[:800]}"
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Забронировать", url=book_url)]])
+    result_id = f"room_{room.room_id}"
+    if room.images:
+        file_id = room_index.file_id(room.images[0])
+        if file_id:
+            return InlineQueryResultCachedPhoto(
+                id=result_id, photo_file_id=file_id, caption=caption, parse_mode="HTML", reply_markup=markup
+            )
+        return InlineQueryResultPhoto(
+            id=result_id, photo_url=room.images[0], thumbnail_url=room.images[0],
+            title=room.category, caption=caption, parse_mode="HTML", reply_markup=markup
+        )
+    return InlineQueryResultArticle(
+        id=result_id, title=f"{room.category} — $ {room.price}", description=room.description[:100],
+        input_message_content=InputTextMessageContent(message_text=caption, parse_mode="HTML"),
+        reply_markup=markup
+    )
+
+# Inline-поиск номеров (@бот люкс вид): префиксный индекс слов категории и описания,
+# ответы на одинаковые запросы — из LRU индекса; следующая страница — по offset
+@dp.inline_query()
+async def inline_rooms(inline_query: InlineQuery):
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    try:
+        matches = room_index.match(inline_query.query)
+    except db.DBError as e:
+        logging.error(f"Ошибка при построении индекса номеров: {e}")
+        await inline_query.answer([], cache_time=5, is_personal=False)
+        return
+    items = matches[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(matches) else ""
+    username = (await bot.me()).username
+    results = [inline_room_result(room, f"https://t.me/{username}?start=book_{room.room_id}") for room in items]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False, next_offset=next_offset)
+
+@dp.message(Command("rooms"))
+async def rooms(message: types.Message, state: FSMContext):
+    args = message.text.split(maxsplit=1)[1:] if message.text and message.text.startswith("/rooms") else []
+    if args:
+        try:
+            room_filter = parse_room_filter(args[0])
+        except (ValueError, ArithmeticError):
+            await message.answer("Не удалось разобрать фильтры.\n\n" + ROOM_FILTER_HELP)
+            return
+        try:
+            text, markup = room_search_page(room_filter, 0)
+        except db.DBError as e:
+            logging.error(f"Ошибка при построении индекса номеров: {e}")
+            await message.answer("Произошла ошибка при поиске номеров.")
+            return
+        await state.update_data(room_filter=room_filter)
+        await message.answer(text, reply_markup=markup)
+        return
+    try:
+        categories = await room_reads.do(("categories", room_index.generation), fetch_room_categories)
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении категорий номеров: {e}")
+        try:
+            # Без БД — категории из индекса номеров в памяти, если он уже строился
+            categories = room_index.categories()
+        except db.DBError:
+            return
+    if categories:
+        await state.update_data(categories=categories, current_category_index=0)
+        await show_category(message.chat.id, state)
+    else:
+        await message.answer("К сожалению, свободных номеров нет.")
+
+# Чтения каталога номеров идут через асинхронный API БД (DB_ASYNC)
+async def fetch_room_categories():
+    async with await db.aconnect() as conn:
+        cursor = await conn.cursor()
+        await cursor.execute("SELECT DISTINCT category FROM Rooms WHERE status = 'available' AND quantity > 0")
+        return [row.category for row in await cursor.fetchall()]
+
+# Свободные номера категории с их фото: [(room, [image_url, ...]), ...]
+async def fetch_category_rooms(category):
+    async with await db.aconnect() as conn:
+        cursor = await conn.cursor()
+        # Номера и фото одним запросом: строка на фото (NULL у номера без фото)
+        await cursor.execute("""
+            SELECT r.room_id, r.description, r.price, i.image_url
+            FROM Rooms r
+            LEFT JOIN RoomImages i ON i.room_id = r.room_id
+            WHERE r.category = ? AND r.status = 'available' AND r.quantity > 0
+            ORDER BY r.room_id, i.image_id
+        """, (category,))
+        rooms = {}
+        for row in await cursor.fetchall():
+            room = rooms.get(row.room_id)
+            if room is None:
+                room = rooms[row.room_id] = (row, [])
+            if row.image_url is not None:
+                room[1].append(row.image_url)
+        return list(rooms.values())
+
 async def show_category(chat_id, state: FSMContext):
     data = await state.get_data()
     categories = data.get('categories', [])
@@ -202,44 +661,58 @@ async def show_category(chat_id, state: FSMContext):
         return
     current_category = categories[current_category_index]
     logging.info(f"Отображение категории: {current_category}, индекс: {current_category_index}")
-    conn = connect_to_db()
-    if conn:
+    try:
+        rooms = await room_reads.do(("category", current_category, room_index.generation), fetch_category_rooms, current_category)
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении номеров: {e}")
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT room_id, description, price FROM Rooms WHERE category = ? AND status = 'available' AND quantity > 0", (current_category,))
-            rooms = cursor.fetchall()
-            if rooms:
-                media = []
-                for room in rooms:
-                    cursor.execute("SELECT image_url FROM RoomImages WHERE room_id = ?", (room.room_id,))
-                    images = [row.image_url for row in cursor.fetchall()]
-                    if images:
-                        media.append(InputMediaPhoto(
-                            media=images[0],
-                            caption=f"<b>Категория:</b> {current_category}\n<b>Цена: $</b> {room.price}\n{room.description}",
-                            parse_mode="HTML"
-                        ))
-                        media.extend([InputMediaPhoto(media=img) for img in images[1:]])
-                if media:
-                    markup = InlineKeyboardMarkup(inline_keyboard=[[
-                        InlineKeyboardButton(text="<<", callback_data="prev_category"),
-                        InlineKeyboardButton(text="Забронировать", callback_data=f"book_{rooms[0].room_id}"),
-                        InlineKeyboardButton(text=">>", callback_data="next_category")
-                    ]])
-                    media_messages = await bot.send_media_group(chat_id, media)
-                    media_message_ids = [msg.message_id for msg in media_messages]
-                    sent_message = await bot.send_message(chat_id, "Выберите действие👇", reply_markup=markup)
-                    await state.update_data(last_text_message_id=sent_message.message_id, media_message_ids=media_message_ids)
-                else:
-                    logging.warning(f"Нет изображений для категории {current_category}")
-                    await bot.send_message(chat_id, "Нет изображений для этой категории.")
-            else:
-                logging.warning(f"Нет номеров для категории {current_category}")
-                await bot.send_message(chat_id, "Нет доступных номеров в этой категории.")
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при получении номеров: {e}")
-        finally:
-            conn.close()
+            rooms = [(room, room.images) for room in room_index.search(category=current_category)]
+        except db.DBError:
+            return
+    if rooms:
+        media = []
+        urls = []
+        for room, images in rooms:
+            if images:
+                media.append(InputMediaPhoto(
+                    media=room_index.photo(images[0]),
+                    caption=f"<b>Категория:</b> {current_category}\n<b>Цена: $</b> {room.price}\n{room.description}",
+                    parse_mode="HTML"
+                ))
+                media.extend([InputMediaPhoto(media=room_index.photo(img)) for img in images[1:]])
+                urls.extend(images)
+        if media:
+            markup = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="<<", callback_data="prev_category"),
+                InlineKeyboardButton(text="Забронировать", callback_data=f"book_{rooms[0][0].room_id}"),
+                InlineKeyboardButton(text=">>", callback_data="next_category")
+            ]])
+            media_messages = await bot.send_media_group(chat_id, media)
+            media_message_ids = [msg.message_id for msg in media_messages]
+            remember_photo_file_ids(urls, media_messages)
+            sent_message = await bot.send_message(chat_id, "Выберите действие👇", reply_markup=markup)
+            await state.update_data(last_text_message_id=sent_message.message_id, media_message_ids=media_message_ids)
+        else:
+            logging.warning(f"Нет изображений для категории {current_category}")
+            await bot.send_message(chat_id, "Нет изображений для этой категории.")
+    else:
+        logging.warning(f"Нет номеров для категории {current_category}")
+        await bot.send_message(chat_id, "Нет доступных номеров в этой категории.")
+
+# file_id загруженных фото: повторные показы и inline-результаты не скачивают URL заново
+def remember_photo_file_ids(urls, media_messages):
+    pairs = [(url, msg.photo[-1].file_id) for url, msg in zip(urls, media_messages) if msg.photo]
+    fresh = room_index.remember_file_ids(pairs)
+    if fresh:
+        conn = connect_to_db()
+        if conn:
+            try:
+                conn.cursor().executemany("UPDATE RoomImages SET file_id = ? WHERE image_url = ?", fresh)
+                conn.commit()
+            except db.DBError as e:
+                logging.error(f"Ошибка при сохранении file_id фото: {e}")
+            finally:
+                conn.close()
 
 async def update_category(chat_id, state: FSMContext):
     data = await state.get_data()
@@ -257,78 +730,30 @@ async def update_category(chat_id, state: FSMContext):
             logging.error(f"Ошибка при удалении текстового сообщения {last_text_message_id}: {e}")
     await show_category(chat_id, state)
 
-# Функции управления БД
+# Функции управления БД: меню таблиц строятся по описаниям из admin_tables.
+# callback_data — "<действие>_<slug таблицы>[_<ключ строки>]"
+DB_MENU_MARKUP = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=table.title, callback_data=f"db_{table.slug}")] for table in TABLES.values()
+] + [
+    [InlineKeyboardButton(text="Назад", callback_data="back_to_apanel")]
+])
+
 async def show_db_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Пользователи", callback_data="db_users")],
-        [InlineKeyboardButton(text="Номера", callback_data="db_rooms")],
-        [InlineKeyboardButton(text="Изображения", callback_data="db_images")],
-        [InlineKeyboardButton(text="Гости", callback_data="db_guests")],
-        [InlineKeyboardButton(text="Услуги", callback_data="db_services")],
-        [InlineKeyboardButton(text="Гостевые услуги", callback_data="db_guest_services")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_apanel")]
-    ])
-    await bot.send_message(chat_id, "Выберите таблицу для управления:", reply_markup=markup)
-
-async def show_users_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть всех", callback_data="view_users")],
-        [InlineKeyboardButton(text="Добавить пользователя", callback_data="add_user")],
-        [InlineKeyboardButton(text="Выдать админку", callback_data="edit_user")],
-        [InlineKeyboardButton(text="Удалить пользователя", callback_data="delete_user_menu")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-    ])
-    await bot.send_message(chat_id, "Управление таблицей Users:", reply_markup=markup)
-
-async def show_rooms_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть номера", callback_data="view_rooms")],
-        [InlineKeyboardButton(text="Добавить номер", callback_data="add_room")],
-        [InlineKeyboardButton(text="Редактировать номер", callback_data="edit_room")],
-        [InlineKeyboardButton(text="Удалить номер", callback_data="delete_room_menu")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-    ])
-    await bot.send_message(chat_id, "Управление таблицей Rooms:", reply_markup=markup)
-
-async def show_images_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть изображения", callback_data="view_images")],
-        [InlineKeyboardButton(text="Добавить изображение", callback_data="add_image")],
-        [InlineKeyboardButton(text="Редактировать изображение", callback_data="edit_image")],
-        [InlineKeyboardButton(text="Удалить изображение", callback_data="delete_image_menu")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-    ])
-    await bot.send_message(chat_id, "Управление таблицей RoomImages:", reply_markup=markup)
-
-async def show_guests_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть гостей", callback_data="view_guests")],
-        [InlineKeyboardButton(text="Добавить гостя", callback_data="add_guest")],
-        [InlineKeyboardButton(text="Редактировать гостя", callback_data="edit_guest")],
-        [InlineKeyboardButton(text="Удалить гостя", callback_data="delete_guest_menu")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-    ])
-    await bot.send_message(chat_id, "Управление таблицей Guests:", reply_markup=markup)
-
-async def show_services_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть услуги", callback_data="view_services")],
-        [InlineKeyboardButton(text="Добавить услугу", callback_data="add_service")],
-        [InlineKeyboardButton(text="Редактировать услугу", callback_data="edit_service")],
-        [InlineKeyboardButton(text="Удалить услугу", callback_data="delete_service")],
-        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-    ])
-    await bot.send_message(chat_id, "Управление таблицей Services:", reply_markup=markup)
-
-async def show_guest_services_menu(chat_id):
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Просмотреть все", callback_data="view_guest_services")],
-        [InlineKeyboardButton(text="Добавить запись", callback_data="add_guest_service")],
-        [InlineKeyboardButton(text="Редактировать запись", callback_data="edit_guest_service")],
-        [InlineKeyboardButton(text="Удалить запись", callback_data="delete_guest_service")],
+    await bot.send_message(chat_id, "Выберите таблицу для управления:", reply_markup=DB_MENU_MARKUP)
+
+def table_menu_markup(table):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Просмотреть все", callback_data=f"view_{table.slug}")],
+        [InlineKeyboardButton(text="Добавить запись", callback_data=f"add_{table.slug}")],
+        [InlineKeyboardButton(text="Редактировать запись", callback_data=f"edit_{table.slug}")],
+        [InlineKeyboardButton(text="Удалить запись", callback_data=f"delmenu_{table.slug}")],
         [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
     ])
-    await bot.send_message(chat_id, "Управление таблицей GuestServices:", reply_markup=markup)
+
+TABLE_MENUS = {slug: table_menu_markup(table) for slug, table in TABLES.items()}
+
+async def show_table_menu(chat_id, table):
+    await bot.send_message(chat_id, f"Управление таблицей {table.name}:", reply_markup=TABLE_MENUS[table.slug])
 
 async def view_db_users(chat_id):
     conn = connect_to_db()
@@ -340,11 +765,10 @@ async def view_db_users(chat_id):
             if not users:
                 await bot.send_message(chat_id, "Нет пользователей.")
                 return
-            text = "Список пользователей:\n"
-            for user in users:
-                admin_status = "👑" if user.admin else ""
-                text += f"ID: {user.telegram_id}, Имя: {user.first_name} {user.last_name}, Username: {user.username}, Админ: {admin_status}\n"
-            await bot.send_message(chat_id, text)
+            await send_parts(partial(bot.send_message, chat_id), (
+                f"ID: {user.telegram_id}, Имя: {user.first_name} {user.last_name}, Username: {user.username}, Админ: {'👑' if user.admin else ''}"
+                for user in users
+            ), header="Список пользователей:")
         except Exception as e:
             logging.error(f"Ошибка при получении пользователей: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных.")
@@ -361,10 +785,10 @@ async def view_db_rooms(chat_id):
             if not rows:
                 await bot.send_message(chat_id, "Нет данных по номерам.")
             else:
-                text = "Список номеров:\n"
-                for row in rows:
-                    text += f"ID: {row.room_id}\nКатегория: {row.category}\nЦена: {row.price} руб.\nКоличество: {row.quantity}\nСтатус: {row.status}\n====================\n"
-                await bot.send_message(chat_id, text)
+                await send_parts(partial(bot.send_message, chat_id), (
+                    f"ID: {row.room_id}\nКатегория: {row.category}\nЦена: {row.price} руб.\nКоличество: {row.quantity}\nСтатус: {row.status}\n===================="
+                    for row in rows
+                ), header="Список номеров:")
         except Exception as e:
             logging.error(f"Ошибка при получении номеров: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных по номерам.")
@@ -381,10 +805,9 @@ async def view_db_images(chat_id):
             if not rows:
                 await bot.send_message(chat_id, "Нет данных по изображениям.")
             else:
-                text = "Список изображений:\n"
-                for row in rows:
-                    text += f"Room ID: {row.room_id}, URL: {row.image_url}\n"
-                await bot.send_message(chat_id, text)
+                await send_parts(partial(bot.send_message, chat_id), (
+                    f"Room ID: {row.room_id}, URL: {row.image_url}" for row in rows
+                ), header="Список изображений:")
         except Exception as e:
             logging.error(f"Ошибка при получении изображений: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных по изображениям.")
@@ -401,10 +824,10 @@ async def view_db_guests(chat_id):
             if not guests:
                 await bot.send_message(chat_id, "Нет данных по гостям.")
             else:
-                text = "Список гостей:\n"
-                for guest in guests:
-                    text += f"ID: {guest.guest_id}, Комната: {guest.room_id}, Telegram ID: {guest.telegram_id}, Имя: {guest.first_name} {guest.last_name}, Заезд: {guest.check_in_date}, Выезд: {guest.check_out_date}\n"
-                await bot.send_message(chat_id, text)
+                await send_parts(partial(bot.send_message, chat_id), (
+                    f"ID: {guest.guest_id}, Комната: {guest.room_id}, Telegram ID: {guest.telegram_id}, Имя: {guest.first_name} {guest.last_name}, Заезд: {guest.check_in_date}, Выезд: {guest.check_out_date}"
+                    for guest in guests
+                ), header="Список гостей:")
         except Exception as e:
             logging.error(f"Ошибка при получении гостей: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных по гостям.")
@@ -421,10 +844,10 @@ async def view_db_services(chat_id):
             if not services:
                 await bot.send_message(chat_id, "Нет услуг.")
                 return
-            text = "Список услуг:\n"
-            for service in services:
-                text += f"ID: {service.service_id}, Название: {service.name}, Цена: {service.price} руб., Описание: {service.short_description}\n"
-            await bot.send_message(chat_id, text)
+            await send_parts(partial(bot.send_message, chat_id), (
+                f"ID: {service.service_id}, Название: {service.name}, Цена: {service.price} руб., Описание: {service.short_description}"
+                for service in services
+            ), header="Список услуг:")
         except Exception as e:
             logging.error(f"Ошибка при получении услуг: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных.")
@@ -446,93 +869,73 @@ async def view_db_guest_services(chat_id):
             if not records:
                 await bot.send_message(chat_id, "Нет данных в таблице GuestServices.")
             else:
-                text = "Список гостевых услуг:\n"
-                for record in records:
-                    text += (f"Гость: {record.first_name} {record.last_name}, Услуга: {record.name}, "
-                             f"Количество: {record.quantity}, Дата заказа: {record.order_date}, Статус: {record.status}\n")
-                await bot.send_message(chat_id, text)
-        except pyodbc.Error as e:
+                await send_parts(partial(bot.send_message, chat_id), (
+                    f"Гость: {record.first_name} {record.last_name}, Услуга: {record.name}, "
+                    f"Количество: {record.quantity}, Дата заказа: {record.order_date}, Статус: {record.status}"
+                    for record in records
+                ), header="Список гостевых услуг:")
+        except db.DBError as e:
             logging.error(f"Ошибка при получении данных GuestServices: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных.")
         finally:
             conn.close()
 
-# Функции для GUI удаления и редактирования
-async def show_users_for_delete(chat_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT telegram_id, first_name FROM Users")
-            users = cursor.fetchall()
-            if not users:
-                await bot.send_message(chat_id, "Нет пользователей для удаления.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text="Удалить по ID", callback_data="delete_user_id")]
-            ] + [
-                [InlineKeyboardButton(text=f"{user.first_name} (ID: {user.telegram_id})", callback_data=f"delete_user_{user.telegram_id}")]
-                for user in users
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите пользователя для удаления:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка пользователей: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
-async def show_rooms_for_delete(chat_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT room_id, category FROM Rooms")
-            rooms = cursor.fetchall()
-            if not rooms:
-                await bot.send_message(chat_id, "Нет номеров для удаления.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text="Удалить по ID", callback_data="delete_room_id")]
-            ] + [
-                [InlineKeyboardButton(text=f"ID: {room.room_id} - {room.category}", callback_data=f"delete_room_{room.room_id}")]
-                for room in rooms
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите номер для удаления:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка номеров: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+async def show_analytics(chat_id):
+    try:
+        await analytics.refresh()
+    except db.DBError as e:
+        logging.error(f"Ошибка при построении аналитики: {e}")
+        await bot.send_message(chat_id, "Ошибка при получении данных.")
+        return
+    room_revenue, nights, bookings, service_revenue, orders = analytics.totals()
+    parts = [f"📊 Аналитика на {date.today()}", "", "Загрузка по категориям (сегодняшняя ночь):"]
+    if analytics.error is not None:
+        parts[1] = f"⚠️ База данных недоступна, данные на {analytics.loaded_at:%d.%m %H:%M}\n"
+    tonight = ZERO
+    for category, occupied, capacity, percent, revenue in analytics.occupancy():
+        parts.append(f"{category}: {occupied} из {capacity} ({percent:.1f}%), выручка за ночь {revenue} руб.")
+        tonight += revenue
+    parts.append(f"Выручка за ночь всего: {tonight} руб.")
+    parts.append("")
+    parts.append(f"Проживание: {room_revenue} руб., продано ночей: {nights}, бронирований: {bookings}")
+    parts.append(f"Услуги: {service_revenue} руб., заказов: {orders}")
+    top = analytics.top_services()
+    if top:
+        parts.append("")
+        parts.append("Топ услуг:")
+        parts.extend(
+            f"{i}. {service.name} — {service.revenue} руб., заказов: {service.orders}, единиц: {service.quantity}"
+            for i, service in enumerate(top, 1)
+        )
+    await send_parts(partial(bot.send_message, chat_id), parts, reply_markup=ANALYTICS_MARKUP)
 
-async def show_guests_for_delete(chat_id):
+# Выбор строки кнопками: action — действие кнопки (editrow/delrow), filters — условия по столбцам
+async def show_rows_for(chat_id, table, action, back="back_to_DB_menu", **filters):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT guest_id, first_name, last_name FROM Guests")
-            guests = cursor.fetchall()
-            if not guests:
-                await bot.send_message(chat_id, "Нет гостей для удаления.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text="Удалить по ID", callback_data="delete_guest_id")]
-            ] + [
-                [InlineKeyboardButton(text=f"ID: {guest.guest_id} - {guest.first_name} {guest.last_name}", callback_data=f"delete_guest_{guest.guest_id}")]
-                for guest in guests
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите гостя для удаления:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка гостей: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
+    if not conn:
+        return
+    try:
+        rows = table.rows(conn.cursor(), **filters)
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении списка {table.name}: {e}")
+        await bot.send_message(chat_id, "Ошибка при получении данных.")
+        return
+    finally:
+        conn.close()
+    purpose = "редактирования" if action == "editrow" else "удаления"
+    if not rows:
+        await bot.send_message(chat_id, f"Нет записей для {purpose}.")
+        return
+    buttons = [
+        [InlineKeyboardButton(
+            text=table.row_label(row),
+            callback_data=f"{action}_{table.slug}_{table.encode_key(table.row_key(row))}"
+        )] for row in rows
+    ]
+    buttons.append([InlineKeyboardButton(text="Назад", callback_data=back)])
+    await bot.send_message(chat_id, f"{table.title}: выберите запись для {purpose}:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+
+# Удаление изображений из списка: сначала комната, затем её изображения
 async def show_rooms_for_image_delete(chat_id):
     conn = connect_to_db()
     if conn:
@@ -544,508 +947,650 @@ async def show_rooms_for_image_delete(chat_id):
                 await bot.send_message(chat_id, "Нет изображений для удаления.")
                 return
             buttons = [
-                [InlineKeyboardButton(text="Удалить по room_id и URL", callback_data="delete_image_id")]
-            ] + [
-                [InlineKeyboardButton(text=f"Room ID: {room.room_id}", callback_data=f"select_room_image_{room.room_id}")]
+                [InlineKeyboardButton(text=f"Room ID: {room.room_id}", callback_data=f"dellist_image_{room.room_id}")]
                 for room in rooms
             ]
             buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
             markup = InlineKeyboardMarkup(inline_keyboard=buttons)
             await bot.send_message(chat_id, "Выберите комнату для удаления изображений:", reply_markup=markup)
-        except Exception as e:
+        except db.DBError as e:
             logging.error(f"Ошибка при получении списка комнат: {e}")
             await bot.send_message(chat_id, "Ошибка при получении данных.")
         finally:
             conn.close()
 
-async def show_images_for_delete(chat_id, room_id):
+# Сброс кэшей после правок из админки: action — insert/update/delete, fields — изменённые
+# столбцы, owners — telegram_id пользователей, чьи брони и заказы затронуты
+def rooms_changed(action, fields, owners):
+    invalidate_room_catalog()
+    if action == "delete":
+        staff.invalidate()
+        clear_guest_caches()
+
+def images_changed(action, fields, owners):
+    room_index.invalidate()
+
+def services_changed(action, fields, owners):
+    analytics.invalidate()
+    service_catalog.invalidate()
+    if action == "delete":
+        staff.invalidate()
+    if action == "delete" or "name" in fields:
+        guest_overview_cache.clear()
+
+def guest_services_changed(action, fields, owners):
+    analytics.invalidate()
+    staff.invalidate()
+    guest_overview_cache.invalidate(*owners)
+
+def guests_changed(action, fields, owners):
+    analytics.invalidate()
+    if action == "delete":
+        staff.invalidate()
+    invalidate_guest_caches(*owners)
+
+def users_changed(action, fields, owners):
+    # Права перепроверит is_admin при следующем обращении
+    known_admins.difference_update(owners)
+    if action == "delete":
+        analytics.invalidate()
+        staff.invalidate()
+        invalidate_guest_caches(*owners)
+
+ADMIN_CHANGES = {
+    USERS.slug: users_changed,
+    ROOMS.slug: rooms_changed,
+    ROOM_IMAGES.slug: images_changed,
+    GUESTS.slug: guests_changed,
+    SERVICES.slug: services_changed,
+    GUEST_SERVICES.slug: guest_services_changed,
+}
+
+def admin_row_owners(cursor, table, key):
+    if table is USERS:
+        return [key[0]]
+    if table is GUESTS or table is GUEST_SERVICES:
+        return [guest_owner(cursor, key[0])]
+    return []
+
+# Брони (по booking_date) и заказы (по order_date), которые правка или удаление строки
+# меняют в дневных сводках; удаление каскадно уносит и связанные строки
+ROLLUP_HISTORY = {
+    USERS.slug: ("Guests WHERE telegram_id = ?", "GuestServices WHERE guest_id IN (SELECT guest_id FROM Guests WHERE telegram_id = ?)"),
+    ROOMS.slug: ("Guests WHERE room_id = ?", "GuestServices WHERE guest_id IN (SELECT guest_id FROM Guests WHERE room_id = ?)"),
+    GUESTS.slug: ("Guests WHERE guest_id = ?", "GuestServices WHERE guest_id = ?"),
+    SERVICES.slug: (None, "GuestServices WHERE service_id = ?"),
+}
+
+def rollup_affected_day(cursor, table, key, action):
+    if table is GUEST_SERVICES:
+        return as_date(key[2])
+    if table.slug not in ROLLUP_HISTORY or (action == "update" and table is not GUESTS):
+        return None
+    bookings, orders = ROLLUP_HISTORY[table.slug]
+    days = []
+    for column, where in (("booking_date", bookings), ("order_date", orders if action == "delete" else None)):
+        if where is not None:
+            cursor.execute(f"SELECT MIN({column}) FROM {where}", key)
+            value = cursor.fetchone()[0]
+            if value is not None:
+                days.append(as_date(value))
+    return min(days) if days else None
+
+# Закрытые дни, затронутые правкой, пересчитаются следующим прогоном дневных сводок
+def rewind_rollups(cursor, table, key, action):
+    since = rollup_affected_day(cursor, table, key, action)
+    if since is not None and since < date.today():
+        rewind_watermark(cursor, since)
+
+# Изменения строк из админки. Возвращают число затронутых строк (0 — строка не найдена,
+# apply_admin_change так и ответит) или None, если нет связи с БД (ответ о недоступности
+# даст DBFailureMiddleware); ошибки запроса — db.DBError.
+def insert_admin_row(table, values):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT image_url FROM RoomImages WHERE room_id = ?", (room_id,))
-            images = cursor.fetchall()
-            if not images:
-                await bot.send_message(chat_id, f"Нет изображений для комнаты ID {room_id}.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text="Удалить по room_id и URL", callback_data="delete_image_id")]
-            ] + [
-                [InlineKeyboardButton(text=f"URL: {image.image_url[:20]}...", callback_data=f"delete_image_{room_id}_{image.image_url}")]
-                for image in images
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="delete_image_gui")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, f"Выберите изображение для удаления в комнате ID {room_id}:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении изображений для комнаты ID {room_id}: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+    if not conn:
+        return None
+    try:
+        inserted = table.insert(conn.cursor(), values)
+        conn.commit()
+        ADMIN_CHANGES[table.slug]("insert", values, [])
+        return inserted
+    finally:
+        conn.close()
 
-async def show_services_for_edit(chat_id):
+def update_admin_row(table, key, values):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT service_id, name FROM Services")
-            services = cursor.fetchall()
-            if not services:
-                await bot.send_message(chat_id, "Нет услуг для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"ID: {service.service_id} - {service.name}", callback_data=f"edit_service_gui_{service.service_id}")]
-                for service in services
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите услугу для редактирования:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка услуг: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        owners = admin_row_owners(cursor, table, key)
+        updated = table.update(cursor, key, values)
+        if not updated:
+            # Строка не найдена: ни сброса кэшей, ни перепланирования
+            conn.rollback()
+            return 0
+        rewind_rollups(cursor, table, key, "update")
+        dates_changed = "check_in_date" in values or "check_out_date" in values
+        jobs = reminders.reschedule(cursor, key[0]) if table is GUESTS and dates_changed else None
+        conn.commit()
+        if jobs is not None:
+            reminders.activate(key[0], jobs)
+        if table is GUESTS and "telegram_id" in values:
+            owners.append(values["telegram_id"])
+        ADMIN_CHANGES[table.slug]("update", values, owners)
+        return updated
+    finally:
+        conn.close()
 
-async def show_services_for_delete(chat_id):
+def delete_admin_row(table, key):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT service_id, name FROM Services")
-            services = cursor.fetchall()
-            if not services:
-                await bot.send_message(chat_id, "Нет услуг для удаления.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"ID: {service.service_id} - {service.name}", callback_data=f"delete_service_{service.service_id}")]
-                for service in services
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите услугу для удаления:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка услуг: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        owners = admin_row_owners(cursor, table, key)
+        rewind_rollups(cursor, table, key, "delete")
+        deleted = table.delete(cursor, key)
+        if not deleted:
+            conn.rollback()
+            return 0
+        conn.commit()
+        if table is GUESTS:
+            reminders.cancel(key[0])
+        ADMIN_CHANGES[table.slug]("delete", (), owners)
+        return deleted
+    finally:
+        conn.close()
 
-async def show_guest_services_for_edit(chat_id):
+# Добавление гостя: дата бронирования, id новой строки и напоминания
+def insert_guest_row(table, values):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT guest_id, service_id, order_date, quantity, status FROM GuestServices")
-            records = cursor.fetchall()
-            if not records:
-                await bot.send_message(chat_id, "Нет записей для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(
-                    text=f"Гость: {record.guest_id}, Услуга: {record.service_id}, Дата: {record.order_date}",
-                    callback_data=f"edit_gs_{record.guest_id}_{record.service_id}_{record.order_date.isoformat()}"
-                )] for record in records
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите запись для редактирования:", reply_markup=markup)
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при получении списка GuestServices: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO Guests (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment, booking_date)
+            OUTPUT INSERTED.guest_id
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
+            """,
+            [values.get(name) for name in GUESTS.add_row]
+        )
+        guest_id = cursor.fetchone()[0]
+        jobs = reminders.schedule(cursor, guest_id, values["check_in_date"], values["check_out_date"])
+        conn.commit()
+        reminders.activate(guest_id, jobs)
+        guests_changed("insert", values, [values["telegram_id"]])
+        return 1
+    finally:
+        conn.close()
 
-async def show_guest_services_for_delete(chat_id):
+# Добавление заказа услуги: время заказа и назначение сотрудника, как при оформлении корзины
+def insert_guest_service_row(table, values):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT guest_id, service_id, order_date FROM GuestServices")
-            records = cursor.fetchall()
-            if not records:
-                await bot.send_message(chat_id, "Нет записей для удаления.")
-                return
-            buttons = [
-                [InlineKeyboardButton(
-                    text=f"Гость: {record.guest_id}, Услуга: {record.service_id}, Дата: {record.order_date}",
-                    callback_data=f"delete_gs_{record.guest_id}_{record.service_id}_{record.order_date.isoformat()}"
-                )] for record in records
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите запись для удаления:", reply_markup=markup)
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при получении списка GuestServices: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
+    if not conn:
+        return None
+    order = Order(values["guest_id"], values["service_id"], order_timestamp(), values["quantity"])
+    try:
+        if values["status"] == "pending":
+            service = service_catalog.cached(order.service_id)
+            order.member = staff.pick(service.position if service else None)
+        cursor = conn.cursor()
+        owner = guest_owner(cursor, order.guest_id)
+        table.insert(cursor, dict(values, order_date=order.order_date, employee_id=order.member and order.member.employee_id))
+        conn.commit()
+    except db.DBError:
+        if order.member is not None:
+            staff.release(order.member.employee_id)
+        raise
+    finally:
+        conn.close()
+    staff.notify([order])
+    analytics.record_service_order(order.service_id, order.quantity, values["status"])
+    guest_overview_cache.invalidate(owner)
+    return 1
+
+INSERT_ROW = {GUESTS.slug: insert_guest_row, GUEST_SERVICES.slug: insert_guest_service_row}
+
+# Итог изменения для админа; count None — нет связи с БД, ответит DBFailureMiddleware
+async def apply_admin_change(message, table, done, change, *args):
+    try:
+        count = change(*args)
+    except db.DBError as e:
+        logging.error(f"Ошибка при изменении таблицы {table.name}: {e}")
+        await message.answer("Ошибка базы данных.")
+        return
+    if count is None:
+        return
+    if count:
+        await message.answer(f"{table.title}: запись {done}.")
+    else:
+        await message.answer(f"{table.title}: запись не найдена.")
 
-# Функции для GUI-редактирования
-async def show_rooms_for_edit(chat_id):
+async def toggle_user_admin(message, key):
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT room_id, category FROM Rooms")
-            rooms = cursor.fetchall()
-            if not rooms:
-                await bot.send_message(chat_id, "Нет номеров для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"ID: {room.room_id} - {room.category}", callback_data=f"edit_room_gui_{room.room_id}")]
-                for room in rooms
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите номер для редактирования:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка номеров: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
-async def show_users_for_edit(chat_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT telegram_id, first_name FROM Users")
-            users = cursor.fetchall()
-            if not users:
-                await bot.send_message(chat_id, "Нет пользователей для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"{user.first_name} (ID: {user.telegram_id})", callback_data=f"edit_user_gui_{user.telegram_id}")]
-                for user in users
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите пользователя для редактирования:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка пользователей: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
-async def show_images_for_edit(chat_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT room_id, image_url FROM RoomImages")
-            images = cursor.fetchall()
-            if not images:
-                await bot.send_message(chat_id, "Нет изображений для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"Room ID: {image.room_id}, URL: {image.image_url}", callback_data=f"edit_image_gui_{image.room_id}_{image.image_url}")]
-                for image in images
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите изображение для редактирования:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка изображений: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
-async def show_guests_for_edit(chat_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT guest_id, first_name, last_name FROM Guests")
-            guests = cursor.fetchall()
-            if not guests:
-                await bot.send_message(chat_id, "Нет гостей для редактирования.")
-                return
-            buttons = [
-                [InlineKeyboardButton(text=f"ID: {guest.guest_id} - {guest.first_name} {guest.last_name}", callback_data=f"edit_guest_gui_{guest.guest_id}")]
-                for guest in guests
-            ]
-            buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
-            markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await bot.send_message(chat_id, "Выберите гостя для редактирования:", reply_markup=markup)
-        except Exception as e:
-            logging.error(f"Ошибка при получении списка гостей: {e}")
-            await bot.send_message(chat_id, "Ошибка при получении данных.")
-        finally:
-            conn.close()
-
-# Функции для работы с базой данных
-def add_user_db(telegram_id, first_name, last_name, username, admin):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO Users (telegram_id, first_name, last_name, username, admin) VALUES (?, ?, ?, ?, ?)",
-                (telegram_id, first_name, last_name, username, admin)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при добавлении пользователя: {e}")
-        finally:
-            conn.close()
-    return False
-
-def edit_user_db(telegram_id, admin):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE Users SET admin = ? WHERE telegram_id = ?", (admin, telegram_id))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании пользователя: {e}")
-        finally:
-            conn.close()
-    return False
-
-def delete_user_db(telegram_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Users WHERE telegram_id = ?", (telegram_id,))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при удалении пользователя: {e}")
-        finally:
-            conn.close()
-    return False
-
-def add_room_db(category, description, price, quantity, status):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO Rooms (category, description, price, quantity, status) VALUES (?, ?, ?, ?, ?)",
-                (category, description, price, quantity, status)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при добавлении номера: {e}")
-        finally:
-            conn.close()
-    return False
-
-def edit_room_db(room_id, category, description, price, quantity, status):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE Rooms SET category = ?, description = ?, price = ?, quantity = ?, status = ? WHERE room_id = ?",
-                (category, description, price, quantity, status, room_id)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании номера: {e}")
-        finally:
-            conn.close()
-    return False
-
-def delete_room_db(room_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Rooms WHERE room_id = ?", (room_id,))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при удалении номера: {e}")
-        finally:
-            conn.close()
-    return False
-
-def add_image_db(room_id, image_url):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO RoomImages (room_id, image_url) VALUES (?, ?)",
-                (room_id, image_url)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при добавлении изображения: {e}")
-        finally:
-            conn.close()
-    return False
-
-def edit_image_db(room_id, old_url, new_url):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE RoomImages SET image_url = ? WHERE room_id = ? AND image_url = ?",
-                (new_url, room_id, old_url)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании изображения: {e}")
-        finally:
-            conn.close()
-    return False
-
-def delete_image_db(room_id, image_url):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM RoomImages WHERE room_id = ? AND image_url = ?", (room_id, image_url))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при удалении изображения: {e}")
-        finally:
-            conn.close()
-    return False
-
-def add_service_db(name, price, short_description, detailed_description):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO Services (name, price, short_description, detailed_description) VALUES (?, ?, ?, ?)",
-                (name, price, short_description, detailed_description)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при добавлении услуги: {e}")
-        finally:
-            conn.close()
-    return False
-
-def edit_service_db(service_id, name, price, short_description, detailed_description):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE Services SET name = ?, price = ?, short_description = ?, detailed_description = ? WHERE service_id = ?",
-                (name, price, short_description, detailed_description, service_id)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании услуги: {e}")
-        finally:
-            conn.close()
-    return False
-
-def delete_service_db(service_id):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Services WHERE service_id = ?", (service_id,))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при удалении услуги: {e}")
-        finally:
-            conn.close()
-    return False
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT admin FROM Users WHERE telegram_id = ?", key)
+        row = cursor.fetchone()
+    except db.DBError as e:
+        logging.error(f"Ошибка при редактировании пользователя: {e}")
+        await message.answer("Ошибка при редактировании пользователя.")
+        return
+    finally:
+        conn.close()
+    if row is None:
+        await message.answer("Пользователь не найден.")
+        return
+    new_admin = 0 if row.admin == 1 else 1
+    status_text = "назначен администратором" if new_admin == 1 else "снята админка"
+    await apply_admin_change(message, USERS, f"обновлена, пользователь {key[0]} теперь {status_text}", update_admin_row, USERS, key, {"admin": new_admin})
+
+async def ask_admin_field(message, state, table, name):
+    column = table.column(name, editable=True)
+    hint = f" {column.hint}" if column.hint else ""
+    await message.answer(f"Введите новое значение поля «{column.title}»{hint}:")
+    await state.set_state(DBAdminState.waiting_for_field_edit)
+    await state.update_data(edit_field=name)
+
+# Строка выбрана для GUI-редактирования: пользователю переключается админка,
+# у таблиц с одним изменяемым столбцом (изображения) сразу запрашивается значение
+async def choose_admin_row(callback_query: CallbackQuery, state: FSMContext, table, key_text):
+    key = table.decode_key(key_text)
+    if table is USERS:
+        await toggle_user_admin(callback_query.message, key)
+        return
+    await state.update_data(edit_table=table.slug, edit_key=key_text)
+    if len(table.editable) == 1:
+        await ask_admin_field(callback_query.message, state, table, table.editable[0])
+        return
+    buttons = [
+        [InlineKeyboardButton(text=table.columns[name].title, callback_data=f"edit_field_{name}")]
+        for name in table.editable
+    ]
+    buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")])
+    described = ", ".join(f"{name}={value}" for name, value in zip(table.key, key))
+    await callback_query.message.answer(
+        f"Выберите поле для редактирования записи ({described}):",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
+    )
+
+async def choose_admin_field(callback_query: CallbackQuery, state: FSMContext):
+    if not is_admin(callback_query.from_user.id):
+        await callback_query.answer("У вас нет прав администратора.")
+        return
+    data = await state.get_data()
+    table = TABLES.get(data.get("edit_table"))
+    if table is None or "edit_key" not in data:
+        await callback_query.message.answer("Ошибка: данные для редактирования не найдены.")
+        return
+    await ask_admin_field(callback_query.message, state, table, callback_query.data[len("edit_field_"):])
+
+ADMIN_VIEWS = {
+    USERS.slug: view_db_users,
+    ROOMS.slug: view_db_rooms,
+    ROOM_IMAGES.slug: view_db_images,
+    GUESTS.slug: view_db_guests,
+    SERVICES.slug: view_db_services,
+    GUEST_SERVICES.slug: view_db_guest_services,
+}
+
+ADMIN_ACTIONS = ("db", "view", "add", "edit", "edittext", "editlist", "editrow", "delmenu", "deltext", "dellist", "delrow")
+
+# Кнопки таблиц админки: "<действие>_<slug>[_<ключ>]". callback_data присылает клиент,
+# поэтому права проверяются здесь, а не только при показе меню
+async def handle_admin_callback(callback_query: CallbackQuery, state: FSMContext):
+    if not is_admin(callback_query.from_user.id):
+        await callback_query.answer("У вас нет прав администратора.")
+        return
+    chat_id = callback_query.message.chat.id
+    action, _, rest = callback_query.data.partition("_")
+    slug, _, key = rest.partition("_")
+    table = TABLES.get(slug)
+    if table is None:
+        return
+    if action == "db":
+        await show_table_menu(chat_id, table)
+    elif action == "view":
+        await ADMIN_VIEWS[slug](chat_id)
+    elif action == "add":
+        await callback_query.message.answer(
+            f"Введите данные новой записи в формате:\n{table.describe(table.add_row)}\n"
+            "Пустое значение — NULL, необязательные поля в конце можно не указывать."
+        )
+        await state.set_state(DBAdminState.waiting_for_add_row)
+        await state.update_data(edit_table=slug)
+    elif action == "edit":
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Через запятую", callback_data=f"edittext_{slug}")],
+            [InlineKeyboardButton(text="Через GUI", callback_data=f"editlist_{slug}")],
+            [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
+        ])
+        await callback_query.message.answer("Выберите способ редактирования:", reply_markup=markup)
+    elif action == "edittext":
+        key_names = ", ".join(table.key)
+        await callback_query.message.answer(
+            f"Введите данные для редактирования в формате:\n{key_names}, {table.describe(table.edit_row)}\n"
+            f"или: {key_names}, поле1=значение1, поле2=значение2, ...\n"
+            f"Поля: {', '.join(table.editable)}"
+        )
+        await state.set_state(DBAdminState.waiting_for_edit_text)
+        await state.update_data(edit_table=slug)
+    elif action == "editlist":
+        await show_rows_for(chat_id, table, "editrow")
+    elif action == "editrow":
+        await choose_admin_row(callback_query, state, table, key)
+    elif action == "delmenu":
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Выбрать из списка", callback_data=f"dellist_{slug}")],
+            [InlineKeyboardButton(text=f"Ввести {', '.join(table.key)}", callback_data=f"deltext_{slug}")],
+            [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
+        ])
+        await callback_query.message.answer("Выберите способ удаления:", reply_markup=markup)
+    elif action == "deltext":
+        await callback_query.message.answer(f"Введите данные для удаления в формате:\n{', '.join(table.key)}")
+        await state.set_state(DBAdminState.waiting_for_delete_row)
+        await state.update_data(edit_table=slug)
+    elif action == "dellist":
+        if table is ROOM_IMAGES and not key:
+            await show_rooms_for_image_delete(chat_id)
+        elif table is ROOM_IMAGES:
+            await show_rows_for(chat_id, table, "delrow", back="dellist_image", room_id=int(key))
+        else:
+            await show_rows_for(chat_id, table, "delrow")
+    elif action == "delrow":
+        await apply_admin_change(callback_query.message, table, "удалена", delete_admin_row, table, table.decode_key(key))
 
-def add_guest_service_db(guest_id, service_id, quantity, status):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO GuestServices (guest_id, service_id, quantity, order_date, status) VALUES (?, ?, ?, GETDATE(), ?)",
-                (guest_id, service_id, quantity, status)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при добавлении записи в GuestServices: {e}")
-        finally:
-            conn.close()
-    return False
+# Функции для дополнительных услуг
+# Корзина дополнительных услуг: выбор нескольких услуг и количеств в одном сообщении,
+# оформление одной вставкой. Корзина хранится в данных FSM: {str(service_id): количество}.
+CART_MAX_QUANTITY = 99
+
+# services — снимок справочника, полученный обработчиком один раз через services_async()
+def cart_items(cart, services):
+    by_id = {service.service_id: service for service in services}
+    items = []
+    for key, quantity in cart.items():
+        service = by_id.get(int(key))
+        if service is not None:
+            items.append((service, quantity))
+    return items
+
+def cart_lines(items):
+    return [f"{service.name} × {quantity} = {service.price * quantity} руб." for service, quantity in items]
+
+def cart_text(cart, services):
+    items = cart_items(cart, services)
+    parts = ["Выберите дополнительные услуги (каждое нажатие добавляет 1 шт.):"]
+    if items:
+        parts.append("")
+        parts.append("Корзина:")
+        parts.extend(cart_lines(items))
+        parts.append(f"Итого: {sum((service.price * quantity for service, quantity in items), ZERO)} руб.")
+    return "\n".join(parts)
+
+def cart_markup(cart, services):
+    buttons = []
+    for service in services:
+        quantity = cart.get(str(service.service_id), 0)
+        label = f"{service.name} - {service.price} руб."
+        row = [InlineKeyboardButton(text=f"✅ {label} ×{quantity}" if quantity else label, callback_data=f"cart_add_{service.service_id}")]
+        if quantity:
+            row.append(InlineKeyboardButton(text="➖", callback_data=f"cart_sub_{service.service_id}"))
+        buttons.append(row)
+    if cart:
+        buttons.append([InlineKeyboardButton(text="🛒 Оформить заказ", callback_data="cart_checkout")])
+        buttons.append([InlineKeyboardButton(text="Очистить корзину", callback_data="cart_clear")])
+    buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def edit_guest_service_db(guest_id, service_id, order_date, field, value):
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            if field == "quantity":
-                cursor.execute(
-                    "UPDATE GuestServices SET quantity = ? WHERE guest_id = ? AND service_id = ? AND order_date = ?",
-                    (int(value), guest_id, service_id, order_date)
-                )
-            elif field == "status":
-                cursor.execute(
-                    "UPDATE GuestServices SET status = ? WHERE guest_id = ? AND service_id = ? AND order_date = ?",
-                    (value, guest_id, service_id, order_date)
-                )
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании записи в GuestServices: {e}")
-        finally:
-            conn.close()
-    return False
+async def show_services_list(message: types.Message, state: FSMContext):
+    try:
+        services = await service_catalog.services_async()
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении списка услуг: {e}")
+        await message.answer("Произошла ошибка при получении списка услуг.")
+        return
+    if not services:
+        await message.answer("Нет доступных дополнительных услуг.")
+        return
+    cart = (await state.get_data()).get("cart") or {}
+    await message.answer(cart_text(cart, services), reply_markup=cart_markup(cart, services))
 
-def delete_guest_service_db(guest_id, service_id, order_date):
-    conn = connect_to_db()
-    if conn:
-        try:
-            logging.info(f"Удаление GuestServices: guest_id={guest_id}, service_id={service_id}, order_date={order_date}")
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM GuestServices WHERE guest_id = ? AND service_id = ? AND order_date = ?",
-                (guest_id, service_id, order_date)
-            )
-            conn.commit()
-            return cursor.rowcount > 0
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при удалении записи из GuestServices: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
+async def update_cart(callback_query: CallbackQuery, state: FSMContext, service_id=None, delta=0):
+    cart = dict((await state.get_data()).get("cart") or {})
+    if service_id is None:
+        cart = {}
+    else:
+        key = str(service_id)
+        quantity = min(max(cart.get(key, 0) + delta, 0), CART_MAX_QUANTITY)
+        if quantity:
+            cart[key] = quantity
+        else:
+            cart.pop(key, None)
+    await state.update_data(cart=cart)
+    try:
+        services = await service_catalog.services_async()
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении списка услуг: {e}")
+        await callback_query.message.answer("Произошла ошибка при получении списка услуг.")
+        return
+    try:
+        await callback_query.message.edit_text(cart_text(cart, services), reply_markup=cart_markup(cart, services))
+    except TelegramBadRequest as e:
+        logging.debug(f"Корзина не изменилась: {e}")
 
-# Функции для дополнительных услуг
-async def show_services_list(message: types.Message, state: FSMContext):
+async def checkout_cart(callback_query: CallbackQuery, state: FSMContext):
+    telegram_id = callback_query.from_user.id
+    try:
+        services = await service_catalog.services_async()
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении списка услуг: {e}")
+        await callback_query.message.answer("Произошла ошибка при заказе услуги.")
+        return
+    items = cart_items((await state.get_data()).get("cart") or {}, services)
+    if not items:
+        await callback_query.message.answer("Корзина пуста.")
+        return
     conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT service_id, name, price, short_description FROM Services")
-            services = cursor.fetchall()
-            if services:
-                buttons = [
-                    [InlineKeyboardButton(text=f"{service.name} - {service.price} руб.", callback_data=f"select_service_{service.service_id}")]
-                    for service in services
-                ]
-                buttons.append([InlineKeyboardButton(text="Назад", callback_data="back_to_main")])
-                markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-                await message.answer("Выберите дополнительную услугу:", reply_markup=markup)
-            else:
-                await message.answer("Нет доступных дополнительных услуг.")
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при получении списка услуг: {e}")
-            await message.answer("Произошла ошибка при получении списка услуг.")
-        finally:
-            conn.close()
+    if not conn:
+        await callback_query.message.answer(db_failure_text())
+        return
+    orders = []
+    try:
+        cursor = conn.cursor()
+        guest_id = resolve_active_guest(telegram_id, cursor)
+        if guest_id is None:
+            await callback_query.message.answer("У вас нет активных бронирований для заказа услуг.")
+            return
+        order_date = order_timestamp()
+        orders = staff.assign(
+            [Order(guest_id, service.service_id, order_date, quantity) for service, quantity in items],
+            {service.service_id: service.position for service, _ in items}
+        )
+        # Вся корзина — одна инструкция INSERT: один обмен с БД и одна транзакция
+        cursor.execute(
+            "INSERT INTO GuestServices (guest_id, service_id, quantity, order_date, status, employee_id) VALUES "
+            + ", ".join(["(?, ?, ?, ?, 'pending', ?)"] * len(orders)),
+            [value for order in orders for value in (
+                order.guest_id, order.service_id, order.quantity, order.order_date,
+                order.member and order.member.employee_id
+            )]
+        )
+        conn.commit()
+    except db.DBError as e:
+        conn.rollback()
+        for order in orders:
+            if order.member is not None:
+                staff.release(order.member.employee_id)
+        # Бронь из кэша могла быть удалена в обход бота — следующая попытка перечитает её
+        invalidate_guest_caches(telegram_id)
+        logging.error(f"Ошибка при заказе услуг: {e}")
+        await callback_query.message.answer("Произошла ошибка при заказе услуги.")
+        return
+    finally:
+        conn.close()
+    staff.notify(orders)
+    guest_overview_cache.invalidate(telegram_id)
+    for service, quantity in items:
+        analytics.record_service_order(service.service_id, quantity)
+    await state.update_data(cart={})
+    total = sum((service.price * quantity for service, quantity in items), ZERO)
+    await callback_query.message.answer(
+        "Ваш заказ на дополнительные услуги успешно оформлен:\n" + "\n".join(cart_lines(items)) + f"\nИтого: {total} руб."
+    )
+
+# Напоминания гостям (отправляет планировщик reminders)
+async def send_reminder(kind, booking):
+    if kind == CHECKIN:
+        text = (
+            f"{booking.first_name}, напоминаем о заезде {booking.check_in_date:%d.%m.%Y} "
+            f"с {reminders.checkin_hour}:00.\nКатегория номера: {booking.category}. Ждём вас!"
+        )
     else:
-        await message.answer("Ошибка подключения к базе данных.")
+        text = (
+            f"{booking.first_name}, сегодня день выезда. Пожалуйста, освободите номер "
+            f"до {reminders.checkout_hour}:00. Спасибо, что выбрали нас!"
+        )
+    await bot.send_message(booking.telegram_id, text)
+
+# Заказы, назначенные сотрудникам: уведомление с кнопками и закрытие заказа
+STAFF_ORDER_STATUSES = {"done": ("completed", "выполнен"), "cancel": ("canceled", "отменён")}
+
+def staff_order_markup(order):
+    key = f"{order.guest_id}_{order.service_id}_{order.order_date.isoformat()}"
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Выполнено", callback_data=f"staff_done_{key}"),
+        InlineKeyboardButton(text="❌ Отменить", callback_data=f"staff_cancel_{key}")
+    ]])
+
+async def notify_employee(order):
+    service = service_catalog.cached(order.service_id)
+    await bot.send_message(
+        order.member.telegram_id,
+        f"Новый заказ: {service.name if service else order.service_id} × {order.quantity}\n"
+        f"Гость ID: {order.guest_id}, время заказа: {order.order_date:%d.%m.%Y %H:%M}",
+        reply_markup=staff_order_markup(order)
+    )
+
+async def close_staff_order(callback_query: CallbackQuery):
+    _, action, guest_id, service_id, order_date = callback_query.data.split("_", 4)
+    status, status_text = STAFF_ORDER_STATUSES[action]
+    guest_id = int(guest_id)
+    key = (guest_id, int(service_id), datetime.fromisoformat(order_date))
+    conn = connect_to_db()
+    if not conn:
+        await callback_query.message.answer(db_failure_text())
+        return
+    try:
+        member = staff.member_for(callback_query.from_user.id)
+        if member is None:
+            await callback_query.answer("Вы не зарегистрированы как сотрудник.")
+            return
+        cursor = conn.cursor()
+        # Закрыть можно только свой открытый заказ; повторное нажатие ничего не изменит
+        cursor.execute(
+            "UPDATE GuestServices SET status = ? "
+            "WHERE guest_id = ? AND service_id = ? AND order_date = CAST(? AS DATETIME) AND employee_id = ? AND status = 'pending'",
+            (status, *key, member.employee_id)
+        )
+        closed = cursor.rowcount > 0
+        quantity = None
+        if closed and status == "canceled":
+            cursor.execute(
+                "SELECT quantity FROM GuestServices WHERE guest_id = ? AND service_id = ? AND order_date = CAST(? AS DATETIME)", key
+            )
+            quantity = cursor.fetchone().quantity
+            if key[2].date() < date.today():
+                rewind_watermark(cursor, key[2].date())
+        conn.commit()
+        owner = guest_owner(cursor, guest_id) if closed else None
+    except db.DBError as e:
+        logging.error(f"Ошибка при закрытии заказа услуги: {e}")
+        await callback_query.message.answer("Ошибка при обновлении заказа.")
+        return
+    finally:
+        conn.close()
+    if not closed:
+        await callback_query.answer("Заказ уже закрыт или передан другому сотруднику.")
+        return
+    staff.release(member.employee_id)
+    guest_overview_cache.invalidate(owner)
+    if quantity is not None:
+        analytics.record_service_cancel(key[1], quantity)
+    await callback_query.message.edit_text(f"{callback_query.message.text}\n\nСтатус: {status_text}")
+
+# «Мои бронирования» и «Мои услуги» с постраничным выводом
+def requested_page(data, prefix):
+    return int(data[len(prefix):]) if data.startswith(prefix) and data[len(prefix):].isdigit() else 0
+
+# Кнопки листания без общего числа страниц: известно только, есть ли следующая
+def guest_page_markup(prefix, page, has_next):
+    return page_markup(prefix, page, page + 2 if has_next else page + 1)
+
+async def show_my_bookings(callback_query: CallbackQuery):
+    page = requested_page(callback_query.data, "my_bookings_page_")
+    try:
+        result = load_guest_page(callback_query.from_user.id, "bookings", page)
+        if result is not None and not result[0] and page:
+            # Кнопка устарела (брони удалены) — первая страница
+            page = 0
+            result = load_guest_page(callback_query.from_user.id, "bookings", page)
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении бронирований: {e}")
+        await callback_query.message.answer("Ошибка при получении данных.")
+        return
+    if result is None:
+        return
+    bookings, has_next = result
+    if not bookings:
+        await callback_query.message.answer("У вас нет активных бронирований.")
+        return
+    parts = ["Ваши бронирования:\n"]
+    parts.extend(
+        f"ID брони: {booking.guest_id}, Комната ID: {booking.room_id}, Заезд: {booking.check_in_date}, Выезд: {booking.check_out_date}\n"
+        for booking in bookings
+    )
+    if page or has_next:
+        parts.append(f"\nСтраница {page + 1}")
+    text = "".join(parts)
+    await answer_page(callback_query, text, guest_page_markup("my_bookings_page", page, has_next), callback_query.data != "my_bookings")
+
+async def show_my_services(callback_query: CallbackQuery):
+    page = requested_page(callback_query.data, "my_services_page_")
+    try:
+        result = load_guest_page(callback_query.from_user.id, "services", page)
+        if result is not None and not result[0] and page:
+            page = 0
+            result = load_guest_page(callback_query.from_user.id, "services", page)
+        # Пустой список: уточняем, есть ли вообще активное бронирование
+        active = result is not None and (result[0] or resolve_active_guest(callback_query.from_user.id) is not None)
+    except db.DBError as e:
+        logging.error(f"Ошибка при получении услуг: {e}")
+        await callback_query.message.answer("Произошла ошибка при получении данных.")
+        return
+    if result is None:
+        return
+    services, has_next = result
+    if not active:
+        await callback_query.message.answer("У вас нет активных бронирований.")
+        return
+    if not services:
+        await callback_query.message.answer("У вас нет заказанных услуг.")
+        return
+    parts = ["Ваши заказанные услуги:\n"]
+    parts.extend(
+        f"Услуга: {service.name}, Количество: {service.quantity}, Дата заказа: {service.order_date}, Статус: {service.status}\n"
+        for service in services
+    )
+    if page or has_next:
+        parts.append(f"\nСтраница {page + 1}")
+    text = "".join(parts)
+    await answer_page(callback_query, text, guest_page_markup("my_services_page", page, has_next), callback_query.data != "my_services")
 
 # Callback-хендлер
 @router.callback_query()
@@ -1072,103 +1617,38 @@ async def handle_callback(callback_query: CallbackQuery, state: FSMContext):
         elif callback_query.data.startswith("book_"):
             room_id = callback_query.data.split("_")[1]
             if room_id.isdigit():
-                room_id = int(room_id)
-                conn = connect_to_db()
-                if conn:
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute("SELECT quantity FROM Rooms WHERE room_id = ? AND status = 'available'", (room_id,))
-                        result = cursor.fetchone()
-                        if result and result.quantity > 0:
-                            await state.update_data(room_id=room_id, telegram_id=callback_query.from_user.id)
-                            await callback_query.message.answer("Введите ваше имя:")
-                            await state.set_state(BookingState.waiting_for_first_name)
-                        else:
-                            await callback_query.message.answer("Этот номер уже забронирован или отсутствует.")
-                    except pyodbc.Error as e:
-                        logging.error(f"Ошибка при проверке комнаты: {e}")
-                        await callback_query.message.answer("Произошла ошибка при бронировании.")
-                    finally:
-                        conn.close()
+                await start_booking(callback_query.message, state, int(room_id), callback_query.from_user.id)
         elif callback_query.data == "show_rooms":
             await rooms(callback_query.message, state)
-        elif callback_query.data == "my_bookings":
-            telegram_id = callback_query.from_user.id
-            conn = connect_to_db()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT guest_id, room_id, check_in_date, check_out_date FROM Guests WHERE telegram_id = ?", (telegram_id,))
-                    bookings = cursor.fetchall()
-                    if not bookings:
-                        await callback_query.message.answer("У вас нет активных бронирований.")
-                    else:
-                        text = "Ваши бронирования:\n"
-                        for booking in bookings:
-                            text += f"ID брони: {booking.guest_id}, Комната ID: {booking.room_id}, Заезд: {booking.check_in_date}, Выезд: {booking.check_out_date}\n"
-                        await callback_query.message.answer(text)
-                except pyodbc.Error as e:
-                    logging.error(f"Ошибка при получении бронирований: {e}")
-                    await callback_query.message.answer("Ошибка при получении данных.")
-                finally:
-                    conn.close()
-        elif callback_query.data == "my_services":
-            telegram_id = callback_query.from_user.id
-            conn = connect_to_db()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT guest_id FROM Guests WHERE telegram_id = ? AND check_out_date >= GETDATE()", (telegram_id,))
-                    guest = cursor.fetchone()
-                    if guest:
-                        guest_id = guest.guest_id
-                        cursor.execute("""
-                            SELECT s.name, gs.quantity, gs.order_date, gs.status
-                            FROM GuestServices gs
-                            JOIN Services s ON gs.service_id = s.service_id
-                            WHERE gs.guest_id = ?
-                        """, (guest_id,))
-                        services = cursor.fetchall()
-                        if services:
-                            text = "Ваши заказанные услуги:\n"
-                            for service in services:
-                                text += f"Услуга: {service.name}, Количество: {service.quantity}, Дата заказа: {service.order_date}, Статус: {service.status}\n"
-                            await callback_query.message.answer(text)
-                        else:
-                            await callback_query.message.answer("У вас нет заказанных услуг.")
-                    else:
-                        await callback_query.message.answer("У вас нет активных бронирований.")
-                except pyodbc.Error as e:
-                    logging.error(f"Ошибка при получении услуг: {e}")
-                    await callback_query.message.answer("Произошла ошибка при получении данных.")
-                finally:
-                    conn.close()
+        elif callback_query.data.startswith("room_search_page_"):
+            await show_room_search(callback_query, state)
+        elif callback_query.data == "my_bookings" or callback_query.data.startswith("my_bookings_page_"):
+            await show_my_bookings(callback_query)
+        elif callback_query.data == "my_services" or callback_query.data.startswith("my_services_page_"):
+            await show_my_services(callback_query)
         elif callback_query.data == "additional_services":
-            telegram_id = callback_query.from_user.id
-            conn = connect_to_db()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT guest_id FROM Guests WHERE telegram_id = ? AND check_out_date >= GETDATE()", (telegram_id,))
-                    booking = cursor.fetchone()
-                    if booking:
-                        await show_services_list(callback_query.message, state)
-                    else:
-                        await callback_query.message.answer("У вас нет активных бронирований. Пожалуйста, забронируйте номер, чтобы заказать дополнительные услуги.")
-                except pyodbc.Error as e:
-                    logging.error(f"Ошибка при проверке бронирования: {e}")
-                    await callback_query.message.answer("Произошла ошибка при проверке бронирования.")
-                finally:
-                    conn.close()
+            try:
+                guest_id = resolve_active_guest(callback_query.from_user.id)
+            except db.DBError as e:
+                logging.error(f"Ошибка при проверке бронирования: {e}")
+                await callback_query.message.answer("Произошла ошибка при проверке бронирования.")
             else:
-                await callback_query.message.answer("Ошибка подключения к базе данных.")
-        elif callback_query.data.startswith("select_service_"):
-            service_id = int(callback_query.data.split("_")[2])
-            await state.update_data(selected_service_id=service_id)
-            await callback_query.message.answer("Введите количество услуг, которые вы хотите заказать:")
-            await state.set_state(OrderServiceState.waiting_for_quantity)
+                if guest_id is not None:
+                    await show_services_list(callback_query.message, state)
+                else:
+                    await callback_query.message.answer("У вас нет активных бронирований. Пожалуйста, забронируйте номер, чтобы заказать дополнительные услуги.")
+        elif callback_query.data.startswith(("cart_add_", "cart_sub_", "select_service_")):
+            # select_service_ — кнопки старых сообщений со списком услуг
+            service_id = int(callback_query.data.rsplit("_", 1)[1])
+            await update_cart(callback_query, state, service_id, -1 if callback_query.data.startswith("cart_sub_") else 1)
+        elif callback_query.data == "cart_clear":
+            await update_cart(callback_query, state)
+        elif callback_query.data == "cart_checkout":
+            await checkout_cart(callback_query, state)
+        elif callback_query.data.startswith(("staff_done_", "staff_cancel_")):
+            await close_staff_order(callback_query)
         elif callback_query.data == "back_to_main":
-            await start(callback_query.message)
+            await start(callback_query.message, state, event_from_user=callback_query.from_user)
         elif callback_query.data in ["reviews", "tech_support"]:
             await callback_query.message.answer("Эта функция находится в разработке.")
         elif callback_query.data == "broadcast":
@@ -1183,423 +1663,20 @@ async def handle_callback(callback_query: CallbackQuery, state: FSMContext):
         elif callback_query.data == "start_broadcast":
             await callback_query.message.answer("Введите текст рассылки:")
             await state.set_state(AdminState.waiting_for_broadcast)
+        elif callback_query.data == "analytics":
+            if is_admin(callback_query.from_user.id):
+                await show_analytics(chat_id)
+            else:
+                await callback_query.answer("У вас нет прав администратора.")
         elif callback_query.data == "DB":
             if is_admin(callback_query.from_user.id):
                 await show_db_menu(chat_id)
             else:
                 await callback_query.answer("У вас нет прав администратора.")
-        elif callback_query.data == "db_users":
-            await show_users_menu(chat_id)
-        elif callback_query.data == "view_users":
-            await view_db_users(chat_id)
-        elif callback_query.data == "add_user":
-            await callback_query.message.answer("Введите данные нового пользователя в формате:\ntelegram_id, first_name, last_name, username, admin(0 или 1)")
-            await state.set_state(DBAdminState.waiting_for_add_user)
-        elif callback_query.data == "edit_user":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Через запятую", callback_data="edit_user_text")],
-                [InlineKeyboardButton(text="Через GUI", callback_data="edit_user_gui")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ редактирования пользователя:", reply_markup=markup)
-        elif callback_query.data == "edit_user_text":
-            await callback_query.message.answer("Введите данные для редактирования пользователя в формате:\ntelegram_id, admin(0 или 1)")
-            await state.set_state(DBAdminState.waiting_for_edit_user)
-        elif callback_query.data == "edit_user_gui":
-            await show_users_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_user_gui_"):
-            telegram_id = callback_query.data.split("_")[3]
-            conn = connect_to_db()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT admin FROM Users WHERE telegram_id = ?", (telegram_id,))
-                    result = cursor.fetchone()
-                    if result:
-                        current_admin = result[0]
-                        new_admin = 0 if current_admin == 1 else 1
-                        if edit_user_db(telegram_id, new_admin):
-                            status_text = "назначен администратором" if new_admin == 1 else "снята админка"
-                            await callback_query.message.answer(f"Пользователь {telegram_id} теперь {status_text}.")
-                        else:
-                            await callback_query.message.answer("Ошибка при редактировании пользователя.")
-                    else:
-                        await callback_query.message.answer("Пользователь не найден.")
-                except Exception as e:
-                    logging.error(f"Ошибка при редактировании пользователя: {e}")
-                    await callback_query.message.answer("Ошибка при редактировании пользователя.")
-                finally:
-                    conn.close()
-        elif callback_query.data == "delete_user_menu":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Выбрать из списка", callback_data="delete_user_gui")],
-                [InlineKeyboardButton(text="Ввести ID", callback_data="delete_user_id")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ удаления пользователя:", reply_markup=markup)
-        elif callback_query.data == "delete_user_id":
-            await callback_query.message.answer("Введите telegram_id пользователя для удаления:")
-            await state.set_state(DBAdminState.waiting_for_delete_user)
-        elif callback_query.data == "delete_user_gui":
-            await show_users_for_delete(chat_id)
-        elif callback_query.data.startswith("delete_user_"):
-            telegram_id = callback_query.data.split("_")[2]
-            if delete_user_db(telegram_id):
-                await callback_query.message.answer(f"Пользователь {telegram_id} удалён.")
-            else:
-                await callback_query.message.answer("Ошибка при удалении пользователя.")
-        elif callback_query.data == "db_rooms":
-            await show_rooms_menu(chat_id)
-        elif callback_query.data == "view_rooms":
-            await view_db_rooms(chat_id)
-        elif callback_query.data == "add_room":
-            await callback_query.message.answer("Введите данные нового номера в формате:\ncategory, description, price, quantity, status")
-            await state.set_state(DBAdminState.waiting_for_add_room)
-        elif callback_query.data == "edit_room":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Через запятую", callback_data="edit_room_text")],
-                [InlineKeyboardButton(text="Через GUI", callback_data="edit_room_gui")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ редактирования номера:", reply_markup=markup)
-        elif callback_query.data == "edit_room_text":
-            await callback_query.message.answer("Введите данные для редактирования номера в формате:\nroom_id, category, description, price, quantity, status")
-            await state.set_state(DBAdminState.waiting_for_edit_room)
-        elif callback_query.data == "edit_room_gui":
-            await show_rooms_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_room_gui_"):
-            room_id = callback_query.data.split("_")[3]
-            await state.update_data(edit_room_id=room_id)
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Категория", callback_data="edit_room_category")],
-                [InlineKeyboardButton(text="Описание", callback_data="edit_room_description")],
-                [InlineKeyboardButton(text="Цена", callback_data="edit_room_price")],
-                [InlineKeyboardButton(text="Количество", callback_data="edit_room_quantity")],
-                [InlineKeyboardButton(text="Статус", callback_data="edit_room_status")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer(f"Выберите поле для редактирования номера ID {room_id}:", reply_markup=markup)
-        elif callback_query.data == "edit_room_category":
-            await callback_query.message.answer("Введите новую категорию:")
-            await state.set_state(DBAdminState.waiting_for_room_edit_gui)
-            await state.update_data(edit_field="category")
-        elif callback_query.data == "edit_room_description":
-            await callback_query.message.answer("Введите новое описание:")
-            await state.set_state(DBAdminState.waiting_for_room_edit_gui)
-            await state.update_data(edit_field="description")
-        elif callback_query.data == "edit_room_price":
-            await callback_query.message.answer("Введите новую цену:")
-            await state.set_state(DBAdminState.waiting_for_room_edit_gui)
-            await state.update_data(edit_field="price")
-        elif callback_query.data == "edit_room_quantity":
-            await callback_query.message.answer("Введите новое количество:")
-            await state.set_state(DBAdminState.waiting_for_room_edit_gui)
-            await state.update_data(edit_field="quantity")
-        elif callback_query.data == "edit_room_status":
-            await callback_query.message.answer("Введите новый статус:")
-            await state.set_state(DBAdminState.waiting_for_room_edit_gui)
-            await state.update_data(edit_field="status")
-        elif callback_query.data == "delete_room_menu":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Выбрать из списка", callback_data="delete_room_gui")],
-                [InlineKeyboardButton(text="Ввести ID", callback_data="delete_room_id")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ удаления номера:", reply_markup=markup)
-        elif callback_query.data == "delete_room_id":
-            await callback_query.message.answer("Введите room_id номера для удаления:")
-            await state.set_state(DBAdminState.waiting_for_delete_room)
-        elif callback_query.data == "delete_room_gui":
-            await show_rooms_for_delete(chat_id)
-        elif callback_query.data.startswith("delete_room_"):
-            room_id = callback_query.data.split("_")[2]
-            if delete_room_db(room_id):
-                await callback_query.message.answer(f"Номер {room_id} удалён.")
-            else:
-                await callback_query.message.answer("Ошибка при удалении номера.")
-        elif callback_query.data == "db_images":
-            await show_images_menu(chat_id)
-        elif callback_query.data == "view_images":
-            await view_db_images(chat_id)
-        elif callback_query.data == "add_image":
-            await callback_query.message.answer("Введите данные нового изображения в формате:\nroom_id, image_url")
-            await state.set_state(DBAdminState.waiting_for_add_image)
-        elif callback_query.data == "edit_image":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Через запятую", callback_data="edit_image_text")],
-                [InlineKeyboardButton(text="Через GUI", callback_data="edit_image_gui")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ редактирования изображения:", reply_markup=markup)
-        elif callback_query.data == "edit_image_text":
-            await callback_query.message.answer("Введите данные для редактирования изображения в формате:\nroom_id, old_image_url, new_image_url")
-            await state.set_state(DBAdminState.waiting_for_edit_image)
-        elif callback_query.data == "edit_image_gui":
-            await show_images_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_image_gui_"):
-            parts = callback_query.data.split("_")
-            room_id = parts[3]
-            old_url = "_".join(parts[4:])
-            await state.update_data(edit_image_room_id=room_id, edit_image_old_url=old_url)
-            await callback_query.message.answer(f"Введите новый URL для изображения комнаты ID {room_id}:")
-            await state.set_state(DBAdminState.waiting_for_image_edit_gui)
-        elif callback_query.data == "delete_image_menu":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Выбрать из списка", callback_data="delete_image_gui")],
-                [InlineKeyboardButton(text="Ввести room_id и URL", callback_data="delete_image_id")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ удаления изображения:", reply_markup=markup)
-        elif callback_query.data == "delete_image_id":
-            await callback_query.message.answer("Введите данные для удаления изображения в формате:\nroom_id, image_url")
-            await state.set_state(DBAdminState.waiting_for_delete_image)
-        elif callback_query.data == "delete_image_gui":
-            await show_rooms_for_image_delete(chat_id)
-        elif callback_query.data.startswith("select_room_image_"):
-            room_id = callback_query.data.split("_")[3]
-            await show_images_for_delete(chat_id, room_id)
-        elif callback_query.data.startswith("delete_image_"):
-            parts = callback_query.data.split("_", 3)
-            room_id = parts[2]
-            image_url = parts[3]
-            if delete_image_db(room_id, image_url):
-                await callback_query.message.answer(f"Изображение {image_url} для комнаты ID {room_id} удалено.")
-            else:
-                await callback_query.message.answer("Ошибка при удалении изображения.")
-        elif callback_query.data == "db_guests":
-            await show_guests_menu(chat_id)
-        elif callback_query.data == "view_guests":
-            await view_db_guests(chat_id)
-        elif callback_query.data == "add_guest":
-            await callback_query.message.answer("Введите данные нового гостя в формате:\nroom_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment")
-            await state.set_state(DBAdminState.waiting_for_add_guest)
-        elif callback_query.data == "edit_guest":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Через запятую", callback_data="edit_guest_text")],
-                [InlineKeyboardButton(text="Через GUI", callback_data="edit_guest_gui")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ редактирования гостя:", reply_markup=markup)
-        elif callback_query.data == "edit_guest_text":
-            await callback_query.message.answer("Введите данные для редактирования гостя в формате:\nguest_id, field1=value1, field2=value2, ...")
-            await state.set_state(DBAdminState.waiting_for_edit_guest)
-        elif callback_query.data == "edit_guest_gui":
-            await show_guests_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_guest_gui_"):
-            guest_id = callback_query.data.split("_")[3]
-            await state.update_data(edit_guest_id=guest_id)
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Room ID", callback_data="edit_guest_room_id")],
-                [InlineKeyboardButton(text="Telegram ID", callback_data="edit_guest_telegram_id")],
-                [InlineKeyboardButton(text="Имя", callback_data="edit_guest_first_name")],
-                [InlineKeyboardButton(text="Фамилия", callback_data="edit_guest_last_name")],
-                [InlineKeyboardButton(text="Email", callback_data="edit_guest_email")],
-                [InlineKeyboardButton(text="Телефон", callback_data="edit_guest_phone")],
-                [InlineKeyboardButton(text="Дата заезда", callback_data="edit_guest_check_in_date")],
-                [InlineKeyboardButton(text="Дата выезда", callback_data="edit_guest_check_out_date")],
-                [InlineKeyboardButton(text="Комментарий", callback_data="edit_guest_comment")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer(f"Выберите поле для редактирования гостя ID {guest_id}:", reply_markup=markup)
-        elif callback_query.data == "edit_guest_room_id":
-            await callback_query.message.answer("Введите новый room_id:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="room_id")
-        elif callback_query.data == "edit_guest_telegram_id":
-            await callback_query.message.answer("Введите новый telegram_id:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="telegram_id")
-        elif callback_query.data == "edit_guest_first_name":
-            await callback_query.message.answer("Введите новое имя:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="first_name")
-        elif callback_query.data == "edit_guest_last_name":
-            await callback_query.message.answer("Введите новую фамилию:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="last_name")
-        elif callback_query.data == "edit_guest_email":
-            await callback_query.message.answer("Введите новый email:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="email")
-        elif callback_query.data == "edit_guest_phone":
-            await callback_query.message.answer("Введите новый телефон:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="phone")
-        elif callback_query.data == "edit_guest_check_in_date":
-            await callback_query.message.answer("Введите новую дату заезда (ГГГГ-ММ-ДД):")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="check_in_date")
-        elif callback_query.data == "edit_guest_check_out_date":
-            await callback_query.message.answer("Введите новую дату выезда (ГГГГ-ММ-ДД):")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="check_out_date")
-        elif callback_query.data == "edit_guest_comment":
-            await callback_query.message.answer("Введите новый комментарий:")
-            await state.set_state(DBAdminState.waiting_for_guest_edit_gui)
-            await state.update_data(edit_field="comment")
-        elif callback_query.data == "delete_guest_menu":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Выбрать из списка", callback_data="delete_guest_gui")],
-                [InlineKeyboardButton(text="Ввести ID", callback_data="delete_guest_id")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ удаления гостя:", reply_markup=markup)
-        elif callback_query.data == "delete_guest_id":
-            await callback_query.message.answer("Введите guest_id для удаления:")
-            await state.set_state(DBAdminState.waiting_for_delete_guest)
-        elif callback_query.data == "delete_guest_gui":
-            await show_guests_for_delete(chat_id)
-        elif callback_query.data.startswith("delete_guest_"):
-            guest_id = callback_query.data.split("_")[2]
-            conn = connect_to_db()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM Guests WHERE guest_id = ?", (guest_id,))
-                    conn.commit()
-                    if cursor.rowcount > 0:
-                        await callback_query.message.answer(f"Гость {guest_id} удалён.")
-                    else:
-                        await callback_query.message.answer("Гость с таким ID не найден.")
-                except pyodbc.Error as e:
-                    logging.error(f"Ошибка при удалении гостя: {e}")
-                    await callback_query.message.answer("Ошибка при удалении гостя.")
-                finally:
-                    conn.close()
-        elif callback_query.data == "db_services":
-            await show_services_menu(chat_id)
-        elif callback_query.data == "view_services":
-            await view_db_services(chat_id)
-        elif callback_query.data == "add_service":
-            await callback_query.message.answer("Введите данные новой услуги в формате:\nname, price, short_description, detailed_description")
-            await state.set_state(DBAdminState.waiting_for_add_service)
-        elif callback_query.data == "edit_service":
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Через запятую", callback_data="edit_service_text")],
-                [InlineKeyboardButton(text="Через GUI", callback_data="edit_service_gui")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer("Выберите способ редактирования услуги:", reply_markup=markup)
-        elif callback_query.data == "edit_service_text":
-            await callback_query.message.answer("Введите ID услуги и новые данные в формате:\nservice_id, name, price, short_description, detailed_description")
-            await state.set_state(DBAdminState.waiting_for_edit_service)
-        elif callback_query.data == "edit_service_gui":
-            await show_services_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_service_gui_"):
-            service_id = callback_query.data.split("_")[3]
-            await state.update_data(edit_service_id=service_id)
-            markup = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Название", callback_data="edit_service_name")],
-                [InlineKeyboardButton(text="Цена", callback_data="edit_service_price")],
-                [InlineKeyboardButton(text="Краткое описание", callback_data="edit_service_short_desc")],
-                [InlineKeyboardButton(text="Подробное описание", callback_data="edit_service_detailed_desc")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-            ])
-            await callback_query.message.answer(f"Выберите поле для редактирования услуги ID {service_id}:", reply_markup=markup)
-        elif callback_query.data == "edit_service_name":
-            await callback_query.message.answer("Введите новое название:")
-            await state.set_state(DBAdminState.waiting_for_service_edit_gui)
-            await state.update_data(edit_field="name")
-        elif callback_query.data == "edit_service_price":
-            await callback_query.message.answer("Введите новую цену:")
-            await state.set_state(DBAdminState.waiting_for_service_edit_gui)
-            await state.update_data(edit_field="price")
-        elif callback_query.data == "edit_service_short_desc":
-            await callback_query.message.answer("Введите новое краткое описание:")
-            await state.set_state(DBAdminState.waiting_for_service_edit_gui)
-            await state.update_data(edit_field="short_description")
-        elif callback_query.data == "edit_service_detailed_desc":
-            await callback_query.message.answer("Введите новое подробное описание:")
-            await state.set_state(DBAdminState.waiting_for_service_edit_gui)
-            await state.update_data(edit_field="detailed_description")
-        elif callback_query.data == "delete_service":
-            await show_services_for_delete(chat_id)
-        elif callback_query.data.startswith("delete_service_"):
-            service_id = callback_query.data.split("_")[2]
-            if delete_service_db(service_id):
-                await callback_query.message.answer(f"Услуга ID {service_id} удалена.")
-            else:
-                await callback_query.message.answer("Ошибка при удалении услуги.")
-        elif callback_query.data == "db_guest_services":
-            await show_guest_services_menu(chat_id)
-        elif callback_query.data == "view_guest_services":
-            await view_db_guest_services(chat_id)
-        elif callback_query.data == "add_guest_service":
-            await callback_query.message.answer("Введите данные для добавления в GuestServices в формате:\nguest_id, service_id, quantity, status")
-            await state.set_state(DBAdminState.waiting_for_add_guest_service)
-        elif callback_query.data == "edit_guest_service":
-            await show_guest_services_for_edit(chat_id)
-        elif callback_query.data.startswith("edit_gs_"):
-            try:
-                parts = callback_query.data.split("_")
-                logging.info(f"callback_data for edit_gs_: {callback_query.data}")
-                if len(parts) >= 5:  # Выбор записи для редактирования
-                    guest_id = int(parts[2])
-                    service_id = int(parts[3])
-                    order_date_str = parts[4]
-                    order_date = datetime.fromisoformat(order_date_str)
-                    # Сохраняем все три значения в состоянии
-                    await state.update_data(
-                        edit_guest_id=guest_id,
-                        edit_service_id=service_id,
-                        edit_order_date=order_date
-                    )
-                    markup = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="Количество", callback_data="edit_gs_quantity")],
-                        [InlineKeyboardButton(text="Статус", callback_data="edit_gs_status")],
-                        [InlineKeyboardButton(text="Назад", callback_data="back_to_DB_menu")]
-                    ])
-                    await callback_query.message.answer(
-                        f"Выберите поле для редактирования записи (Гость: {guest_id}, Услуга: {service_id}, Дата: {order_date}):",
-                        reply_markup=markup
-                    )
-                elif callback_query.data == "edit_gs_quantity":
-                    await callback_query.message.answer("Введите новое количество:")
-                    await state.set_state(DBAdminState.waiting_for_guest_service_edit_gui)
-                    await state.update_data(edit_field="quantity")
-                elif callback_query.data == "edit_gs_status":
-                    await callback_query.message.answer("Введите новый статус:")
-                    await state.set_state(DBAdminState.waiting_for_guest_service_edit_gui)
-                    await state.update_data(edit_field="status")
-                else:
-                    raise ValueError("Неизвестная команда редактирования")
-            except (ValueError, IndexError) as e:
-                logging.error(f"Ошибка разбора callback_data для редактирования: {e}")
-                await callback_query.message.answer("Некорректный запрос на редактирование.")
-        elif callback_query.data == "edit_gs_quantity":
-            await callback_query.message.answer("Введите новое количество:")
-            await state.set_state(DBAdminState.waiting_for_guest_service_edit_gui)
-            await state.update_data(edit_field="quantity")
-        elif callback_query.data == "edit_gs_status":
-            await callback_query.message.answer("Введите новый статус:")
-            await state.set_state(DBAdminState.waiting_for_guest_service_edit_gui)
-            await state.update_data(edit_field="status")
-        elif callback_query.data == "delete_guest_service":
-            await show_guest_services_for_delete(chat_id)
-        elif callback_query.data.startswith("delete_gs_"):
-            try:
-                # Разбираем callback_data для получения составного ключа
-                parts = callback_query.data.split("_")
-                logging.info(f"callback_data for delete_gs_: {callback_query.data}")
-                if len(parts) < 5:
-                    raise ValueError("Некорректный формат callback_data")
-                guest_id = int(parts[2])  # Преобразуем в int
-                service_id = int(parts[3])  # Преобразуем в int
-                order_date_str = parts[4]
-                order_date = datetime.fromisoformat(order_date_str)
-                # Вызываем функцию удаления с тремя значениями
-                if delete_guest_service_db(guest_id, service_id, order_date):
-                    await callback_query.message.answer(
-                        f"Запись (Гость: {guest_id}, Услуга: {service_id}, Дата: {order_date}) удалена."
-                    )
-                else:
-                    await callback_query.message.answer("Ошибка при удалении записи.")
-            except (ValueError, IndexError) as e:
-                logging.error(f"Ошибка разбора callback_data для удаления: {e}")
-                await callback_query.message.answer("Некорректный запрос на удаление.")
-            except pyodbc.Error as e:
-                logging.error(f"Ошибка базы данных при удалении GuestServices: {e}")
-                await callback_query.message.answer("Ошибка базы данных при удалении.")
+        elif callback_query.data.startswith("edit_field_"):
+            await choose_admin_field(callback_query, state)
+        elif callback_query.data.partition("_")[0] in ADMIN_ACTIONS:
+            await handle_admin_callback(callback_query, state)
         elif callback_query.data == "back_to_apanel":
             await admin_panel(callback_query.message)
         elif callback_query.data == "admin_panel":
@@ -1621,524 +1698,70 @@ async def handle_callback(callback_query: CallbackQuery, state: FSMContext):
         await callback_query.message.answer("Произошла ошибка при обработке запроса.")
     await callback_query.answer()
 
-# Обработчики для операций с таблицей Users
-@dp.message(DBAdminState.waiting_for_add_user)
-async def process_add_user(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 5:
-            await message.answer("Неверный формат. Ожидается: telegram_id, first_name, last_name, username, admin(0 или 1)")
-            return
-        telegram_id, first_name, last_name, username, admin = parts
-        telegram_id = int(telegram_id)
-        admin = int(admin)
-        if add_user_db(telegram_id, first_name, last_name, username, admin):
-            await message.answer("Пользователь успешно добавлен.")
-        else:
-            await message.answer("Ошибка при добавлении пользователя.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления пользователя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_edit_user)
-async def process_edit_user(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 2:
-            await message.answer("Неверный формат. Ожидается: telegram_id, admin(0 или 1)")
-            return
-        telegram_id, admin = parts
-        telegram_id = int(telegram_id)
-        admin = int(admin)
-        if edit_user_db(telegram_id, admin):
-            await message.answer("Пользователь успешно обновлён.")
-        else:
-            await message.answer("Ошибка при редактировании пользователя.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для редактирования пользователя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_delete_user)
-async def process_delete_user(message: types.Message, state: FSMContext):
-    try:
-        telegram_id = int(message.text.strip())
-        if delete_user_db(telegram_id):
-            await message.answer("Пользователь успешно удалён.")
-        else:
-            await message.answer("Ошибка при удалении пользователя.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для удаления пользователя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-# Обработчики для операций с таблицей Rooms
-@dp.message(DBAdminState.waiting_for_add_room)
-async def process_add_room(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 5:
-            await message.answer("Неверный формат. Ожидается: category, description, price, quantity, status")
-            return
-        category, description, price, quantity, status = parts
-        price = float(price)
-        quantity = int(quantity)
-        if add_room_db(category, description, price, quantity, status):
-            await message.answer("Номер успешно добавлен.")
-        else:
-            await message.answer("Ошибка при добавлении номера.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления номера: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_edit_room)
-async def process_edit_room(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 6:
-            await message.answer("Неверный формат. Ожидается: room_id, category, description, price, quantity, status")
-            return
-        room_id, category, description, price, quantity, status = parts
-        room_id = int(room_id)
-        price = float(price)
-        quantity = int(quantity)
-        if edit_room_db(room_id, category, description, price, quantity, status):
-            await message.answer("Номер успешно обновлён.")
-        else:
-            await message.answer("Ошибка при редактировании номера.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для редактирования номера: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_room_edit_gui)
-async def process_room_edit_gui(message: types.Message, state: FSMContext):
-    new_value = message.text.strip()
-    data = await state.get_data()
-    room_id = data.get("edit_room_id")
-    field = data.get("edit_field")
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            if field == "category":
-                cursor.execute("UPDATE Rooms SET category = ? WHERE room_id = ?", (new_value, room_id))
-            elif field == "description":
-                cursor.execute("UPDATE Rooms SET description = ? WHERE room_id = ?", (new_value, room_id))
-            elif field == "price":
-                cursor.execute("UPDATE Rooms SET price = ? WHERE room_id = ?", (float(new_value), room_id))
-            elif field == "quantity":
-                cursor.execute("UPDATE Rooms SET quantity = ? WHERE room_id = ?", (int(new_value), room_id))
-            elif field == "status":
-                cursor.execute("UPDATE Rooms SET status = ? WHERE room_id = ?", (new_value, room_id))
-            conn.commit()
-            await message.answer(f"Поле '{field}' для номера ID {room_id} успешно обновлено.")
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании поля {field} для номера ID {room_id}: {e}")
-            await message.answer("Ошибка при редактировании поля.")
-        finally:
-            conn.close()
-    await state.clear()
-
-@dp.message(DBAdminState.waiting_for_delete_room)
-async def process_delete_room(message: types.Message, state: FSMContext):
-    try:
-        room_id = int(message.text.strip())
-        if delete_room_db(room_id):
-            await message.answer("Номер успешно удалён.")
-        else:
-            await message.answer("Ошибка при удалении номера.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для удаления номера: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-# Обработчики для операций с таблицей RoomImages
-@dp.message(DBAdminState.waiting_for_add_image)
-async def process_add_image(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 2:
-            await message.answer("Неверный формат. Ожидается: room_id, image_url")
-            return
-        room_id, image_url = parts
-        room_id = int(room_id)
-        if add_image_db(room_id, image_url):
-            await message.answer("Изображение успешно добавлено.")
-        else:
-            await message.answer("Ошибка при добавлении изображения.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления изображения: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_edit_image)
-async def process_edit_image(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 3:
-            await message.answer("Неверный формат. Ожидается: room_id, old_image_url, new_image_url")
-            return
-        room_id, old_url, new_url = parts
-        room_id = int(room_id)
-        if edit_image_db(room_id, old_url, new_url):
-            await message.answer("Изображение успешно обновлено.")
-        else:
-            await message.answer("Ошибка при редактировании изображения.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для редактирования изображения: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_image_edit_gui)
-async def process_image_edit_gui(message: types.Message, state: FSMContext):
-    new_url = message.text.strip()
-    data = await state.get_data()
-    room_id = data.get("edit_image_room_id")
-    old_url = data.get("edit_image_old_url")
-    if edit_image_db(room_id, old_url, new_url):
-        await message.answer("Изображение успешно обновлено.")
-    else:
-        await message.answer("Ошибка при редактировании изображения.")
-    await state.clear()
-
-@dp.message(DBAdminState.waiting_for_delete_image)
-async def process_delete_image(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 2:
-            await message.answer("Неверный формат. Ожидается: room_id, image_url")
-            return
-        room_id, image_url = parts
-        room_id = int(room_id)
-        if delete_image_db(room_id, image_url):
-            await message.answer("Изображение успешно удалено.")
-        else:
-            await message.answer("Ошибка при удалении изображения.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для удаления изображения: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-# Обработчики для операций с таблицей Guests
-@dp.message(DBAdminState.waiting_for_add_guest)
-async def process_add_guest(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 9:
-            await message.answer("Неверный формат. Ожидается: room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment")
-            return
-        room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment = parts
-        room_id = int(room_id)
-        telegram_id = int(telegram_id)
-        email = email if email else None
-        phone = phone if phone else None
-        comment = comment if comment else None
-        conn = connect_to_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    INSERT INTO Guests (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment, booking_date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
-                    """,
-                    (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment)
-                )
-                conn.commit()
-                await message.answer("Гость успешно добавлен.")
-            except pyodbc.Error as e:
-                logging.error(f"Ошибка при добавлении гостя: {e}")
-                await message.answer("Ошибка при добавлении гостя.")
-            finally:
-                conn.close()
-        else:
-            await message.answer("Ошибка подключения к базе данных.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления гостя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_edit_guest)
-async def process_edit_guest(message: types.Message, state: FSMContext):
-    try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) < 2:
-            await message.answer("Неверный формат. Ожидается: guest_id, field1=value1, field2=value2, ...")
-            return
-        guest_id = int(parts[0])
-        updates = {}
-        for part in parts[1:]:
-            if "=" not in part:
-                await message.answer(f"Неверный формат для обновления: {part}")
-                return
-            field, value = part.split("=", 1)
-            field = field.strip()
-            value = value.strip() or None
-            if field not in ["room_id", "telegram_id", "first_name", "last_name", "email", "phone", "check_in_date", "check_out_date", "comment"]:
-                await message.answer(f"Недопустимое поле: {field}")
-                return
-            updates[field] = value
-        if not updates:
-            await message.answer("Нет полей для обновления.")
-            return
-        conn = connect_to_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                set_clause = ", ".join([f"{field} = ?" for field in updates])
-                values = list(updates.values()) + [guest_id]
-                query = f"UPDATE Guests SET {set_clause} WHERE guest_id = ?"
-                cursor.execute(query, values)
-                conn.commit()
-                if cursor.rowcount > 0:
-                    await message.answer("Гость успешно обновлён.")
-                else:
-                    await message.answer("Гость с таким ID не найден.")
-            except pyodbc.Error as e:
-                logging.error(f"Ошибка при редактировании гостя: {e}")
-                await message.answer("Ошибка при редактировании гостя.")
-            finally:
-                conn.close()
-        else:
-            await message.answer("Ошибка подключения к базе данных.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для редактирования гостя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_guest_edit_gui)
-async def process_guest_edit_gui(message: types.Message, state: FSMContext):
-    new_value = message.text.strip() or None
+# Обработчики ввода для таблиц админки: таблица, ключ строки и поле — в данных FSM.
+# Права проверяются и здесь: состояние могло остаться после снятия админки
+async def admin_input(message, state):
     data = await state.get_data()
-    guest_id = data.get("edit_guest_id")
-    field = data.get("edit_field")
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            if field == "room_id":
-                cursor.execute("UPDATE Guests SET room_id = ? WHERE guest_id = ?", (int(new_value), guest_id))
-            elif field == "telegram_id":
-                cursor.execute("UPDATE Guests SET telegram_id = ? WHERE guest_id = ?", (int(new_value), guest_id))
-            elif field == "first_name":
-                cursor.execute("UPDATE Guests SET first_name = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "last_name":
-                cursor.execute("UPDATE Guests SET last_name = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "email":
-                cursor.execute("UPDATE Guests SET email = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "phone":
-                cursor.execute("UPDATE Guests SET phone = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "check_in_date":
-                cursor.execute("UPDATE Guests SET check_in_date = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "check_out_date":
-                cursor.execute("UPDATE Guests SET check_out_date = ? WHERE guest_id = ?", (new_value, guest_id))
-            elif field == "comment":
-                cursor.execute("UPDATE Guests SET comment = ? WHERE guest_id = ?", (new_value, guest_id))
-            conn.commit()
-            await message.answer(f"Поле '{field}' для гостя ID {guest_id} успешно обновлено.")
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании поля {field} для гостя ID {guest_id}: {e}")
-            await message.answer("Ошибка при редактировании поля.")
-        finally:
-            conn.close()
     await state.clear()
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора")
+        return None
+    return data
 
-@dp.message(DBAdminState.waiting_for_delete_guest)
-async def process_delete_guest(message: types.Message, state: FSMContext):
-    try:
-        guest_id = int(message.text.strip())
-        conn = connect_to_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM Guests WHERE guest_id = ?", (guest_id,))
-                conn.commit()
-                if cursor.rowcount > 0:
-                    await message.answer("Гость успешно удалён.")
-                else:
-                    await message.answer("Гость с таким ID не найден.")
-            except pyodbc.Error as e:
-                logging.error(f"Ошибка при удалении гостя: {e}")
-                await message.answer("Ошибка при удалении гостя.")
-            finally:
-                conn.close()
-        else:
-            await message.answer("Ошибка подключения к базе данных.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для удаления гостя: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-# Обработчики для операций с таблицей Services
-@dp.message(DBAdminState.waiting_for_add_service)
-async def process_add_service(message: types.Message, state: FSMContext):
+@dp.message(DBAdminState.waiting_for_add_row)
+async def process_add_row(message: types.Message, state: FSMContext):
+    data = await admin_input(message, state)
+    if data is None:
+        return
+    table = TABLES[data["edit_table"]]
     try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 4:
-            await message.answer("Неверный формат. Ожидается: name, price, short_description, detailed_description")
-            return
-        name, price, short_description, detailed_description = parts
-        price = float(price)
-        if add_service_db(name, price, short_description, detailed_description):
-            await message.answer("Услуга успешно добавлена.")
-        else:
-            await message.answer("Ошибка при добавлении услуги.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления услуги: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
+        values = table.parse_add(message.text or "")
+    except ValueError as e:
+        await message.answer(f"Неверный формат: {e}")
+        return
+    await apply_admin_change(message, table, "добавлена", INSERT_ROW.get(table.slug, insert_admin_row), table, values)
 
-@dp.message(DBAdminState.waiting_for_edit_service)
-async def process_edit_service(message: types.Message, state: FSMContext):
+@dp.message(DBAdminState.waiting_for_edit_text)
+async def process_edit_text(message: types.Message, state: FSMContext):
+    data = await admin_input(message, state)
+    if data is None:
+        return
+    table = TABLES[data["edit_table"]]
     try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 5:
-            await message.answer("Неверный формат. Ожидается: service_id, name, price, short_description, detailed_description")
-            return
-        service_id, name, price, short_description, detailed_description = parts
-        service_id = int(service_id)
-        price = float(price)
-        if edit_service_db(service_id, name, price, short_description, detailed_description):
-            await message.answer("Услуга успешно обновлена.")
-        else:
-            await message.answer("Ошибка при редактировании услуги.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для редактирования услуги: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_service_edit_gui)
-async def process_service_edit_gui(message: types.Message, state: FSMContext):
-    new_value = message.text.strip()
-    data = await state.get_data()
-    service_id = data.get("edit_service_id")
-    field = data.get("edit_field")
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            if field == "name":
-                cursor.execute("UPDATE Services SET name = ? WHERE service_id = ?", (new_value, service_id))
-            elif field == "price":
-                cursor.execute("UPDATE Services SET price = ? WHERE service_id = ?", (float(new_value), service_id))
-            elif field == "short_description":
-                cursor.execute("UPDATE Services SET short_description = ? WHERE service_id = ?", (new_value, service_id))
-            elif field == "detailed_description":
-                cursor.execute("UPDATE Services SET detailed_description = ? WHERE service_id = ?", (new_value, service_id))
-            conn.commit()
-            await message.answer(f"Поле '{field}' для услуги ID {service_id} успешно обновлено.")
-        except Exception as e:
-            logging.error(f"Ошибка при редактировании поля {field} для услуги ID {service_id}: {e}")
-            await message.answer("Ошибка при редактировании поля.")
-        finally:
-            conn.close()
-    await state.clear()
+        key, values = table.parse_edit(message.text or "")
+    except ValueError as e:
+        await message.answer(f"Неверный формат: {e}")
+        return
+    await apply_admin_change(message, table, "обновлена", update_admin_row, table, key, values)
 
-# Обработчики для операций с таблицей GuestServices
-@dp.message(DBAdminState.waiting_for_add_guest_service)
-async def process_add_guest_service(message: types.Message, state: FSMContext):
+@dp.message(DBAdminState.waiting_for_field_edit)
+async def process_field_edit(message: types.Message, state: FSMContext):
+    data = await admin_input(message, state)
+    if data is None:
+        return
+    table = TABLES[data["edit_table"]]
+    field = data["edit_field"]
     try:
-        parts = [part.strip() for part in message.text.split(",")]
-        if len(parts) != 4:
-            await message.answer("Неверный формат. Ожидается: guest_id, service_id, quantity, status")
-            return
-        guest_id, service_id, quantity, status = parts
-        guest_id = int(guest_id)
-        service_id = int(service_id)
-        quantity = int(quantity)
-        if add_guest_service_db(guest_id, service_id, quantity, status):
-            await message.answer("Запись успешно добавлена в GuestServices.")
-        else:
-            await message.answer("Ошибка при добавлении записи.")
-    except Exception as e:
-        logging.error(f"Ошибка обработки данных для добавления в GuestServices: {e}")
-        await message.answer("Ошибка обработки данных.")
-    finally:
-        await state.clear()
-
-@dp.message(DBAdminState.waiting_for_guest_service_edit_gui)
-async def process_guest_service_edit_gui(message: types.Message, state: FSMContext):
-    new_value = message.text.strip()
-    data = await state.get_data()
-    guest_id = data.get("edit_guest_id")
-    service_id = data.get("edit_service_id")
-    order_date = data.get("edit_order_date")
-    field = data.get("edit_field")
-
-    # Проверка наличия всех данных
-    if not all([guest_id, service_id, order_date, field]):
-        await message.answer("Ошибка: данные для редактирования не найдены.")
-        await state.clear()
+        key = table.decode_key(data["edit_key"])
+        value = table.column(field, editable=True).convert(message.text or "")
+    except ValueError as e:
+        await message.answer(f"Неверное значение: {e}")
         return
+    await apply_admin_change(message, table, "обновлена", update_admin_row, table, key, {field: value})
 
+@dp.message(DBAdminState.waiting_for_delete_row)
+async def process_delete_row(message: types.Message, state: FSMContext):
+    data = await admin_input(message, state)
+    if data is None:
+        return
+    table = TABLES[data["edit_table"]]
     try:
-        # Преобразование значения в зависимости от поля
-        if field == "quantity":
-            new_value = int(new_value)  # Убедимся, что quantity — это число
-        # Вызов функции с правильными аргументами
-        if edit_guest_service_db(guest_id, service_id, order_date, field, new_value):
-            await message.answer(f"Поле '{field}' для записи (Гость: {guest_id}, Услуга: {service_id}, Дата: {order_date}) успешно обновлено.")
-        else:
-            await message.answer("Ошибка при редактировании поля.")
+        # Последний столбец ключа (URL изображения) может содержать запятые
+        key = table.parse_key((message.text or "").split(",", len(table.key) - 1))
     except ValueError as e:
-        await message.answer(f"Ошибка: неверный формат значения для '{field}' ({e}).")
-    except pyodbc.Error as e:
-        logging.error(f"Ошибка базы данных при редактировании GuestServices: {e}")
-        await message.answer("Ошибка базы данных.")
-    await state.clear()
-
-# Обработчик заказа дополнительных услуг
-@dp.message(OrderServiceState.waiting_for_quantity)
-async def process_service_quantity(message: types.Message, state: FSMContext):
-    quantity = message.text.strip()
-    if not quantity.isdigit() or int(quantity) <= 0:
-        await message.answer("Количество должно быть положительным целым числом. Попробуйте еще раз:")
+        await message.answer(f"Неверный формат: {e}")
         return
-    quantity = int(quantity)
-    data = await state.get_data()
-    service_id = data['selected_service_id']
-    telegram_id = message.from_user.id
-    conn = connect_to_db()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT guest_id FROM Guests WHERE telegram_id = ? AND check_out_date >= GETDATE()", (telegram_id,))
-            guest = cursor.fetchone()
-            if guest:
-                guest_id = guest.guest_id
-                cursor.execute(
-                    "INSERT INTO GuestServices (guest_id, service_id, quantity, order_date, status) VALUES (?, ?, ?, GETDATE(), 'pending')",
-                    (guest_id, service_id, quantity)
-                )
-                conn.commit()
-                await message.answer("Ваш заказ на дополнительную услугу успешно оформлен.")
-            else:
-                await message.answer("У вас нет активных бронирований для заказа услуг.")
-        except pyodbc.Error as e:
-            logging.error(f"Ошибка при заказе услуги: {e}")
-            await message.answer("Произошла ошибка при заказе услуги.")
-        finally:
-            conn.close()
-    else:
-        await message.answer("Ошибка подключения к базе данных.")
-    await state.clear()
+    await apply_admin_change(message, table, "удалена", delete_admin_row, table, key)
 
 # Обработчик массовой рассылки
 @dp.message(AdminState.waiting_for_broadcast)
@@ -2150,19 +1773,32 @@ async def process_broadcast(message: types.Message, state: FSMContext):
             cursor = conn.cursor()
             cursor.execute("SELECT telegram_id FROM Users")
             users = cursor.fetchall()
+            metrics.BROADCAST_IN_PROGRESS.set(1)
+            metrics.BROADCAST_RECIPIENTS.set(len(users))
+            sent = 0
             for user in users:
+                if in_flight.stopping:
+                    # Бот останавливается: не держим остановку до конца длинной рассылки
+                    logging.warning(f"Рассылка прервана остановкой бота: {sent} из {len(users)}")
+                    await message.answer(f"Рассылка прервана перезапуском бота: отправлено {sent} из {len(users)}.")
+                    break
                 try:
                     await bot.send_message(user.telegram_id, text)
+                    metrics.BROADCAST_SENT.inc()
                 except Exception as e:
+                    metrics.BROADCAST_FAILED.inc()
                     logging.error(f"Ошибка при отправке сообщения пользователю {user.telegram_id}: {e}")
-            await message.answer("Рассылка завершена.")
+                sent += 1
+            else:
+                await message.answer("Рассылка завершена.")
         except Exception as e:
             logging.error(f"Ошибка при получении списка пользователей: {e}")
             await message.answer("Ошибка при рассылке.")
         finally:
+            metrics.BROADCAST_IN_PROGRESS.set(0)
             conn.close()
     else:
-        await message.answer("Ошибка подключения к базе данных.")
+        await message.answer(db_failure_text())
     await state.clear()
 
 # Обработчик команды /apanel
@@ -2172,11 +1808,128 @@ async def admin_panel(message: types.Message):
     if not is_admin(telegram_id):
         await message.answer("У вас нет прав администратора")
         return
-    markup = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Массовая рассылка", callback_data="broadcast")],
-        [InlineKeyboardButton(text="Управление БД", callback_data="DB")]
-    ])
-    await message.answer("Админ-панель:", reply_markup=markup)
+    await message.answer("Админ-панель:", reply_markup=ADMIN_PANEL_MARKUP)
+
+# Обработчик команды /dbstats: топ SQL-запросов по суммарному времени
+@dp.message(Command("dbstats"))
+async def db_stats(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора")
+        return
+    args = message.text.split()[1:]
+    if args and args[0] == "reset":
+        db.SQL_STATS.reset()
+        await message.answer("Статистика SQL сброшена.")
+        return
+    limit = int(args[0]) if args and args[0].isdigit() else 10
+    entries = db.SQL_STATS.top(limit)
+    if not entries:
+        await message.answer("Статистика SQL пуста.")
+        return
+    since = datetime.fromtimestamp(db.SQL_STATS.started_at).strftime("%Y-%m-%d %H:%M:%S")
+    parts = [f"Топ SQL по суммарному времени (с {since}):"]
+    for i, entry in enumerate(entries, 1):
+        ex = entry.execute
+        sql = " ".join(entry.sql.split())
+        parts.append(
+            f"\n{i}. {entry.handler} — {entry.calls} вызовов, {entry.total_time * 1000:.1f} мс всего\n"
+            f"p50 {ex.percentile(50) * 1000:.2f} / p95 {ex.percentile(95) * 1000:.2f} / "
+            f"p99 {ex.percentile(99) * 1000:.2f} / max {ex.max * 1000:.2f} мс, "
+            f"fetch {entry.fetch.total * 1000:.1f} мс, строк: {entry.rows}, ошибок: {entry.errors}\n"
+            f"{sql[:150]}"
+        )
+    await send_parts(message.answer, parts)
+
+# Обработчик команды /loopstats: зависания event loop и их виновники
+@dp.message(Command("loopstats"))
+async def loop_stats(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора")
+        return
+    args = message.text.split()[1:]
+    if args and args[0] == "reset":
+        loop_monitor.reset()
+        await message.answer("Статистика event loop сброшена.")
+        return
+    stalls = loop_monitor.stalls
+    since = datetime.fromtimestamp(loop_monitor.started_at).strftime("%Y-%m-%d %H:%M:%S")
+    header = (
+        f"Зависания event loop дольше {loop_monitor.threshold * 1000:.0f} мс (с {since}): {stalls.count}\n"
+        f"p50 {stalls.percentile(50) * 1000:.0f} / p95 {stalls.percentile(95) * 1000:.0f} / "
+        f"p99 {stalls.percentile(99) * 1000:.0f} / max {stalls.max * 1000:.0f} мс"
+    )
+    await send_parts(message.answer, (
+        f"\n{i}. {offender.site} — {offender.count} раз, всего {offender.total * 1000:.0f} мс, "
+        f"max {offender.max * 1000:.0f} мс\n" + "".join(offender.stack[-4:])
+        for i, offender in enumerate(loop_monitor.top(), 1)
+    ), header=header)
+
+# Обработчик команды /revenue [дней]: выручка по дням, категориям и услугам из дневных сводок
+@dp.message(Command("revenue"))
+async def revenue(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора")
+        return
+    args = message.text.split()[1:]
+    days = min(int(args[0]), 366) if args and args[0].isdigit() and int(args[0]) > 0 else 30
+    conn = connect_to_db()
+    if not conn:
+        await message.answer(db_failure_text())
+        return
+    try:
+        by_day, categories, services, watermark = revenue_report(conn, date.today() - timedelta(days=days))
+    except db.DBError as e:
+        logging.error(f"Ошибка при построении отчёта о выручке: {e}")
+        await message.answer("Ошибка при получении данных.")
+        return
+    finally:
+        conn.close()
+    if watermark is None:
+        await message.answer("Дневные сводки ещё не построены.")
+        return
+    parts = [f"Выручка за {days} дн. (сводки по {watermark} включительно)", "", "По дням: проживание / услуги"]
+    parts.extend(
+        f"{day}: {as_money(room_revenue):.2f} руб. ({bookings} брон., {nights} ноч.) / {as_money(service_revenue):.2f} руб. ({orders} заказ.)"
+        for day, (bookings, nights, room_revenue, orders, service_revenue) in by_day
+    )
+    parts.append("")
+    parts.append("По категориям:")
+    parts.extend(
+        f"{row.category}: {as_money(row.revenue):.2f} руб., бронирований: {row.bookings}, ночей: {row.nights}"
+        for row in categories
+    )
+    parts.append("")
+    parts.append("По услугам:")
+    parts.extend(
+        f"{row.name}: {as_money(row.revenue):.2f} руб., заказов: {row.orders}, единиц: {row.quantity}"
+        for row in services
+    )
+    await send_parts(message.answer, parts)
+
+# Обработчик команды /profile [секунды] [all]: сэмплирующее профилирование живого процесса
+@dp.message(Command("profile"))
+async def profile(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав администратора")
+        return
+    args = message.text.split()[1:]
+    seconds = min(int(args[0]), PROFILE_MAX_SECONDS) if args and args[0].isdigit() and int(args[0]) > 0 else 10
+    all_threads = "all" in args
+    if profiler.running:
+        await message.answer("Профилирование уже выполняется, дождитесь результата.")
+        return
+    await message.answer(f"Профилирование {seconds} с{' (все потоки)' if all_threads else ''}...")
+    try:
+        result = await profiler.profile(seconds, all_threads=all_threads)
+    except RuntimeError as e:
+        await message.answer(str(e))
+        return
+    top = "\n".join(
+        f"{count * 100 / max(result.samples, 1):.1f}% {name}" for name, count in result.top_functions(8)
+    )
+    caption = f"Выборок: {result.samples} за {result.duration:.1f} с\n{top}"[:1024]
+    filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    await message.answer_document(BufferedInputFile(result.collapsed().encode(), filename=filename), caption=caption)
 
 # Обработчики процесса бронирования
 @dp.message(BookingState.waiting_for_first_name)
@@ -2268,23 +2021,26 @@ async def finalize_booking(message: types.Message, state: FSMContext, comment: s
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT quantity, category FROM Rooms WHERE room_id = ? AND status = 'available'", (room_id,))
+            cursor.execute("SELECT quantity, category, price FROM Rooms WHERE room_id = ? AND status = 'available'", (room_id,))
             result = cursor.fetchone()
             if result and result.quantity > 0:
                 category = result.category
                 cursor.execute(
                     """
-                    INSERT INTO Guests (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment, booking_date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE())
+                    INSERT INTO Guests (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment, booking_date, holds_room)
+                    OUTPUT INSERTED.guest_id
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, GETDATE(), 1)
                     """,
                     (room_id, telegram_id, first_name, last_name, email, phone, check_in_date, check_out_date, comment)
                 )
+                guest_id = cursor.fetchone()[0]
                 cursor.execute("UPDATE Rooms SET quantity = quantity - 1 WHERE room_id = ?", (room_id,))
+                jobs = reminders.schedule(cursor, guest_id, check_in_date, check_out_date)
                 conn.commit()
-                markup = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="Назад", callback_data="back_to_main")],
-                    [InlineKeyboardButton(text="Доп услуги", callback_data="additional_services")]
-                ])
+                reminders.activate(guest_id, jobs)
+                room_index.book(room_id)
+                invalidate_guest_caches(telegram_id)
+                analytics.record_booking(category, result.price, check_in_date, check_out_date)
                 await message.answer(
                     "<b>Ваше бронирование успешно завершено.</b>\n\n"
                     "<b>Детали бронирования:</b>\n"
@@ -2293,22 +2049,95 @@ async def finalize_booking(message: types.Message, state: FSMContext, comment: s
                     f"📅 <b>Заезд:</b> {check_in_date}\n"
                     f"📅 <b>Выезд:</b> {check_out_date}",
                     parse_mode="HTML",
-                    reply_markup=markup
+                    reply_markup=BOOKING_DONE_MARKUP
                 )
             else:
                 await message.answer("К сожалению, этот номер уже забронирован.")
-        except pyodbc.Error as e:
+        except db.DBError as e:
             logging.error(f"Ошибка при бронировании: {e}")
             await message.answer("Произошла ошибка при бронировании.")
         finally:
             conn.close()
     else:
-        await message.answer("Ошибка подключения к базе данных.")
+        await message.answer(db_failure_text())
     await state.clear()
 
 async def main():
     logging.info("Бот запущен.")
-    await dp.start_polling(bot)
+    try:
+        await load_fsm(dp.storage, FSM_SNAPSHOT_PATH)
+    except (OSError, ValueError) as e:
+        logging.error(f"Ошибка восстановления состояний FSM: {e}")
+    if os.getenv("DB_MIGRATE", "1") != "0":
+        try:
+            db.migrate()
+        except db.DBError as e:
+            logging.error(f"Ошибка применения миграций: {e}")
+    # Загрузка очереди сотрудников и раздача накопившихся неназначенных заказов
+    await staff.refresh()
+    staff.start(notify_employee)
+    # Каталоги в памяти строятся сразу: если БД станет недоступна, они продолжат отвечать
+    await room_index.refresh()
+    try:
+        service_catalog.services()
+        analytics.ensure_loaded()
+    except db.DBError as e:
+        logging.error(f"Ошибка загрузки каталогов: {e}")
+    if os.getenv("REMINDERS", "1") != "0":
+        try:
+            conn = db.connect()
+            try:
+                reminders.bootstrap(conn)
+            finally:
+                conn.close()
+        except db.DBError as e:
+            logging.error(f"Ошибка загрузки напоминаний: {e}")
+        reminders.start(send_reminder)
+    metrics_runner = None
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics_runner = await metrics.start_server(os.getenv("METRICS_HOST", "0.0.0.0"), int(metrics_port))
+    if os.getenv("LOOP_MONITOR", "1") != "0":
+        loop_monitor.start()
+    if os.getenv("ROLLUPS", "1") != "0":
+        rollup_job.start()
+    if os.getenv("ROOM_RELEASE", "1") != "0":
+        inventory_job.start()
+    try:
+        # SIGTERM/SIGINT останавливают опрос (aiogram), сессия закрывается в graceful_shutdown
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        await graceful_shutdown(metrics_runner)
+
+# Остановка: новых апдейтов уже нет; ждём обработчики и фоновые задачи не дольше
+# SHUTDOWN_TIMEOUT, сохраняем FSM, затем закрываем /metrics, БД, сессию бота и дописываем лог
+async def graceful_shutdown(metrics_runner=None):
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+
+    def remaining():
+        return max(0.0, deadline - time.monotonic())
+
+    logging.info(f"Остановка: апдейтов в обработке {in_flight.count}")
+    if not await in_flight.drain(remaining()):
+        logging.warning(f"Остановка по таймауту: не завершены обработчики {in_flight.count} апдейтов")
+    await asyncio.gather(
+        staff.close(remaining()),
+        reminders.close(remaining()),
+        rollup_job.close(remaining()),
+        inventory_job.close(remaining()),
+    )
+    loop_monitor.stop()
+    try:
+        logging.info(f"Состояния FSM сохранены: {save_fsm(dp.storage, FSM_SNAPSHOT_PATH)}")
+    except (OSError, TypeError) as e:
+        logging.error(f"Ошибка сохранения состояний FSM: {e}")
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    await db.close_async_backend()
+    db.close_backend()
+    await bot.session.close()
+    logging.info("Бот остановлен.")
+    await asyncio.to_thread(log_listener.queue.join)
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
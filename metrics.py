@@ -0,0 +1,321 @@
+import logging
+import threading
+from bisect import bisect_left
+
+# Минимальная реализация метрик в формате Prometheus без внешних зависимостей.
+# Горячий путь: обработчики заранее получают дочерние метрики через labels() и дальше
+# вызывают только inc()/observe() — без создания словарей и кортежей на каждый вызов.
+# Метрики меняются и из рабочих потоков asyncio.to_thread (запросы к БД, фоновые задачи),
+# поэтому изменения и чтение для выдачи идут под общей блокировкой _lock: без
+# конкуренции её захват стоит десятки наносекунд.
+
+REGISTRY = []
+_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with _lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        with _lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with _lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        # Значение вычисляется только в момент сбора метрик
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.value = value
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set_function(self, function):
+        self._default.function = function
+
+    def _render_child(self, values, child):
+        try:
+            value = child.get()
+        except Exception as e:
+            logging.error(f"Ошибка вычисления метрики {self.name}: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with _lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        with _lock:
+            counts, total, observed = list(child.counts), child.sum, child.count
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {observed}")
+        return lines
+
+
+# Гистограмма латентностей в стиле HDR: логарифмические корзины с линейным делением внутри,
+# относительная погрешность около 1.5% при фиксированной памяти
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    SUB_BITS = 7
+    SUB_COUNT = 1 << SUB_BITS
+    SUB_HALF = SUB_COUNT >> 1
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def _index(cls, micros):
+        if micros < cls.SUB_COUNT:
+            return micros
+        shift = micros.bit_length() - cls.SUB_BITS
+        return cls.SUB_COUNT + (shift - 1) * cls.SUB_HALF + ((micros >> shift) - cls.SUB_HALF)
+
+    @classmethod
+    def _value(cls, index):
+        if index < cls.SUB_COUNT:
+            return index
+        shift, offset = divmod(index - cls.SUB_COUNT, cls.SUB_HALF)
+        return (cls.SUB_HALF + offset) << (shift + 1)
+
+    def record(self, seconds):
+        index = self._index(int(seconds * 1_000_000))
+        with _lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        with _lock:
+            counts = sorted(self.counts.items())
+        threshold = q / 100 * self.count
+        seen = 0
+        for index, count in counts:
+            seen += count
+            if seen >= threshold:
+                return min(self._value(index) / 1_000_000, self.max)
+        return self.max
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Метрики бота
+UPDATES = Counter("bot_updates_total", "Обработанные апдейты по типу и обработчику", ("type", "handler"))
+HANDLER_LATENCY = Histogram("bot_handler_latency_seconds", "Время работы обработчика", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения, вышедшие из обработчика", ("handler",))
+UPDATES_IN_FLIGHT = Gauge("bot_updates_in_flight", "Апдейты, обработка которых ещё идёт")
+
+DB_CONNECTIONS_OPEN = Gauge("bot_db_connections_open", "Открытые соединения с БД")
+DB_CONNECTIONS = Counter("bot_db_connections_total", "Открытия соединений с БД")
+DB_CONNECT_ERRORS = Counter("bot_db_connect_errors_total", "Ошибки подключения к БД")
+DB_CONNECT_LATENCY = Histogram("bot_db_connect_seconds", "Время установки соединения с БД")
+DB_BREAKER_STATE = Gauge("bot_db_breaker_state", "Автомат отключения БД: 0 — замкнут, 1 — проба, 2 — разомкнут")
+DB_BREAKER_OPENED = Counter("bot_db_breaker_opened_total", "Размыкания автомата отключения БД")
+DB_BREAKER_REJECTED = Counter("bot_db_breaker_rejected_total", "Обращения к БД, отклонённые разомкнутым автоматом")
+
+CACHE_REQUESTS = Counter("bot_cache_requests_total", "Обращения к кэшам", ("cache", "result"))
+CACHE_ENTRIES = Gauge("bot_cache_entries", "Записи в кэше", ("cache",))
+CACHE_INVALIDATIONS = Counter("bot_cache_invalidations_total", "Записи, сброшенные из кэша после изменения данных", ("cache",))
+
+SINGLEFLIGHT_CALLS = Counter(
+    "bot_singleflight_calls_total",
+    "Чтения через single-flight: leader — выполнены, shared — дождались чужого результата",
+    ("name", "role")
+)
+SINGLEFLIGHT_IN_FLIGHT = Gauge("bot_singleflight_in_flight", "Выполняющиеся чтения single-flight", ("name",))
+
+TELEGRAM_CALLS = Counter("bot_telegram_api_calls_total", "Вызовы Bot API (включая повторы)", ("method",))
+TELEGRAM_LATENCY = Histogram("bot_telegram_api_latency_seconds", "Время вызова Bot API", ("method",))
+TELEGRAM_ERRORS = Counter("bot_telegram_api_errors_total", "Ошибки Bot API по классу: 4xx, 429, 5xx, network", ("method", "status"))
+TELEGRAM_RETRIES = Counter("bot_telegram_api_retries_total", "Повторные попытки вызовов Bot API", ("method",))
+TELEGRAM_FLOOD_WAIT = Gauge("bot_telegram_flood_wait_seconds", "Оставшаяся общая пауза после 429")
+
+BROADCAST_IN_PROGRESS = Gauge("bot_broadcast_in_progress", "Идёт ли рассылка")
+BROADCAST_RECIPIENTS = Gauge("bot_broadcast_recipients", "Получатели текущей рассылки")
+BROADCAST_SENT = Counter("bot_broadcast_sent_total", "Успешно отправленные сообщения рассылки")
+BROADCAST_FAILED = Counter("bot_broadcast_failed_total", "Неотправленные сообщения рассылки")
+
+STAFF_ASSIGNMENTS = Counter("bot_staff_assignments_total", "Заказы услуг, назначенные сотрудникам", ("position",))
+STAFF_NOTIFY_FAILED = Counter("bot_staff_notify_failed_total", "Неотправленные уведомления сотрудникам")
+
+REMINDERS_PENDING = Gauge("bot_reminders_pending", "Напоминания гостям, ожидающие отправки")
+REMINDERS_SENT = Counter("bot_reminders_sent_total", "Отправленные напоминания гостям", ("kind",))
+REMINDERS_FAILED = Counter("bot_reminders_failed_total", "Неотправленные напоминания гостям", ("kind",))
+
+LOG_SUPPRESSED = Counter("bot_log_suppressed_total", "Записи лога, отброшенные ограничением частоты")
+LOG_DROPPED = Counter("bot_log_dropped_total", "Записи лога, отброшенные из-за переполнения очереди")
+
+LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds", "Задержка event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_LAG_LAST = Gauge("bot_event_loop_lag_last_seconds", "Последнее измерение задержки event loop")
+LOOP_STALLS = Counter("bot_event_loop_stalls_total", "Зависания event loop дольше порога")
+
+
+def cache_counters(name):
+    # Пара (hit, miss) для кэша, привязанная один раз при его создании
+    return CACHE_REQUESTS.labels(name, "hit"), CACHE_REQUESTS.labels(name, "miss")
+
+
+# HTTP-эндпоинт /metrics (aiohttp приходит вместе с aiogram)
+async def start_server(host="0.0.0.0", port=9100):
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Эндпоинт метрик запущен на http://{host}:{port}/metrics")
+    return runner
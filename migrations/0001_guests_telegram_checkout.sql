@@ -0,0 +1,6 @@
+-- Активное бронирование гостя: WHERE telegram_id = ? AND check_out_date >= GETDATE()
+-- (my_services, my_bookings, заказ услуги). guest_id входит в ключ кластерного индекса,
+-- поэтому запрос целиком отвечается из этого индекса.
+CREATE INDEX IX_Guests_telegram_checkout
+    ON Guests (telegram_id, check_out_date)
+    INCLUDE (room_id, check_in_date);
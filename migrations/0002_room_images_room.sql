@@ -0,0 +1,5 @@
+-- Фотографии номера в карточке категории: WHERE room_id = ?
+-- Раньше каждая карточка читала RoomImages целиком.
+CREATE INDEX IX_RoomImages_room
+    ON RoomImages (room_id)
+    INCLUDE (image_url);
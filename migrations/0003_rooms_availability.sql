@@ -0,0 +1,4 @@
+-- Список категорий и номера категории: WHERE status = 'available' AND category = ? AND quantity > 0
+CREATE INDEX IX_Rooms_status_category_quantity
+    ON Rooms (status, category, quantity)
+    INCLUDE (description, price);
@@ -0,0 +1,37 @@
+-- Дневные сводки для финансовых отчётов. Заполняются фоновой задачей (rollups.py)
+-- по закрытым дням; RollupWatermarks хранит последний обработанный день.
+CREATE TABLE DailyRoomStats (
+    stat_date DATE NOT NULL,
+    category NVARCHAR(50) NOT NULL,
+    bookings INT NOT NULL,
+    nights_sold INT NOT NULL,
+    room_revenue DECIMAL(12, 2) NOT NULL,
+    PRIMARY KEY (stat_date, category)
+);
+GO
+
+CREATE TABLE DailyServiceStats (
+    stat_date DATE NOT NULL,
+    service_id INT NOT NULL,
+    orders INT NOT NULL,
+    quantity INT NOT NULL,
+    revenue DECIMAL(12, 2) NOT NULL,
+    PRIMARY KEY (stat_date, service_id)
+);
+GO
+
+CREATE TABLE RollupWatermarks (
+    name NVARCHAR(50) PRIMARY KEY,
+    last_day DATE NOT NULL
+);
+GO
+
+-- Диапазонные выборки задачи по дням оформления брони и заказа
+CREATE INDEX IX_Guests_booking_date
+    ON Guests (booking_date)
+    INCLUDE (room_id, check_in_date, check_out_date);
+GO
+
+CREATE INDEX IX_GuestServices_order_date
+    ON GuestServices (order_date)
+    INCLUDE (service_id, quantity, status);
@@ -0,0 +1,17 @@
+-- Автоназначение заказов услуг сотрудникам (staff.py): услуга указывает должность,
+-- которая её выполняет, сотрудник — свой Telegram ID для уведомлений.
+ALTER TABLE Services ADD position NVARCHAR(100) NULL;
+GO
+
+ALTER TABLE Employees ADD telegram_id BIGINT NULL;
+GO
+
+-- Открытые заказы по сотрудникам: начальная загрузка очереди (COUNT по employee_id)
+CREATE INDEX IX_GuestServices_employee_status
+    ON GuestServices (employee_id, status);
+GO
+
+-- Неназначенные заказы, ожидающие свободного сотрудника
+CREATE INDEX IX_GuestServices_status_order_date
+    ON GuestServices (status, order_date)
+    INCLUDE (employee_id);
@@ -0,0 +1,17 @@
+-- Отложенные напоминания гостям (reminders.py): перед заездом и в день выезда.
+-- sent_at ставится перед отправкой, поэтому после перезапуска напоминание не повторится.
+CREATE TABLE ScheduledReminders (
+    guest_id INT NOT NULL,
+    kind NVARCHAR(20) NOT NULL,
+    due_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    sent_at DATETIME NULL,
+    PRIMARY KEY (guest_id, kind),
+    FOREIGN KEY (guest_id) REFERENCES Guests(guest_id) ON DELETE CASCADE
+);
+GO
+
+-- Загрузка ожидающих напоминаний при старте
+CREATE INDEX IX_ScheduledReminders_pending
+    ON ScheduledReminders (sent_at, expires_at)
+    INCLUDE (due_at);
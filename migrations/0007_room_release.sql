@@ -0,0 +1,14 @@
+-- Возврат номеров после выезда (inventory.py). holds_room = 1 — бронь уменьшила
+-- Rooms.quantity и номер ещё не возвращён. Будущие и текущие брони на момент
+-- миграции считаются оформленными через бота (только он уменьшает quantity).
+ALTER TABLE Guests ADD holds_room BIT NOT NULL DEFAULT 0;
+GO
+
+UPDATE Guests SET holds_room = 1 WHERE check_out_date >= CAST(GETDATE() AS DATE);
+GO
+
+-- Фильтрованный индекс: только брони, ещё держащие номер — выборка задачи по окну дат выезда
+CREATE INDEX IX_Guests_held_checkout
+    ON Guests (check_out_date)
+    INCLUDE (room_id)
+    WHERE holds_room = 1;
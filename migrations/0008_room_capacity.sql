@@ -0,0 +1,3 @@
+-- Вместимость номера (гостей) для фильтра /rooms guests=N (room_index.py).
+-- NULL — вместимость не указана: такие номера не попадают под фильтр по гостям.
+ALTER TABLE Rooms ADD capacity INT NULL;
@@ -0,0 +1,3 @@
+-- file_id фото, однажды загруженных в Telegram: повторные отправки и inline-результаты
+-- ссылаются на файл на серверах Telegram, а не на внешний URL (room_index.py)
+ALTER TABLE RoomImages ADD file_id NVARCHAR(255) NULL;
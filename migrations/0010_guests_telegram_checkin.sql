@@ -0,0 +1,5 @@
+-- Страницы «Мои бронирования»: WHERE telegram_id = ? ORDER BY check_in_date DESC, guest_id DESC
+-- OFFSET ? ROWS FETCH NEXT ? ROWS ONLY — строки страницы читаются по индексу без сортировки.
+CREATE INDEX IX_Guests_telegram_checkin
+    ON Guests (telegram_id, check_in_date DESC, guest_id DESC)
+    INCLUDE (room_id, check_out_date);
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class ProfileResult:
+    def __init__(self, stacks, samples, duration, interval):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+
+    def collapsed(self):
+        # Формат collapsed/folded stacks: "кадр;кадр;...;кадр число" — понимают flamegraph.pl и speedscope
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit=10):
+        # Собственное время функции — число выборок, где она на вершине стека
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+# Сэмплирующий профилировщик: фоновый поток раз в interval снимает стеки потоков
+# через sys._current_frames(). Event loop не останавливается, polling продолжается.
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._labels = {}
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return label
+
+    def _sample(self, seconds, thread_ids):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (thread_ids and thread_id not in thread_ids):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                labels.reverse()
+                stacks[";".join(labels)] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return ProfileResult(stacks, samples, time.perf_counter() - started, self.interval)
+
+    def _run(self, loop, future, seconds, thread_ids):
+        try:
+            result, error = self._sample(seconds, thread_ids), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_settle, future, result, error)
+        except RuntimeError:
+            # Loop уже закрыт: результат никому не нужен
+            pass
+
+    async def profile(self, seconds, all_threads=False):
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже выполняется")
+        try:
+            thread_ids = None if all_threads else {threading.get_ident()}
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            # Собственный daemon-поток, а не executor по умолчанию: выборка идёт до 120 с
+            # и заняла бы слот, нужный asyncio.to_thread для запросов к БД
+            threading.Thread(
+                target=self._run, args=(loop, future, seconds, thread_ids),
+                name="profiler", daemon=True
+            ).start()
+            return await future
+        finally:
+            self._lock.release()
+
+
+def _settle(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,225 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+from datetime import datetime, time, timedelta
+
+import db
+import metrics
+from analytics import as_date
+
+CHECKIN = "checkin"
+CHECKOUT = "checkout"
+
+UPCOMING_SQL = """
+    SELECT g.guest_id, g.check_in_date, g.check_out_date
+    FROM Guests g
+    WHERE g.check_out_date >= ?
+      AND NOT EXISTS (SELECT 1 FROM ScheduledReminders r WHERE r.guest_id = g.guest_id)
+"""
+
+BOOKING_SQL = """
+    SELECT g.telegram_id, g.first_name, g.check_in_date, g.check_out_date, r.category
+    FROM Guests g
+    JOIN Rooms r ON r.room_id = g.room_id
+    WHERE g.guest_id = ?
+"""
+
+
+class Reminder:
+    __slots__ = ("guest_id", "kind", "due_at", "expires_at", "cancelled")
+
+    def __init__(self, guest_id, kind, due_at, expires_at):
+        self.guest_id = guest_id
+        self.kind = kind
+        self.due_at = due_at
+        self.expires_at = expires_at
+        self.cancelled = False
+
+
+# Напоминания гостям: перед заездом и утром в день выезда. Ожидающие напоминания
+# хранятся в ScheduledReminders и один раз при старте загружаются в кучу по времени
+# отправки; дальше куча меняется только при бронировании, правке дат и удалении гостя.
+# Фоновая задача спит до ближайшего срока — БД не опрашивается по таймеру.
+# Перед отправкой строка помечается sent_at (at-most-once): если её уже нет (гость
+# удалён каскадом) или даты изменились, напоминание молча пропускается.
+class ReminderScheduler:
+    def __init__(self, checkin_hour=14, checkin_advance=24, checkout_hour=12, checkout_notice_hour=9):
+        self.checkin_hour = checkin_hour
+        self.checkin_advance = checkin_advance
+        self.checkout_hour = checkout_hour
+        self.checkout_notice_hour = checkout_notice_hour
+        self._heap = []
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            checkin_hour=int(os.getenv("CHECKIN_HOUR", "14")),
+            checkin_advance=int(os.getenv("REMINDER_CHECKIN_ADVANCE_HOURS", "24")),
+            checkout_hour=int(os.getenv("CHECKOUT_HOUR", "12")),
+            checkout_notice_hour=int(os.getenv("REMINDER_CHECKOUT_HOUR", "9")),
+        )
+
+    def _plan(self, guest_id, check_in, check_out):
+        check_in_at = datetime.combine(as_date(check_in), time(self.checkin_hour))
+        check_out_day = as_date(check_out)
+        return [
+            Reminder(guest_id, CHECKIN, check_in_at - timedelta(hours=self.checkin_advance), check_in_at),
+            Reminder(
+                guest_id, CHECKOUT,
+                datetime.combine(check_out_day, time(self.checkout_notice_hour)),
+                datetime.combine(check_out_day, time(self.checkout_hour))
+            ),
+        ]
+
+    def schedule(self, cursor, guest_id, check_in, check_out, skip_due=True):
+        # Пишет напоминания в транзакцию вызывающего; в кучу они попадают через
+        # activate() после commit. skip_due: не слать напоминание, срок которого уже
+        # прошёл (бронь на завтра, оформленная после срока напоминания о заезде)
+        now = datetime.now()
+        jobs = [
+            job for job in self._plan(guest_id, check_in, check_out)
+            if job.expires_at > now and not (skip_due and job.due_at <= now)
+        ]
+        cursor.execute("DELETE FROM ScheduledReminders WHERE guest_id = ?", (guest_id,))
+        if jobs:
+            cursor.executemany(
+                "INSERT INTO ScheduledReminders (guest_id, kind, due_at, expires_at) VALUES (?, ?, ?, ?)",
+                [(job.guest_id, job.kind, job.due_at, job.expires_at) for job in jobs]
+            )
+        return jobs
+
+    def reschedule(self, cursor, guest_id):
+        # После правки дат: напоминание, срок которого уже наступил, уйдёт сразу
+        cursor.execute("SELECT check_in_date, check_out_date FROM Guests WHERE guest_id = ?", (guest_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        return self.schedule(cursor, guest_id, row.check_in_date, row.check_out_date, skip_due=False)
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.due_at, next(self._seq), job))
+        self._jobs.setdefault(job.guest_id, []).append(job)
+
+    def activate(self, guest_id, jobs):
+        self.cancel(guest_id)
+        for job in jobs:
+            self._push(job)
+        metrics.REMINDERS_PENDING.set(sum(len(jobs) for jobs in self._jobs.values()))
+        self._wakeup.set()
+
+    def cancel(self, guest_id):
+        # Записи в куче остаются и отбрасываются при извлечении
+        for job in self._jobs.pop(guest_id, ()):
+            job.cancelled = True
+
+    def bootstrap(self, conn):
+        # Единственное чтение Guests: брони, для которых ещё нет напоминаний
+        # (оформлены до появления планировщика). Затем загрузка ожидающих.
+        now = datetime.now()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ScheduledReminders WHERE expires_at < ?", (now,))
+        cursor.execute(UPCOMING_SQL, (now.date(),))
+        for row in cursor.fetchall():
+            self.schedule(conn.cursor(), row.guest_id, row.check_in_date, row.check_out_date, skip_due=False)
+        conn.commit()
+        cursor.execute(
+            "SELECT guest_id, kind, due_at, expires_at FROM ScheduledReminders WHERE sent_at IS NULL AND expires_at > ?",
+            (now,)
+        )
+        self._heap = []
+        self._jobs = {}
+        for row in cursor.fetchall():
+            self._push(Reminder(row.guest_id, row.kind, row.due_at, row.expires_at))
+        metrics.REMINDERS_PENDING.set(len(self._heap))
+        logging.info(f"Напоминания загружены: {len(self._heap)}")
+
+    def _claim(self, job):
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE ScheduledReminders SET sent_at = GETDATE() "
+                "WHERE guest_id = ? AND kind = ? AND due_at = ? AND sent_at IS NULL",
+                (job.guest_id, job.kind, job.due_at)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+            cursor.execute(BOOKING_SQL, (job.guest_id,))
+            booking = cursor.fetchone()
+            conn.commit()
+            return booking
+        finally:
+            conn.close()
+
+    def _done(self, job):
+        jobs = self._jobs.get(job.guest_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._jobs[job.guest_id]
+        metrics.REMINDERS_PENDING.set(sum(len(jobs) for jobs in self._jobs.values()))
+
+    async def _fire(self, job, send):
+        try:
+            booking = await asyncio.to_thread(self._claim, job)
+        except db.DBError as e:
+            metrics.REMINDERS_FAILED.labels(job.kind).inc()
+            logging.error(f"Ошибка отметки напоминания {job.kind} для гостя {job.guest_id}: {e}")
+            return
+        if booking is None:
+            return
+        try:
+            await send(job.kind, booking)
+            metrics.REMINDERS_SENT.labels(job.kind).inc()
+        except Exception as e:
+            metrics.REMINDERS_FAILED.labels(job.kind).inc()
+            logging.error(f"Не удалось отправить напоминание {job.kind} гостю {job.guest_id}: {e}")
+
+    async def _loop(self, send):
+        while True:
+            self._wakeup.clear()
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now and not self._closing:
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+                self._done(job)
+                if job.expires_at > now:
+                    await self._fire(job, send)
+            if self._closing:
+                return
+            # Не дольше часа за раз: страховка от перевода системных часов
+            timeout = min((self._heap[0][0] - now).total_seconds(), 3600.0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, send):
+        self._closing = False
+        self._task = asyncio.create_task(self._loop(send))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self, timeout):
+        # Отправка, начатая после отметки sent_at, доводится до конца; неотправленные
+        # напоминания остаются в ScheduledReminders и загрузятся при следующем запуске
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Напоминания: остановка по таймауту")
+        self.stop()
@@ -0,0 +1,59 @@
+from itertools import chain
+
+# Лимит длины текста сообщения Telegram (в единицах UTF-16, как считает Bot API)
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+def text_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _cut(text, limit):
+    # Самый длинный префикс, который помещается в limit
+    cut = min(len(text), limit)
+    while text_length(text[:cut]) > limit:
+        cut -= (text_length(text[:cut]) - limit + 1) // 2 or 1
+    return cut
+
+
+# Склеивает части (строки или многострочные блоки) в сообщения не длиннее limit.
+# Разрыв идёт только между частями; часть длиннее limit режется на куски.
+def chunk_parts(parts, limit=TELEGRAM_TEXT_LIMIT):
+    chunk = []
+    size = 0
+    for part in parts:
+        if not part.endswith("\n"):
+            part += "\n"
+        length = text_length(part)
+        if size + length > limit and chunk:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+        while length > limit:
+            cut = _cut(part, limit)
+            yield part[:cut]
+            part = part[cut:]
+            length = text_length(part)
+        chunk.append(part)
+        size += length
+    if chunk:
+        yield "".join(chunk)
+
+
+# Отправляет части по порядку, сколько бы сообщений ни понадобилось.
+# send — функция отправки текста (message.answer, partial(bot.send_message, chat_id));
+# клавиатура прикрепляется к последнему сообщению.
+async def send_parts(send, parts, header=None, reply_markup=None, limit=TELEGRAM_TEXT_LIMIT, **kwargs):
+    if header is not None:
+        parts = chain((header,), parts)
+    pending = None
+    sent = 0
+    for chunk in chunk_parts(parts, limit):
+        if pending is not None:
+            await send(pending, **kwargs)
+            sent += 1
+        pending = chunk
+    if pending is not None:
+        await send(pending, reply_markup=reply_markup, **kwargs)
+        sent += 1
+    return sent
@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import logging
+import os
+import time
+from datetime import date, timedelta
+
+import db
+
+WATERMARK = "daily"
+
+ROOM_STATS_SQL = """
+    INSERT INTO DailyRoomStats (stat_date, category, bookings, nights_sold, room_revenue)
+    SELECT CAST(g.booking_date AS DATE), r.category, COUNT(*),
+           SUM(DATEDIFF(day, g.check_in_date, g.check_out_date)),
+           SUM(DATEDIFF(day, g.check_in_date, g.check_out_date) * r.price)
+    FROM Guests g
+    JOIN Rooms r ON r.room_id = g.room_id
+    WHERE g.booking_date >= ? AND g.booking_date < ?
+    GROUP BY CAST(g.booking_date AS DATE), r.category
+"""
+
+SERVICE_STATS_SQL = """
+    INSERT INTO DailyServiceStats (stat_date, service_id, orders, quantity, revenue)
+    SELECT CAST(order_date AS DATE), service_id, COUNT(*), SUM(quantity), SUM(total_price)
+    FROM GuestServicesWithPrice
+    WHERE order_date >= ? AND order_date < ? AND status <> 'canceled'
+    GROUP BY CAST(order_date AS DATE), service_id
+"""
+
+
+def read_watermark(cursor):
+    cursor.execute("SELECT last_day FROM RollupWatermarks WHERE name = ?", (WATERMARK,))
+    row = cursor.fetchone()
+    return row.last_day if row else None
+
+
+def first_activity_day(cursor):
+    cursor.execute("SELECT MIN(booking_date) FROM Guests")
+    first_booking = cursor.fetchone()[0]
+    cursor.execute("SELECT MIN(order_date) FROM GuestServices")
+    first_order = cursor.fetchone()[0]
+    days = [value.date() if hasattr(value, "date") else date.fromisoformat(str(value)[:10])
+            for value in (first_booking, first_order) if value is not None]
+    return min(days) if days else None
+
+
+def rewind_watermark(cursor, since):
+    # Сдвинуть водяной знак назад, чтобы следующий прогон пересчитал дни начиная с since.
+    # Пишет в транзакции вызывающего: правка истории и сдвиг фиксируются вместе.
+    # Без строки водяного знака сводки ещё не строились — создаём её не позже since,
+    # чтобы пересчёт не зависел от того, осталась ли в истории более ранняя активность
+    last_day = since - timedelta(days=1)
+    watermark = read_watermark(cursor)
+    if watermark is None:
+        first = first_activity_day(cursor)
+        if first is not None:
+            last_day = min(last_day, first - timedelta(days=1))
+        cursor.execute("INSERT INTO RollupWatermarks (name, last_day) VALUES (?, ?)", (WATERMARK, last_day))
+    elif watermark > last_day:
+        cursor.execute("UPDATE RollupWatermarks SET last_day = ? WHERE name = ?", (last_day, WATERMARK))
+
+
+# Дневные сводки: задача дописывает в DailyRoomStats и DailyServiceStats закрытые дни
+# (раньше сегодняшнего) начиная с дня после водяного знака. Дни обрабатываются пачками
+# по batch_days; пачка и сдвиг водяного знака фиксируются одной транзакцией, а строки
+# пачки перед вставкой удаляются — повторный прогон той же пачки ничего не удвоит.
+# Бронь оценивается по текущей цене номера (историю цен схема не хранит); правки
+# закрытых дней попадут в сводку после rewind_watermark()/reset(). Водяной знак
+# сдвигается пачкой, только если его не отодвинули назад во время прогона — иначе
+# пачка откатывается и прогон продолжается с нового водяного знака.
+class DailyRollupJob:
+    title = "Дневные сводки"
+
+    def __init__(self, interval=3600.0, batch_days=31, pause=0.5):
+        self.interval = interval
+        self.batch_days = batch_days
+        self.pause = pause
+        self.last_run = None
+        self.last_error = None
+        self._task = None
+        self._running = False
+        self._closing = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            interval=float(os.getenv("ROLLUP_INTERVAL", "3600")),
+            batch_days=int(os.getenv("ROLLUP_BATCH_DAYS", "31")),
+        )
+
+    def _apply_batch(self, conn, start, end):
+        # False — водяной знак сдвинут reset() во время прогона, пачка не записана
+        cursor = conn.cursor()
+        params = (start, end)
+        cursor.execute("DELETE FROM DailyRoomStats WHERE stat_date >= ? AND stat_date < ?", params)
+        cursor.execute(ROOM_STATS_SQL, params)
+        cursor.execute("DELETE FROM DailyServiceStats WHERE stat_date >= ? AND stat_date < ?", params)
+        cursor.execute(SERVICE_STATS_SQL, params)
+        last_day = end - timedelta(days=1)
+        cursor.execute(
+            "UPDATE RollupWatermarks SET last_day = ? WHERE name = ? AND last_day = ?",
+            (last_day, WATERMARK, start - timedelta(days=1))
+        )
+        if cursor.rowcount == 0:
+            if read_watermark(cursor) is not None:
+                conn.rollback()
+                return False
+            cursor.execute("INSERT INTO RollupWatermarks (name, last_day) VALUES (?, ?)", (WATERMARK, last_day))
+        conn.commit()
+        return True
+
+    def run_once(self, today=None):
+        today = today or date.today()
+        conn = db.connect()
+        try:
+            cursor = conn.cursor()
+            watermark = read_watermark(cursor)
+            if watermark is None:
+                first = first_activity_day(cursor)
+                if first is None:
+                    return 0
+                watermark = first - timedelta(days=1)
+            start = watermark + timedelta(days=1)
+            days = 0
+            while start < today and not self._closing.is_set():
+                end = min(start + timedelta(days=self.batch_days), today)
+                try:
+                    applied = self._apply_batch(conn, start, end)
+                except db.DBError:
+                    conn.rollback()
+                    raise
+                if not applied:
+                    start = read_watermark(cursor) + timedelta(days=1)
+                    continue
+                days += (end - start).days
+                start = end
+                if start < today and self.pause:
+                    # Даём OLTP-нагрузке вклиниться между пачками при большом догоне
+                    time.sleep(self.pause)
+            if days:
+                logging.info(f"Дневные сводки дописаны по {today - timedelta(days=1)} ({days} дн.)")
+            return days
+        finally:
+            conn.close()
+
+    def reset(self, since):
+        # Пересчитать сводки начиная с дня since при следующем прогоне
+        conn = db.connect()
+        try:
+            rewind_watermark(conn.cursor(), since)
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def _loop(self):
+        while not self._closing.is_set():
+            started = time.perf_counter()
+            self._running = True
+            try:
+                # Запросы синхронные — выполняем их в пуле потоков, чтобы не держать event loop
+                await asyncio.to_thread(self.run_once)
+                self.last_error = None
+            except db.DBError as e:
+                self.last_error = str(e)
+                logging.error(f"Ошибка построения дневных сводок: {e}")
+            finally:
+                self._running = False
+            self.last_run = time.time()
+            if self._closing.is_set():
+                return
+            await asyncio.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def start(self):
+        self._closing.clear()
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self, timeout):
+        # Прогон, идущий в потоке, дописывает текущую пачку (у каждой своя транзакция)
+        # и останавливается; оставшиеся дни догонит следующий запуск бота
+        self._closing.set()
+        if self._task is not None and self._running:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"{self.title}: остановка по таймауту")
+        self.stop()
+
+
+# Отчёты читают только сводки: строк по дням периода, а не всю историю
+def revenue_report(conn, since):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT stat_date, SUM(bookings) AS bookings, SUM(nights_sold) AS nights, SUM(room_revenue) AS revenue
+        FROM DailyRoomStats
+        WHERE stat_date >= ?
+        GROUP BY stat_date
+    """, (since,))
+    days = {row.stat_date: [row.bookings, row.nights, row.revenue, 0, 0] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT stat_date, SUM(orders) AS orders, SUM(revenue) AS revenue
+        FROM DailyServiceStats
+        WHERE stat_date >= ?
+        GROUP BY stat_date
+    """, (since,))
+    for row in cursor.fetchall():
+        day = days.setdefault(row.stat_date, [0, 0, 0, 0, 0])
+        day[3] = row.orders
+        day[4] = row.revenue
+    cursor.execute("""
+        SELECT category, SUM(bookings) AS bookings, SUM(nights_sold) AS nights, SUM(room_revenue) AS revenue
+        FROM DailyRoomStats
+        WHERE stat_date >= ?
+        GROUP BY category
+        ORDER BY category
+    """, (since,))
+    categories = cursor.fetchall()
+    cursor.execute("""
+        SELECT s.name, SUM(d.orders) AS orders, SUM(d.quantity) AS quantity, SUM(d.revenue) AS revenue
+        FROM DailyServiceStats d
+        JOIN Services s ON s.service_id = d.service_id
+        WHERE d.stat_date >= ?
+        GROUP BY s.name
+        ORDER BY SUM(d.revenue) DESC
+    """, (since,))
+    services = cursor.fetchall()
+    return sorted(days.items(), reverse=True), categories, services, read_watermark(cursor)
@@ -0,0 +1,218 @@
+import asyncio
+import bisect
+import logging
+import re
+import time
+
+import cache
+import db
+import metrics
+from analytics import as_money
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Длиннее префиксы не хранятся: запросы сравниваются по первым MAX_PREFIX символам слова
+MAX_PREFIX = 20
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class IndexedRoom:
+    __slots__ = ("room_id", "category", "description", "price", "capacity", "quantity", "images")
+
+    def __init__(self, row):
+        self.room_id = row.room_id
+        self.category = row.category
+        self.description = row.description or ""
+        self.price = as_money(row.price)
+        self.capacity = row.capacity
+        self.quantity = row.quantity
+        self.images = []
+
+
+# Номера, отсортированные по (цена, room_id), и параллельный массив цен для bisect
+class PriceIndex:
+    __slots__ = ("rooms", "prices")
+
+    def __init__(self, rooms):
+        self.rooms = sorted(rooms, key=lambda room: (room.price, room.room_id))
+        self.prices = [room.price for room in self.rooms]
+
+    def between(self, low=None, high=None):
+        start = bisect.bisect_left(self.prices, low) if low is not None else 0
+        end = bisect.bisect_right(self.prices, high) if high is not None else len(self.prices)
+        return self.rooms[start:end]
+
+
+# Индекс каталога номеров в памяти для фильтров /rooms: общий PriceIndex и по одному
+# на категорию. Диапазон цен — два bisect, остальные условия проверяются только
+# внутри диапазона. Для текстового поиска (inline-режим) — префиксы слов категории и
+# описания -> множества room_id; одинаковые запросы отвечаются из LRU.
+# Строится одним проходом по Rooms и RoomImages, перестраивается после правок номеров
+# и фото (invalidate) или по TTL фоновой задачей refresh(): до её завершения запросы
+# отвечаются по прежнему индексу. Бронирование лишь уменьшает остаток в памяти (book),
+# распроданные номера отсеиваются при поиске. Если БД недоступна, построенный
+# индекс продолжает отвечать, а перестроение повторяется через stale_retry секунд.
+class RoomIndex:
+    def __init__(self, ttl=600.0, query_cache_size=1000, stale_retry=5.0):
+        self.ttl = ttl
+        self.stale_retry = stale_retry
+        self.loaded_at = None
+        self._all = PriceIndex([])
+        self._by_category = {}
+        self._rooms = {}
+        self._prefixes = {}
+        self._file_ids = {}
+        self._matches = cache.TTLCache("room_search", ttl=ttl, max_entries=query_cache_size)
+        self._expires_at = 0.0
+        # Растёт при каждой правке номеров и фото; входит в ключи single-flight чтений каталога
+        self.generation = 0
+        self._edits = 0
+        self._refreshing = None
+        self._hit, self._miss = metrics.cache_counters("room_index")
+
+    def invalidate(self):
+        self._expires_at = 0.0
+        self._edits += 1
+        self.generation += 1
+
+    @staticmethod
+    def build(conn):
+        # Только чтение и новые объекты: выполняется в потоке, пока loop отвечает по прежнему индексу
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("SELECT room_id, category, description, price, capacity, quantity FROM Rooms WHERE status = 'available'")
+        rooms = {row.room_id: IndexedRoom(row) for row in cursor.fetchall()}
+        cursor.execute("SELECT room_id, image_url, file_id FROM RoomImages ORDER BY room_id, image_id")
+        file_ids = {}
+        for row in cursor.fetchall():
+            if row.file_id:
+                file_ids[row.image_url] = row.file_id
+            room = rooms.get(row.room_id)
+            if room is not None:
+                room.images.append(row.image_url)
+        buckets = {}
+        prefixes = {}
+        for room in rooms.values():
+            buckets.setdefault(room.category.casefold(), []).append(room)
+            for token in set(tokenize(f"{room.category} {room.description}")):
+                for end in range(1, min(len(token), MAX_PREFIX) + 1):
+                    prefixes.setdefault(token[:end], set()).add(room.room_id)
+        by_category = {key: PriceIndex(bucket) for key, bucket in buckets.items()}
+        return rooms, PriceIndex(rooms.values()), by_category, prefixes, file_ids, started
+
+    def _install(self, built):
+        rooms, self._all, self._by_category, self._prefixes, file_ids, started = built
+        self._rooms = rooms
+        self._file_ids.update(file_ids)
+        self._matches.clear()
+        self._expires_at = time.monotonic() + self.ttl
+        self.loaded_at = time.time()
+        logging.info(f"Индекс номеров построен: {len(rooms)} за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    def load(self, conn):
+        self._install(self.build(conn))
+
+    @classmethod
+    def _read(cls):
+        conn = db.connect()
+        try:
+            return cls.build(conn)
+        finally:
+            conn.close()
+
+    def ensure_loaded(self):
+        # Синхронная загрузка — для скриптов и бенчмарков; бот строит индекс через refresh()
+        if time.monotonic() < self._expires_at:
+            return
+        try:
+            self._install(self._read())
+        except db.DBError as e:
+            if self.loaded_at is None:
+                raise
+            self._expires_at = time.monotonic() + self.stale_retry
+            logging.warning(f"Индекс номеров не перестроен, используется прежний: {e}")
+
+    async def refresh(self):
+        # Чтение — в потоке; правки номеров во время чтения в индекс могли не попасть,
+        # тогда он сразу перестраивается снова, а бронирования сверяются через stale_retry
+        edits, generation = self._edits, self.generation
+        try:
+            built = await asyncio.to_thread(self._read)
+        except db.DBError as e:
+            self._expires_at = time.monotonic() + self.stale_retry
+            if self.loaded_at is None:
+                logging.error(f"Индекс номеров не построен: {e}")
+            else:
+                logging.warning(f"Индекс номеров не перестроен, используется прежний: {e}")
+            return
+        finally:
+            self._refreshing = None
+        self._install(built)
+        if self._edits != edits:
+            self._expires_at = 0.0
+        elif self.generation != generation:
+            self._expires_at = time.monotonic() + self.stale_retry
+
+    def _current(self):
+        # Горячий путь: устаревший индекс перестраивается в фоне, обработчик не ждёт БД
+        if time.monotonic() < self._expires_at:
+            self._hit.inc()
+            return
+        self._miss.inc()
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self.refresh())
+
+    def book(self, room_id):
+        self.generation += 1
+        room = self._rooms.get(room_id)
+        if room is not None:
+            room.quantity -= 1
+
+    def get(self, room_id):
+        self._current()
+        return self._rooms.get(room_id)
+
+    def categories(self):
+        self._current()
+        return sorted({room.category for room in self._rooms.values() if room.quantity > 0})
+
+    def search(self, min_price=None, max_price=None, category=None, min_capacity=None):
+        self._current()
+        index = self._all if category is None else self._by_category.get(category.casefold())
+        if index is None:
+            return []
+        return [
+            room for room in index.between(min_price, max_price)
+            if room.quantity > 0 and (min_capacity is None or (room.capacity or 0) >= min_capacity)
+        ]
+
+    def match(self, query):
+        # Все слова запроса — префиксы слов номера (пересечение), порядок — по цене
+        self._current()
+        key = " ".join(token[:MAX_PREFIX] for token in tokenize(query))
+        room_ids = self._matches.get(key, None)
+        if room_ids is None:
+            if key:
+                sets = sorted((self._prefixes.get(token, set()) for token in key.split()), key=len)
+                found = sets[0].intersection(*sets[1:])
+                room_ids = [room.room_id for room in self._all.rooms if room.room_id in found]
+            else:
+                room_ids = [room.room_id for room in self._all.rooms]
+            self._matches.set(key, room_ids)
+        return [self._rooms[room_id] for room_id in room_ids if self._rooms[room_id].quantity > 0]
+
+    def file_id(self, image_url):
+        return self._file_ids.get(image_url)
+
+    def photo(self, image_url):
+        # Для отправки: file_id, если фото уже загружалось в Telegram, иначе URL
+        return self._file_ids.get(image_url, image_url)
+
+    def remember_file_ids(self, pairs):
+        # Возвращает новые пары (file_id, image_url) для сохранения в RoomImages
+        fresh = [(file_id, image_url) for image_url, file_id in pairs if self._file_ids.get(image_url) != file_id]
+        for file_id, image_url in fresh:
+            self._file_ids[image_url] = file_id
+        return fresh
@@ -0,0 +1,97 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import StorageKey
+
+import metrics
+
+
+# Учёт апдейтов в обработке (outer-middleware на dp.update): при остановке бот ждёт,
+# пока обработчики уже полученных апдейтов завершатся. Telegram считает апдейт
+# доставленным, как только бот запросил следующую пачку, поэтому оборванный
+# обработчик — потерянный апдейт.
+class InFlightUpdates(BaseMiddleware):
+    def __init__(self):
+        self.count = 0
+        # Выставляется при остановке: долгие обработчики (рассылка) завершаются досрочно
+        self.stopping = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+        metrics.UPDATES_IN_FLIGHT.set_function(lambda: self.count)
+
+    async def __call__(self, handler, event, data):
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self._idle.set()
+
+    async def drain(self, timeout):
+        self.stopping = True
+        if self.count == 0:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+# Снимок FSM (MemoryStorage) в JSON на время перезапуска: незаконченные сценарии
+# (бронирование, корзина, правки в админке) продолжаются после рестарта.
+# Даты и Decimal из данных состояния сохраняются с пометкой типа.
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Не сериализуется в снимок FSM: {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+    return obj
+
+
+def save_fsm(storage, path):
+    records = [
+        {"key": dataclasses.asdict(key), "state": record.state, "data": record.data}
+        for key, record in storage.storage.items()
+        if record.state is not None or record.data
+    ]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, default=_encode)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+async def load_fsm(storage, path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f, object_hook=_decode)
+    for record in records:
+        key = StorageKey(**record["key"])
+        await storage.set_state(key, record["state"])
+        await storage.set_data(key, record["data"])
+    # Снимок одноразовый: при аварийном завершении старое состояние не должно вернуться
+    os.remove(path)
+    logging.info(f"Состояния FSM восстановлены: {len(records)}")
+    return len(records)
@@ -0,0 +1,35 @@
+import asyncio
+
+import metrics
+
+
+# Схлопывание одинаковых одновременных чтений: первый вызов с ключом (ведущий) выполняется
+# как задача (синхронная функция — в потоке через asyncio.to_thread), остальные вызовы с тем же ключом, пришедшие до его
+# завершения, ждут тот же результат, а не повторяют запрос. Результат не кэшируется:
+# после завершения следующий вызов снова читает БД. Результат общий для всех
+# ожидающих — менять его нельзя. Используется только из потока event loop.
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._leader = metrics.SINGLEFLIGHT_CALLS.labels(name, "leader")
+        self._shared = metrics.SINGLEFLIGHT_CALLS.labels(name, "shared")
+        metrics.SINGLEFLIGHT_IN_FLIGHT.labels(name).set_function(self.__len__)
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, function, *args):
+        task = self._calls.get(key)
+        if task is None:
+            self._leader.inc()
+            if asyncio.iscoroutinefunction(function):
+                task = asyncio.ensure_future(function(*args))
+            else:
+                task = asyncio.ensure_future(asyncio.to_thread(function, *args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self._shared.inc()
+        # shield: отмена одного ожидающего (таймаут обработчика) не отменяет чтение для остальных
+        return await asyncio.shield(task)
@@ -0,0 +1,254 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+import db
+import metrics
+
+# Очередь по всем сотрудникам: для услуг без должности и должностей без сотрудников
+ANY_POSITION = None
+
+BACKLOG_SQL = """
+    SELECT gs.guest_id, gs.service_id, gs.order_date, gs.quantity, s.position
+    FROM GuestServices gs
+    JOIN Services s ON s.service_id = gs.service_id
+    JOIN Guests g ON g.guest_id = gs.guest_id
+    WHERE gs.status = 'pending' AND gs.employee_id IS NULL AND g.check_out_date >= GETDATE()
+    ORDER BY gs.order_date
+"""
+
+
+def order_timestamp():
+    # Время заказа задаётся в коде, а не GETDATE(): оно нужно в кнопках уведомления
+    # для поиска строки по ключу. Кратно 10 мс — точно хранится и в DATETIME SQL Server.
+    # Строки со временем из GETDATE() (шаг DATETIME 1/300 с) ищутся по
+    # order_date = CAST(? AS DATETIME): параметр округляется так же, как хранимое значение.
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 10000 * 10000)
+
+
+class StaffMember:
+    __slots__ = ("employee_id", "full_name", "position", "telegram_id", "load")
+
+    def __init__(self, row):
+        self.employee_id = row.employee_id
+        self.full_name = row.full_name
+        self.position = row.position
+        self.telegram_id = row.telegram_id
+        # Открытые (pending) заказы сотрудника
+        self.load = 0
+
+
+class Order:
+    __slots__ = ("guest_id", "service_id", "order_date", "quantity", "name", "member")
+
+    def __init__(self, guest_id, service_id, order_date, quantity, name=None, member=None):
+        self.guest_id = guest_id
+        self.service_id = service_id
+        self.order_date = order_date
+        self.quantity = quantity
+        self.name = name
+        self.member = member
+
+
+# Назначение заказов услуг наименее загруженному сотруднику нужной должности.
+# На каждую должность (и на всех сотрудников сразу) — куча (нагрузка, employee_id):
+# выбор и возврат сотрудника стоят O(log n). Записи куч не удаляются при изменении
+# нагрузки — кладётся новая, а устаревшие отбрасываются при извлечении (сверка с load).
+# Состав сотрудников и нагрузка читаются из БД при запуске и дальше раз в ttl секунд
+# или после invalidate(): обработчики продолжают работать на прежнем составе, а
+# перечитывание и раздача неназначенных заказов проживающих гостей идут фоновой
+# задачей refresh(). Уведомления уходят из фоновой задачи, не задерживая обработчики.
+# Если БД недоступна, очередь работает на прежнем составе (повтор через stale_retry
+# секунд); пока состав не прочитан ни разу, заказы остаются неназначенными и будут
+# розданы первым успешным refresh().
+class StaffQueue:
+    def __init__(self, ttl=300.0, stale_retry=5.0):
+        self.ttl = ttl
+        self.stale_retry = stale_retry
+        self.loaded_at = None
+        self.members = {}
+        self.heaps = {}
+        self._by_telegram = {}
+        self._expires_at = 0.0
+        self._outbox = asyncio.Queue()
+        self._task = None
+        self._refreshing = None
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def _push(self, member):
+        for key in (member.position, ANY_POSITION):
+            heap = self.heaps.setdefault(key, [])
+            heapq.heappush(heap, (member.load, member.employee_id))
+            if len(heap) > 4 * len(self.members) + 16:
+                # Слишком много устаревших записей — пересобираем кучу
+                heap[:] = [(m.load, m.employee_id) for m in self.members.values() if key is None or m.position == key]
+                heapq.heapify(heap)
+
+    def _read_members(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT employee_id, full_name, position, telegram_id FROM Employees")
+        members = {row.employee_id: StaffMember(row) for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT employee_id, COUNT(*) AS orders
+            FROM GuestServices
+            WHERE status = 'pending' AND employee_id IS NOT NULL
+            GROUP BY employee_id
+        """)
+        for row in cursor.fetchall():
+            member = members.get(row.employee_id)
+            if member is not None:
+                member.load = row.orders
+        return members
+
+    def _install(self, members):
+        self.members = members
+        self._by_telegram = {m.telegram_id: m for m in members.values() if m.telegram_id is not None}
+        self.heaps = {}
+        for member in members.values():
+            self._push(member)
+        self._expires_at = time.monotonic() + self.ttl
+        self.loaded_at = time.time()
+        logging.info(f"Очередь сотрудников загружена: {len(members)}")
+
+    def _read(self):
+        conn = db.connect()
+        try:
+            return self._read_members(conn), self._read_backlog(conn)
+        finally:
+            conn.close()
+
+    def _save(self, orders):
+        conn = db.connect()
+        try:
+            self._save_assignments(conn, orders)
+        finally:
+            conn.close()
+
+    async def refresh(self):
+        # Чтение и запись — в потоках, раздача по кучам — в event loop между ними.
+        # При запуске бота вызывается напрямую, дальше — из _current()
+        try:
+            members, backlog = await asyncio.to_thread(self._read)
+            self._install(members)
+            orders = self._assign_rows(backlog)
+            if orders:
+                try:
+                    await asyncio.to_thread(self._save, orders)
+                except db.DBError:
+                    self._release_all(orders)
+                    raise
+                self.notify(orders)
+                logging.info(f"Назначены неразобранные заказы: {len(orders)}")
+        except db.DBError as e:
+            self._expires_at = time.monotonic() + self.stale_retry
+            if self.loaded_at is None:
+                logging.error(f"Ошибка загрузки очереди сотрудников: {e}")
+            else:
+                logging.warning(f"Очередь сотрудников не перечитана, используется прежний состав: {e}")
+        finally:
+            self._refreshing = None
+
+    def _current(self):
+        # Горячий путь: устаревший состав обновляется в фоне, обработчик не ждёт БД
+        if time.monotonic() >= self._expires_at and self._refreshing is None:
+            self._refreshing = asyncio.create_task(self.refresh())
+
+    def pick(self, position):
+        self._current()
+        heap = self.heaps.get(position) or self.heaps.get(ANY_POSITION)
+        while heap:
+            load, employee_id = heapq.heappop(heap)
+            member = self.members.get(employee_id)
+            if member is not None and member.load == load:
+                member.load += 1
+                self._push(member)
+                metrics.STAFF_ASSIGNMENTS.labels(member.position).inc()
+                return member
+        return None
+
+    def release(self, employee_id):
+        # Заказ закрыт, отменён или не записался в БД — сотрудник поднимается в очереди
+        member = self.members.get(employee_id)
+        if member is not None and member.load > 0:
+            member.load -= 1
+            self._push(member)
+
+    def member_for(self, telegram_id):
+        self._current()
+        return self._by_telegram.get(telegram_id)
+
+    def assign(self, orders, positions):
+        # positions: service_id -> должность; проставляет order.member
+        for order in orders:
+            order.member = self.pick(positions.get(order.service_id))
+        return orders
+
+    def _read_backlog(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(BACKLOG_SQL)
+        return cursor.fetchall()
+
+    def _assign_rows(self, rows):
+        if not rows or not self.members:
+            return []
+        orders = [Order(row.guest_id, row.service_id, row.order_date, row.quantity) for row in rows]
+        return self.assign(orders, {row.service_id: row.position for row in rows})
+
+    def _save_assignments(self, conn, orders):
+        try:
+            conn.cursor().executemany(
+                "UPDATE GuestServices SET employee_id = ? "
+                "WHERE guest_id = ? AND service_id = ? AND order_date = CAST(? AS DATETIME) AND employee_id IS NULL",
+                [(o.member.employee_id, o.guest_id, o.service_id, o.order_date) for o in orders]
+            )
+            conn.commit()
+        except db.DBError:
+            conn.rollback()
+            raise
+
+    def _release_all(self, orders):
+        for order in orders:
+            if order.member is not None:
+                self.release(order.member.employee_id)
+
+    def notify(self, orders):
+        for order in orders:
+            if order.member is not None and order.member.telegram_id is not None:
+                self._outbox.put_nowait(order)
+
+    async def _loop(self, send):
+        while True:
+            order = await self._outbox.get()
+            try:
+                await send(order)
+            except Exception as e:
+                metrics.STAFF_NOTIFY_FAILED.inc()
+                logging.error(f"Не удалось уведомить сотрудника {order.member.employee_id}: {e}")
+            finally:
+                self._outbox.task_done()
+
+    def start(self, send):
+        self._task = asyncio.create_task(self._loop(send))
+
+    def stop(self):
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+            self._refreshing = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self, timeout):
+        # Дослать накопленные уведомления: заказы уже в БД, а очередь живёт только в памяти
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._outbox.join(), timeout)
+            except asyncio.TimeoutError:
+                if self._outbox.qsize():
+                    logging.warning(f"Не отправлены уведомления сотрудникам: {self._outbox.qsize()}")
+        self.stop()
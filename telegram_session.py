@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+import metrics
+
+# Методы, повтор которых не меняет результат. Отправка сообщений сюда не входит:
+# при сетевой ошибке сообщение могло уже уйти, и повтор дал бы дубль.
+# getUpdates не повторяется здесь — у polling в aiogram свой back-off.
+IDEMPOTENT_METHODS = frozenset({
+    "answerCallbackQuery",
+    "deleteMessage",
+    "deleteMessages",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageMedia",
+    "editMessageReplyMarkup",
+    "getChat",
+    "getChatMember",
+    "getFile",
+    "getMe",
+    "setMyCommands",
+    "setWebhook",
+    "deleteWebhook",
+})
+
+
+# Общий для всех отправителей «шлагбаум»: после 429 все запросы ждут retry_after,
+# а не продолжают бить в API и продлевать бан
+class FloodGate:
+    def __init__(self, jitter=0.5):
+        self.resume_at = 0.0
+        self.jitter = jitter
+
+    def close(self, retry_after):
+        self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+
+    def remaining(self):
+        return max(0.0, self.resume_at - time.monotonic())
+
+    async def wait(self):
+        delay = self.remaining()
+        if delay <= 0:
+            return
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.remaining()
+        # Разносим проснувшихся отправителей, чтобы они не ударили в API одновременно
+        await asyncio.sleep(random.uniform(0, self.jitter))
+
+
+FLOOD_GATE = FloodGate()
+metrics.TELEGRAM_FLOOD_WAIT.set_function(FLOOD_GATE.remaining)
+
+
+class _MethodMetrics:
+    __slots__ = ("calls", "latency", "client_errors", "retry_after", "server_errors", "network_errors", "retries")
+
+    def __init__(self, name):
+        self.calls = metrics.TELEGRAM_CALLS.labels(name)
+        self.latency = metrics.TELEGRAM_LATENCY.labels(name)
+        self.client_errors = metrics.TELEGRAM_ERRORS.labels(name, "4xx")
+        self.retry_after = metrics.TELEGRAM_ERRORS.labels(name, "429")
+        self.server_errors = metrics.TELEGRAM_ERRORS.labels(name, "5xx")
+        self.network_errors = metrics.TELEGRAM_ERRORS.labels(name, "network")
+        self.retries = metrics.TELEGRAM_RETRIES.labels(name)
+
+
+# Middleware сессии Bot API: латентность и ошибки по методам, повторы с back-off
+class TelegramRequestMiddleware(BaseRequestMiddleware):
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=10.0, gate=FLOOD_GATE):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.gate = gate
+        self._children = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_retries=int(os.getenv("TG_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("TG_RETRY_BASE", "0.5")),
+            backoff_max=float(os.getenv("TG_RETRY_MAX", "10")),
+        )
+
+    def backoff(self, attempt):
+        # Экспоненциальная задержка с полным джиттером
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        children = self._children.get(name)
+        if children is None:
+            children = self._children[name] = _MethodMetrics(name)
+        idempotent = name in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await self.gate.wait()
+            children.calls.inc()
+            started = time.perf_counter()
+            try:
+                result = await make_request(bot, method)
+                children.latency.observe(time.perf_counter() - started)
+                return result
+            except TelegramRetryAfter as e:
+                children.latency.observe(time.perf_counter() - started)
+                children.retry_after.inc()
+                # Запрос не был выполнен, поэтому повтор безопасен для любого метода
+                self.gate.close(e.retry_after)
+                logging.warning(f"Telegram 429 на {name}: пауза {e.retry_after} с для всех отправителей")
+                if attempt >= self.max_retries:
+                    raise
+                delay = 0
+            except (TelegramServerError, TelegramNetworkError) as e:
+                children.latency.observe(time.perf_counter() - started)
+                if isinstance(e, TelegramServerError):
+                    children.server_errors.inc()
+                else:
+                    children.network_errors.inc()
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt + 1)
+                logging.warning(f"Повтор {name} через {delay:.2f} с после ошибки: {e}")
+            except TelegramAPIError:
+                children.latency.observe(time.perf_counter() - started)
+                children.client_errors.inc()
+                raise
+            attempt += 1
+            children.retries.inc()
+            if delay:
+                await asyncio.sleep(delay)